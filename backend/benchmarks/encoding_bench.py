@@ -0,0 +1,122 @@
+"""Serialization CPU and response size for a long drink history.
+
+One user with ``--drinks`` synthetic drinks is loaded into a scratch
+``DrinkHistoryService``, and the ``/user/{id}/drinks`` body is encoded with
+each available encoder: FastAPI's default (``jsonable_encoder`` then
+``json.dumps``), orjson and msgpack. Each is timed with and without the
+``health_tip`` field, and sizes are reported raw and gzipped at the server's
+``GZIP_LEVEL``.
+
+    python -m benchmarks.encoding_bench --drinks 10000 --iterations 20
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from benchmarks.generate_data import drink_entries  # noqa: E402
+from benchmarks.report import save_report, summarize_latencies  # noqa: E402
+from services.drink_history_service import DrinkHistoryService  # noqa: E402
+from services.encoding import GZIP_LEVEL, MSGPACK_AVAILABLE, MSGPACK_MEDIA_TYPES, ORJSON_AVAILABLE, encode  # noqa: E402
+from services.nutrition_service import NutritionService  # noqa: E402
+
+USER_ID = "user-0000000"
+
+
+def fastapi_default(content) -> bytes:
+    # What JSONResponse renders after FastAPI's jsonable_encoder pass
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode()
+
+
+def encoders() -> Dict[str, Callable]:
+    available = {"fastapi_default": fastapi_default}
+    if ORJSON_AVAILABLE:
+        available["orjson"] = encode
+    if MSGPACK_AVAILABLE:
+        available["msgpack"] = lambda content: encode(content, MSGPACK_MEDIA_TYPES[0])
+    return available
+
+
+def load_history(data_dir: str, drinks: int, days: int, seed: int) -> DrinkHistoryService:
+    rng = random.Random(seed)
+    menu = list(NutritionService().nutrition_database.items())
+    entries = list(drink_entries(USER_ID, drinks, datetime.now(), days, rng, menu))
+    with open(os.path.join(data_dir, DrinkHistoryService.DRINKS_DOCUMENT), "w") as f:
+        json.dump({USER_ID: entries}, f)
+    # Keep the whole history hot, as for an active user's recent drinks
+    return DrinkHistoryService(data_dir, hot_days=days + 1)
+
+
+def measure(encoder: Callable, content, iterations: int) -> Dict:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        body = encoder(content)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    compressed = zlib.compress(body, GZIP_LEVEL)
+    gzip_s = time.perf_counter() - start
+    return {
+        "encode": summarize_latencies(latencies),
+        "bytes": len(body),
+        "gzip_bytes": len(compressed),
+        "gzip_ms": round(gzip_s * 1000, 3),
+    }
+
+
+def run(drinks: int, days: int, iterations: int, seed: int) -> List[Dict]:
+    data_dir = tempfile.mkdtemp(prefix="snapdrink-encoding-")
+    try:
+        history = load_history(data_dir, drinks, days, seed)
+        projections = {
+            "all_fields": None,
+            "without_health_tip": DrinkHistoryService.projection(exclude="health_tip"),
+        }
+        results = []
+        for projection, fields in projections.items():
+            start = time.perf_counter()
+            content = {"drinks": history.get_user_drinks(USER_ID, fields=fields)}
+            build_ms = round((time.perf_counter() - start) * 1000, 3)
+            for name, encoder in encoders().items():
+                results.append({"encoder": name, "projection": projection, "build_ms": build_ms,
+                                **measure(encoder, content, iterations)})
+        return results
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drinks", type=int, default=10000, help="drinks in the encoded history")
+    parser.add_argument("--days", type=int, default=365, help="days the drinks are spread over")
+    parser.add_argument("--iterations", type=int, default=20, help="encodes timed per encoder")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="report path (default benchmarks/results/...)")
+    args = parser.parse_args(argv)
+
+    results = run(args.drinks, args.days, args.iterations, args.seed)
+    config = {"drinks": args.drinks, "days": args.days, "iterations": args.iterations, "seed": args.seed,
+              "gzip_level": GZIP_LEVEL}
+    path = save_report("encoding", {"config": config, "results": results}, args.output)
+
+    print(f"{'encoder':<16} {'projection':<19} {'encode p50':>11} {'bytes':>10} {'gzip':>9} {'gzip ms':>8}")
+    for r in results:
+        print(f"{r['encoder']:<16} {r['projection']:<19} {r['encode']['p50_ms']:>9.2f}ms {r['bytes']:>10}"
+              f" {r['gzip_bytes']:>9} {r['gzip_ms']:>8.2f}")
+    print(f"report: {path}")
+
+
+if __name__ == "__main__":
+    main()
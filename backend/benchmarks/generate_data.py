@@ -0,0 +1,160 @@
+"""Generate synthetic users.json and drink_history.json at production scale.
+
+Per-user drink counts follow a Zipf-like distribution, so a few heavy users
+own a large share of the history while most users have only a handful of
+drinks. Timestamps are spread over the last ``--days`` days, with the newest
+days denser. Files are written incrementally, one user at a time, so
+generating 10M drinks does not need them all in memory.
+
+    python -m benchmarks.generate_data --users 100000 --drinks 10000000 --output-dir /tmp/snapdrink-10m
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.nutrition_service import NutritionService  # noqa: E402
+
+HEALTH_TIPS = [
+    "This drink is high in sugar. Consider limiting to occasional treats to maintain stable blood sugar levels.",
+    "High caffeine content. Avoid drinking late in the day to prevent sleep disruption.",
+    "Great choice! This drink provides hydration with minimal added sugars.",
+    "This drink is okay in moderation. Balance it with water and nutrient-dense foods.",
+    "Liquid calories add up quickly. Consider whether you're getting nutritional value for these calories.",
+]
+
+
+def skewed_counts(users: int, drinks: int, exponent: float, rng: random.Random) -> List[int]:
+    """Split ``drinks`` across ``users`` with Zipf weights, in shuffled order"""
+    weights = [1.0 / (rank ** exponent) for rank in range(1, users + 1)]
+    scale = drinks / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for i in range(drinks - sum(counts)):
+        counts[i % users] += 1
+    rng.shuffle(counts)
+    return counts
+
+
+def user_profile(user_id: str, now: datetime, rng: random.Random) -> dict:
+    created = (now - timedelta(days=rng.randrange(1, 730))).isoformat()
+
+    def goal(name, target, unit, goal_type):
+        current = round(rng.uniform(0, target * 1.3), 1)
+        return {"id": str(uuid.UUID(int=rng.getrandbits(128))), "name": name, "target": target, "current": current,
+                "unit": unit, "type": goal_type, "created_at": created, "is_achieved": current >= target}
+
+    return {
+        "user_id": user_id,
+        "notifications": {"daily_reminders": rng.random() < 0.7, "goal_achievements": True, "health_tips": rng.random() < 0.3,
+                          "weekly_reports": rng.random() < 0.6, "reminder_time": f"{rng.randrange(6, 11):02d}:00"},
+        "health_preferences": {"age": rng.randrange(16, 80), "weight": round(rng.uniform(45, 120), 1),
+                               "height": round(rng.uniform(150, 200), 1), "activity_level": rng.choice(
+                                   ["sedentary", "light", "moderate", "active", "very_active"]),
+                               "dietary_restrictions": None, "health_goals": None, "target_calories": None,
+                               "target_water_ml": None},
+        "privacy_settings": {"data_collection": True, "analytics_tracking": False, "personalized_ads": False,
+                             "share_with_partners": False},
+        "daily_goals": [goal("Daily Calories", 2000, "kcal", "calories"), goal("Daily Water", 2000, "ml", "water"),
+                        goal("Sugar Limit", 50, "g", "sugar")],
+        "created_at": created,
+        "updated_at": (now - timedelta(hours=rng.randrange(0, 72))).isoformat(),
+    }
+
+
+def drink_entries(user_id: str, count: int, now: datetime, days: int, rng: random.Random, menu):
+    """Chronological drink entries shaped exactly like DrinkHistoryService.add_drink output"""
+    span = days * 86400
+    # Bias towards recent activity: the square of a uniform variate clusters near zero
+    offsets = sorted((rng.random() ** 2 * span for _ in range(count)), reverse=True)
+    for seq, offset in enumerate(offsets, start=1):
+        name, nutrition = rng.choice(menu)
+        ts = now - timedelta(seconds=offset)
+        yield {
+            "id": f"{user_id}_{seq}_{int(ts.timestamp())}",
+            "name": name,
+            "calories": float(nutrition["calories"]),
+            "sugar_g": float(nutrition["sugar_g"]),
+            "caffeine_mg": float(nutrition["caffeine_mg"]),
+            "water_ml": float(nutrition["water_ml"]),
+            "sodium_mg": nutrition.get("sodium_mg"),
+            "carbs_g": nutrition.get("carbs_g"),
+            "protein_g": nutrition.get("protein_g"),
+            "health_tip": rng.choice(HEALTH_TIPS),
+            "timestamp": ts.isoformat(),
+            "date": ts.date().isoformat(),
+        }
+
+
+def generate(output_dir: str, users: int, drinks: int, days: int, exponent: float, seed: int,
+             now: Optional[datetime] = None) -> dict:
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    os.makedirs(output_dir, exist_ok=True)
+    menu = list(NutritionService().nutrition_database.items())
+    user_ids = [f"user-{i:07d}" for i in range(users)]
+    counts = skewed_counts(users, drinks, exponent, rng)
+
+    start = time.perf_counter()
+    # Same one-user-per-line layout JSONFileStorage writes, so loads can stream it
+    with open(os.path.join(output_dir, "users.json"), "w") as f:
+        f.write("{")
+        for i, user_id in enumerate(user_ids):
+            f.write((",\n" if i else "\n") + json.dumps(user_id) + ":"
+                    + json.dumps(user_profile(user_id, now, rng), separators=(",", ":")))
+        f.write("\n}\n")
+
+    with open(os.path.join(output_dir, "drink_history.json"), "w") as f:
+        f.write("{")
+        separator = "\n"
+        for user_id, count in zip(user_ids, counts):
+            if not count:
+                continue
+            f.write(separator + json.dumps(user_id) + ":[")
+            separator = ",\n"
+            f.write(",".join(json.dumps(entry, separators=(",", ":"))
+                             for entry in drink_entries(user_id, count, now, days, rng, menu)))
+            f.write("]")
+        f.write("\n}\n")
+
+    order = sorted(range(users), key=counts.__getitem__, reverse=True)
+    ranked = [counts[i] for i in order]
+    summary = {
+        "users": users,
+        "drinks": drinks,
+        "days": days,
+        "zipf_exponent": exponent,
+        "seed": seed,
+        "max_drinks_per_user": ranked[0] if ranked else 0,
+        "median_drinks_per_user": ranked[len(ranked) // 2] if ranked else 0,
+        "users_without_drinks": sum(1 for c in counts if not c),
+        "heaviest_users": [user_ids[i] for i in order[:5]],
+        "seconds": round(time.perf_counter() - start, 2),
+        "bytes": {name: os.path.getsize(os.path.join(output_dir, name)) for name in ("users.json", "drink_history.json")},
+    }
+    with open(os.path.join(output_dir, "dataset.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--drinks", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=365, help="history span")
+    parser.add_argument("--zipf", type=float, default=1.0, help="skew exponent of per-user drink counts")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output-dir", required=True)
+    args = parser.parse_args(argv)
+    summary = generate(args.output_dir, args.users, args.drinks, args.days, args.zipf, args.seed)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
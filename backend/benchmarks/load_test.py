@@ -0,0 +1,284 @@
+"""End-to-end load test for the FastAPI app.
+
+Drives a mix of /upload calls and dashboard reads through the app with the
+upstream APIs replaced by local stubs (see ``upstream_stubs``), then reports
+throughput, latency percentiles and error rates per operation. Reports are
+saved as JSON under ``benchmarks/results`` for comparison across commits.
+
+    python -m benchmarks.load_test --duration 30 --concurrency 16
+    python -m benchmarks.load_test --openrouter 900:0.6:0.05 --mix upload=1,today=4
+    python -m benchmarks.report results/a.json results/b.json
+
+By default the app runs in-process on a fresh temporary data directory. Pass
+``--base-url`` to drive an already running server instead; that server then
+has to be pointed at the stubs itself (``NUTRITIONIX_BASE_URL``,
+``OPENROUTER_BASE_URL``).
+
+``--record`` saves every upstream exchange to a cassette and ``--replay``
+serves a cassette back instead of starting the stubs, so a run can be
+repeated offline with the same upstream answers. Fallbacks are seeded from
+``--seed`` in-process.
+
+    python -m benchmarks.load_test --record /tmp/upstreams.ndjson
+    python -m benchmarks.load_test --replay /tmp/upstreams.ndjson --replay-latency recorded
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import save_report, summarize_latencies  # noqa: E402
+from benchmarks.upstream_stubs import StubConfig, StubUpstreamServer, UpstreamProfile, install_stubs  # noqa: E402
+from services.upstream_transport import LiveTransport, RecordingTransport, ReplayTransport, fallback_rng  # noqa: E402
+
+DEFAULT_MIX = "upload=1,today=3,goals=2,insights=2,weekly=1,profile=1"
+
+# Upload admission control answers these before the request is served
+REJECTED_STATUSES = (429, 503)
+
+READ_OPERATIONS = {
+    "today": "/user/{user_id}/drinks/today",
+    "goals": "/user/{user_id}/daily-goals",
+    "insights": "/user/{user_id}/health-insights",
+    "weekly": "/user/{user_id}/drinks/weekly-stats",
+    "profile": "/user/{user_id}/profile",
+    "history": "/user/{user_id}/drinks?limit=50",
+    "stats": "/user/{user_id}/stats",
+}
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name != "upload" and name not in READ_OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}; choose from upload, {', '.join(READ_OPERATIONS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def make_images(count: int, seed: int) -> List[bytes]:
+    """Photo-sized JPEGs with varied colours so decode cost is realistic"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        image = Image.new("RGB", (640, 480), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randrange(600), rng.randrange(440)
+            draw.rectangle([x, y, x + rng.randrange(20, 200), y + rng.randrange(20, 200)],
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        buf = io.BytesIO()
+        image.save(buf, "JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+class LoadGenerator:
+    def __init__(self, client: httpx.AsyncClient, mix: List[Tuple[str, float]], images: List[bytes],
+                 user_ids: List[str], seed: int):
+        self.client = client
+        self.operations = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.images = images
+        self.user_ids = user_ids
+        self.rng = random.Random(seed)
+        self.samples: List[Tuple[str, float, int, float]] = []  # (op, latency, status, finished_at)
+
+    async def _request(self, operation: str) -> int:
+        if operation == "upload":
+            image = self.rng.choice(self.images)
+            response = await self.client.post("/upload", files={"file": ("drink.jpg", image, "image/jpeg")})
+        else:
+            path = READ_OPERATIONS[operation].format(user_id=self.rng.choice(self.user_ids))
+            response = await self.client.get(path)
+        return response.status_code
+
+    async def _worker(self, deadline: float):
+        while time.perf_counter() < deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                status = await self._request(operation)
+            except httpx.HTTPError:
+                status = 0
+            end = time.perf_counter()
+            self.samples.append((operation, end - start, status, end))
+
+    async def run(self, concurrency: int, duration: float, warmup: float) -> Dict:
+        start = time.perf_counter()
+        deadline = start + warmup + duration
+        await asyncio.gather(*(self._worker(deadline) for _ in range(concurrency)))
+        measured_from = start + warmup
+        measured = [s for s in self.samples if s[3] >= measured_from]
+        elapsed = max(time.perf_counter() - measured_from, 1e-9)
+        return self._summarize(measured, elapsed)
+
+    def _summarize(self, samples, elapsed: float) -> Dict:
+        by_operation: Dict[str, List] = defaultdict(list)
+        for sample in samples:
+            by_operation[sample[0]].append(sample)
+
+        def block(group):
+            # Admission rejections return at once, so they would drag the percentiles
+            # down; latencies cover served requests and rejections are counted apart
+            served = [sample for sample in group if sample[2] not in REJECTED_STATUSES]
+            rejected = len(group) - len(served)
+            errors = sum(1 for _, _, status, _ in served if status == 0 or status >= 500)
+            summary = summarize_latencies([latency for _, latency, _, _ in served])
+            summary.update({
+                "requests": len(group),
+                "rps": round(len(group) / elapsed, 2),
+                "errors": errors,
+                "error_rate": round(errors / len(served), 4) if served else 0.0,
+                "rejected": rejected,
+                "rejection_rate": round(rejected / len(group), 4) if group else 0.0,
+            })
+            return summary
+
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "overall": block(samples),
+            "operations": {name: block(group) for name, group in sorted(by_operation.items())},
+        }
+
+
+def _seed_history(drink_history_service, user_service, user_id: str, count: int):
+    from models.response_models import NutritionData
+    from services.unit_of_work import UnitOfWork
+
+    nutrition = NutritionData(calories=140, sugar_g=39, caffeine_mg=34, water_ml=330, sodium_mg=45, carbs_g=39)
+    with UnitOfWork(user_service, drink_history_service):
+        user_service.get_or_create_user(user_id)
+        for _ in range(count):
+            drink_history_service.add_drink(user_id, "Coca Cola", nutrition, "Seeded drink")
+
+
+async def run_in_process(args, mix, images, user_ids) -> Dict:
+    data_dir = tempfile.mkdtemp(prefix="snapdrink-load-")
+    os.environ["DATA_DIR"] = data_dir
+
+    config = StubConfig(vision=args.vision, nutritionix=args.nutritionix, openrouter=args.openrouter, seed=args.seed)
+    server = None if args.replay else StubUpstreamServer(config).start()
+    try:
+        import main
+
+        services = (main.vision_service, main.nutrition_service, main.health_tip_service)
+        if server is not None:
+            notes = install_stubs(server, *services)
+            upstream = RecordingTransport(args.record) if args.record else LiveTransport()
+        else:
+            notes = [f"all upstreams: replayed from {args.replay}"]
+            upstream = ReplayTransport(args.replay, args.replay_latency)
+        for service in services:
+            service.transport = upstream
+        main.vision_service.rng = fallback_rng("vision", str(args.seed))
+        main.health_tip_service.rng = fallback_rng("health_tip", str(args.seed))
+        if not args.admission:
+            # Every in-process request comes from one client address, so the
+            # per-client upload rate would reject nearly every upload
+            controller = main.admission_controller
+            controller.buckets.rate = 0
+            controller.max_concurrent = max(controller.max_concurrent, args.concurrency)
+            controller.max_queue = max(controller.max_queue, args.concurrency)
+        if args.seed_drinks:
+            _seed_history(main.drink_history_service, main.user_service, "default", args.seed_drinks)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+                generator = LoadGenerator(client, mix, images, user_ids, args.seed)
+                results = await generator.run(args.concurrency, args.duration, args.warmup)
+        if server is not None:
+            results["upstream_requests"] = dict(server.request_counts)
+        else:
+            results["upstream_replays"] = dict(upstream.outcomes)
+        results["stubs"] = notes
+        results["data_dir"] = data_dir
+        return results
+    finally:
+        if server is not None:
+            server.stop()
+
+
+async def run_external(args, mix, images, user_ids) -> Dict:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+        generator = LoadGenerator(client, mix, images, user_ids, args.seed)
+        return await generator.run(args.concurrency, args.duration, args.warmup)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds excluded from the report")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed-loop workers")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operation mix (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=1, help="distinct users for reads ('default' when 1)")
+    parser.add_argument("--images", type=int, default=8, help="distinct upload images")
+    parser.add_argument("--seed-drinks", type=int, default=0, help="drinks to pre-load into the default user's history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--vision", type=UpstreamProfile.parse, default=StubConfig().vision,
+                        help="median_ms[:sigma[:error_rate[:status]]]")
+    parser.add_argument("--nutritionix", type=UpstreamProfile.parse, default=StubConfig().nutritionix)
+    parser.add_argument("--openrouter", type=UpstreamProfile.parse, default=StubConfig().openrouter)
+    parser.add_argument("--base-url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--admission", action="store_true",
+                        help="keep the server's upload admission limits in-process (lifted by default)")
+    upstreams = parser.add_mutually_exclusive_group()
+    upstreams.add_argument("--record", metavar="CASSETTE", help="append every upstream exchange to this cassette")
+    upstreams.add_argument("--replay", metavar="CASSETTE", help="answer upstream calls from this cassette, without stubs")
+    parser.add_argument("--replay-latency", default="recorded",
+                        help="'recorded' or a fixed delay in ms per replayed call (default recorded)")
+    parser.add_argument("--output", help="report path (default benchmarks/results/...)")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    images = make_images(args.images, args.seed)
+    user_ids = ["default"] if args.users <= 1 else [f"user-{i}" for i in range(args.users)]
+
+    runner = run_external if args.base_url else run_in_process
+    results = asyncio.run(runner(args, mix, images, user_ids))
+
+    config = {
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "users": args.users,
+        "seed_drinks": args.seed_drinks,
+        "seed": args.seed,
+        "target": args.base_url or "in-process",
+        "admission": bool(args.base_url) or args.admission,
+        "record": args.record,
+        "replay": args.replay,
+        "replay_latency": args.replay_latency if args.replay else None,
+        "upstreams": {
+            name: vars(getattr(args, name)) for name in ("vision", "nutritionix", "openrouter")
+        },
+    }
+    path = save_report("load", {"config": config, "results": results}, args.output)
+
+    overall = results["overall"]
+    print(f"{'operation':<10} {'count':>7} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'err%':>6} {'rej%':>6}")
+    for name, block in [("overall", overall)] + list(results["operations"].items()):
+        print(f"{name:<10} {block['requests']:>7} {block['rps']:>8.1f} {block.get('p50_ms', 0):>9.1f} "
+              f"{block.get('p95_ms', 0):>9.1f} {block.get('p99_ms', 0):>9.1f} {block['error_rate'] * 100:>6.2f} "
+              f"{block['rejection_rate'] * 100:>6.2f}")
+    print(f"report: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize_latencies(latencies: List[float]) -> Dict:
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict:
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_report(kind: str, report: Dict, output: Optional[str] = None) -> str:
+    """Write a benchmark report as JSON, tagged with the current commit"""
+    commit = git_commit()
+    report = {
+        "benchmark": kind,
+        "commit": commit,
+        "recorded_at": datetime.now().isoformat(),
+        "environment": environment(),
+        **report,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{kind}_{commit or 'nogit'}_{stamp}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return output
+
+
+def _flatten(prefix: str, value, out: Dict[str, float]):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, child, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+
+
+def compare_reports(baseline_path: str, candidate_path: str) -> List[str]:
+    """Side-by-side diff of every numeric field the two reports share"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    base_values: Dict[str, float] = {}
+    cand_values: Dict[str, float] = {}
+    _flatten("", baseline.get("results", {}), base_values)
+    _flatten("", candidate.get("results", {}), cand_values)
+
+    lines = [f"{'metric':<60} {baseline.get('commit') or 'baseline':>12} {candidate.get('commit') or 'candidate':>12} {'change':>9}"]
+    for key in sorted(base_values.keys() & cand_values.keys()):
+        before, after = base_values[key], cand_values[key]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        lines.append(f"{key:<60} {before:>12.3f} {after:>12.3f} {change:>9}")
+    return lines
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python -m benchmarks.report BASELINE.json CANDIDATE.json")
+        sys.exit(2)
+    print("\n".join(compare_reports(sys.argv[1], sys.argv[2])))
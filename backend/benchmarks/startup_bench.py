@@ -0,0 +1,145 @@
+"""Startup-time benchmark for the backend process.
+
+Each run starts a fresh interpreter and breaks cold start into phases:
+
+- interpreter: Python startup before any app code
+- framework_import: fastapi, pydantic and uvicorn
+- app_import: ``import main`` (services, routes, middleware); the app can
+  answer /health from here on
+- client_setup: Google Cloud Vision and OpenAI clients, including the SDK
+  imports (only when installed and configured)
+- data_load: one entry per data store; /ready answers 200 after this
+- first_request: GET /user/{id}/drinks/today once everything is loaded
+
+    python -m benchmarks.startup_bench --data-dir /tmp/snapdrink-1m --runs 5
+    python -m benchmarks.startup_bench --data-dir /tmp/snapdrink-1m --importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.report import save_report  # noqa: E402
+
+CHILD = r"""
+import json, sys, time
+marks = {"start": time.perf_counter()}
+import fastapi, pydantic, uvicorn
+marks["framework_import"] = time.perf_counter()
+import main
+marks["app_import"] = time.perf_counter()
+main.vision_service.client
+main.health_tip_service.client
+marks["client_setup"] = time.perf_counter()
+stores = {}
+for store in main.startup.stores:
+    t = time.perf_counter()
+    store.get()
+    stores[store._name] = time.perf_counter() - t
+marks["data_load"] = time.perf_counter()
+
+import asyncio, httpx
+async def first_request():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+        return (await client.get(sys.argv[1])).status_code
+status = asyncio.run(first_request())
+marks["first_request"] = time.perf_counter()
+
+phases, previous = {}, marks["start"]
+for name in ("framework_import", "app_import", "client_setup", "data_load", "first_request"):
+    phases[name] = marks[name] - previous
+    previous = marks[name]
+print(json.dumps({"phases": phases, "stores": stores, "status": status, "in_process": previous - marks["start"]}))
+"""
+
+
+def run_once(data_dir: str, path: str, importtime: bool) -> Dict:
+    env = dict(os.environ, DATA_DIR=data_dir, STARTUP_WARMUP="off")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD, path]
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise SystemExit(f"startup run failed:\n{result.stderr[-2000:]}")
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample["wall"] = wall
+    sample["phases"] = {"interpreter": max(wall - sample["in_process"], 0.0), **sample["phases"]}
+    if importtime:
+        sample["imports"] = top_imports(result.stderr)
+    return sample
+
+
+def top_imports(stderr: str, limit: int = 15) -> List[Dict]:
+    """Slowest modules from ``-X importtime`` output, by cumulative time.
+
+    Only the script's own imports and their direct imports are ranked, so the
+    list shows which of main's dependencies cost the most.
+    """
+    packages: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown as two spaces per level after one separator space
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth <= 1:
+            try:
+                packages[name.strip()] = max(packages.get(name.strip(), 0), int(cumulative))
+            except ValueError:
+                continue
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"module": name, "ms": round(us / 1000, 1)} for name, us in ranked]
+
+
+def median_ms(samples: List[Dict], key) -> float:
+    return round(statistics.median(key(s) for s in samples) * 1000, 1)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", required=True, help="data directory to start against")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--user-id", default="default", help="user for the first request")
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports (one extra run)")
+    parser.add_argument("--output", help="report path (default benchmarks/results/...)")
+    args = parser.parse_args(argv)
+
+    path = f"/user/{args.user_id}/drinks/today"
+    samples = [run_once(args.data_dir, path, False) for _ in range(args.runs)]
+    phase_names = list(samples[0]["phases"])
+    results = {
+        "phases_ms": {name: median_ms(samples, lambda s, n=name: s["phases"][n]) for name in phase_names},
+        "stores_ms": {name: median_ms(samples, lambda s, n=name: s["stores"][n]) for name in samples[0]["stores"]},
+        "time_to_live_ms": median_ms(samples, lambda s: s["phases"]["interpreter"] + s["phases"]["framework_import"]
+                                     + s["phases"]["app_import"]),
+        "time_to_ready_ms": median_ms(samples, lambda s: s["wall"] - s["phases"]["first_request"]),
+        "wall_ms": median_ms(samples, lambda s: s["wall"]),
+        "first_request_status": samples[0]["status"],
+    }
+    if args.importtime:
+        results["imports"] = run_once(args.data_dir, path, True)["imports"]
+
+    config = {"data_dir": args.data_dir, "runs": args.runs, "path": path}
+    report_path = save_report("startup", {"config": config, "results": results}, args.output)
+
+    for name, ms in results["phases_ms"].items():
+        print(f"{name:<18} {ms:>10.1f} ms")
+    for name, ms in results["stores_ms"].items():
+        print(f"  {name:<16} {ms:>10.1f} ms")
+    print(f"{'time to live':<18} {results['time_to_live_ms']:>10.1f} ms")
+    print(f"{'time to ready':<18} {results['time_to_ready_ms']:>10.1f} ms")
+    for entry in results.get("imports", []):
+        print(f"  import {entry['module']:<30} {entry['ms']:>8.1f} ms")
+    print(f"report: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
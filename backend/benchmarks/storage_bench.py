@@ -0,0 +1,187 @@
+"""Microbenchmarks for DrinkHistoryService and UserService over a large dataset.
+
+Measures startup load time and resident memory for each service, then the
+latency of the hot read and write paths for a heavy, a median and a light
+user. Writes run against a scratch copy of the dataset, so the generated
+files stay untouched.
+
+    python -m benchmarks.generate_data --users 100000 --drinks 10000000 --output-dir /tmp/snapdrink-10m
+    python -m benchmarks.storage_bench --data-dir /tmp/snapdrink-10m
+"""
+import argparse
+import gc
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import save_report, summarize_latencies  # noqa: E402
+from models.response_models import NutritionData  # noqa: E402
+from services.drink_history_service import DrinkHistoryService  # noqa: E402
+from services.storage import JSONFileStorage  # noqa: E402
+from services.user_service import UserService  # noqa: E402
+from services.user_shards import SHARDS_DIR  # noqa: E402
+
+SAMPLE_NUTRITION = NutritionData(calories=140, sugar_g=39, caffeine_mg=34, water_ml=330, sodium_mg=45, carbs_g=39)
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak RSS is the best portable approximation (KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure_load(factory: Callable):
+    gc.collect()
+    before = rss_mb()
+    start = time.perf_counter()
+    service = factory()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    return service, {"load_s": round(elapsed, 3), "rss_delta_mb": round(rss_mb() - before, 1)}
+
+
+def measure_retained(factory: Callable) -> Dict:
+    """Python heap held by a freshly loaded service, and the peak while loading.
+
+    RSS deltas overstate retained memory because the allocator rarely hands
+    freed parse buffers back to the OS; tracemalloc counts live objects only.
+    """
+    gc.collect()
+    tracemalloc.start()
+    service = factory()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del service
+    return {"retained_mb": round(current / (1024 * 1024), 1), "load_peak_mb": round(peak / (1024 * 1024), 1)}
+
+
+def time_calls(func: Callable, iterations: int) -> Dict:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return summarize_latencies(latencies)
+
+
+def user_drink_counts(history: DrinkHistoryService) -> Dict[str, int]:
+    return {user_id: len(columns) for user_id, columns in history.user_columns.items()}
+
+
+def pick_users(counts: Dict[str, int]) -> Dict[str, str]:
+    ranked = sorted((c, u) for u, c in counts.items() if c)
+    if not ranked:
+        raise SystemExit("dataset has no drink history")
+    return {"heavy": ranked[-1][1], "median": ranked[len(ranked) // 2][1], "light": ranked[0][1]}
+
+
+def run(data_dir: str, iterations: int, write_iterations: int, in_place: bool, trace_memory: bool = False) -> Dict:
+    work_dir = data_dir
+    if not in_place:
+        work_dir = tempfile.mkdtemp(prefix="snapdrink-storage-")
+        for name in (DrinkHistoryService.DRINKS_DOCUMENT, UserService.USERS_DOCUMENT):
+            if os.path.exists(os.path.join(data_dir, name)):
+                shutil.copy(os.path.join(data_dir, name), work_dir)
+        if os.path.isdir(os.path.join(data_dir, SHARDS_DIR)):
+            shutil.copytree(os.path.join(data_dir, SHARDS_DIR), os.path.join(work_dir, SHARDS_DIR))
+
+    storage = JSONFileStorage(work_dir)
+    base_rss = rss_mb()
+    history, history_load = measure_load(lambda: DrinkHistoryService(work_dir, storage=storage))
+    users, users_load = measure_load(lambda: UserService(work_dir, storage=storage))
+
+    counts = user_drink_counts(history)
+    total_drinks = sum(counts.values())
+    history_load["drinks"] = total_drinks
+    history_load["rss_bytes_per_drink"] = round(history_load["rss_delta_mb"] * 1024 * 1024 / total_drinks, 1) if total_drinks else 0
+    users_load["users"] = len(users.users_data)
+    if trace_memory:
+        history_load.update(measure_retained(lambda: DrinkHistoryService(work_dir, storage=storage)))
+        history_load["retained_bytes_per_drink"] = round(history_load["retained_mb"] * 1024 * 1024 / total_drinks, 1) if total_drinks else 0
+        users_load.update(measure_retained(lambda: UserService(work_dir, storage=storage)))
+
+    selected = pick_users(counts)
+    operations: Dict[str, Dict] = {}
+    for stratum, user_id in selected.items():
+        reads = {
+            "get_user_drinks": lambda: history.get_user_drinks(user_id),
+            "get_user_drinks_limit50": lambda: history.get_user_drinks(user_id, 50),
+            "get_daily_totals": lambda: history.get_daily_totals(user_id),
+            "get_weekly_stats": lambda: history.get_weekly_stats(user_id),
+            "get_health_insights": lambda: history.get_health_insights(user_id),
+            "get_user_stats": lambda: users.get_user_stats(user_id),
+        }
+        results = {name: time_calls(func, iterations) for name, func in reads.items()}
+
+        added: List[str] = []
+
+        def add():
+            added.append(history.add_drink(user_id, "Coca Cola", SAMPLE_NUTRITION, "Benchmark drink")["id"])
+
+        results["add_drink"] = time_calls(add, write_iterations)
+        results["delete_drink"] = time_calls(lambda: history.delete_drink(user_id, added.pop()), write_iterations)
+        results["update_goals_from_drink"] = time_calls(
+            lambda: users.update_goals_from_drink(user_id, SAMPLE_NUTRITION.dict()), write_iterations)
+
+        results["user_id"] = user_id
+        results["user_drinks"] = counts[user_id]
+        operations[stratum] = results
+
+    if not in_place:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "dataset": data_dir,
+        "base_rss_mb": round(base_rss, 1),
+        "peak_rss_mb": round(rss_mb(), 1),
+        "load": {"drink_history": history_load, "users": users_load},
+        "operations": operations,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", required=True, help="directory produced by benchmarks.generate_data")
+    parser.add_argument("--iterations", type=int, default=20, help="repetitions per read operation")
+    parser.add_argument("--write-iterations", type=int, default=3, help="repetitions per write operation")
+    parser.add_argument("--in-place", action="store_true", help="write to the dataset instead of a scratch copy")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="reload each service under tracemalloc to report retained and peak heap")
+    parser.add_argument("--output", help="report path (default benchmarks/results/...)")
+    args = parser.parse_args(argv)
+
+    results = run(args.data_dir, args.iterations, args.write_iterations, args.in_place, args.trace_memory)
+    config = {"iterations": args.iterations, "write_iterations": args.write_iterations}
+    path = save_report("storage", {"config": config, "results": results}, args.output)
+
+    for name, load in results["load"].items():
+        line = f"load {name:<14} {load['load_s']:>8.3f}s  rss +{load['rss_delta_mb']:.1f} MiB"
+        if "retained_mb" in load:
+            line += f"  retained {load['retained_mb']:.1f} MiB  peak {load['load_peak_mb']:.1f} MiB"
+        print(line)
+    print(f"{'operation':<26} {'stratum':<8} {'p50 ms':>10} {'p95 ms':>10}")
+    for stratum, ops in results["operations"].items():
+        for name, summary in ops.items():
+            if isinstance(summary, dict):
+                print(f"{name:<26} {stratum:<8} {summary['p50_ms']:>10.3f} {summary['p95_ms']:>10.3f}")
+    print(f"report: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Local stand-ins for the upstream APIs used by /upload.
+
+A single threaded HTTP server emulates:
+
+- Google Vision ``POST /v1/images:annotate``
+- Nutritionix ``POST /v2/natural/nutrients``
+- OpenRouter ``POST /api/v1/chat/completions``
+
+Each upstream has its own ``UpstreamProfile`` describing a log-normal latency
+distribution and an error rate, so load tests can model slow or flaky
+providers. ``install_stubs`` points the app's services at the server.
+"""
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import requests
+
+STUB_DRINKS = [
+    ("coca cola classic", ["beverage", "soft drink", "cola"]),
+    ("pepsi", ["beverage", "soft drink"]),
+    ("tropicana orange juice", ["juice", "orange", "beverage"]),
+    ("starbucks coffee", ["coffee", "drink"]),
+    ("lipton tea", ["tea", "drink"]),
+    ("evian natural spring water", ["water", "bottle"]),
+    ("red bull energy drink", ["energy drink", "can"]),
+    ("gatorade", ["sports drink", "beverage"]),
+]
+
+
+@dataclass
+class UpstreamProfile:
+    """Latency and failure behaviour of one emulated upstream"""
+    median_ms: float = 50.0
+    sigma: float = 0.4  # log-normal shape; 0 gives constant latency
+    error_rate: float = 0.0
+    error_status: int = 503
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median_ms / 1000
+        return rng.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+    @classmethod
+    def parse(cls, spec: str) -> "UpstreamProfile":
+        """Parse ``median_ms[:sigma[:error_rate[:status]]]``, e.g. ``120:0.5:0.02``"""
+        parts = spec.split(":")
+        profile = cls(median_ms=float(parts[0]))
+        if len(parts) > 1:
+            profile.sigma = float(parts[1])
+        if len(parts) > 2:
+            profile.error_rate = float(parts[2])
+        if len(parts) > 3:
+            profile.error_status = int(parts[3])
+        return profile
+
+
+@dataclass
+class StubConfig:
+    vision: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(median_ms=120))
+    nutritionix: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(median_ms=80))
+    openrouter: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(median_ms=600, sigma=0.5))
+    seed: Optional[int] = None
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: "StubUpstreamServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        routes = {
+            "/v1/images:annotate": ("vision", self._annotate),
+            "/v2/natural/nutrients": ("nutritionix", self._nutrients),
+            "/api/v1/chat/completions": ("openrouter", self._chat_completion),
+        }
+        path = self.path.split("?", 1)[0]
+        if path not in routes:
+            self._respond(404, {"error": "not found"})
+            return
+
+        upstream, handler = routes[path]
+        profile, rng = self.server.profile_for(upstream)
+        time.sleep(profile.sample_latency(rng))
+        self.server.record(upstream)
+        if rng.random() < profile.error_rate:
+            self._respond(profile.error_status, {"error": {"message": "stubbed upstream failure"}})
+            return
+        self._respond(200, handler(body, rng))
+
+    def _respond(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _annotate(self, body: Dict, rng: random.Random) -> Dict:
+        text, labels = rng.choice(STUB_DRINKS)
+        return {"responses": [{
+            "textAnnotations": [{"description": text}],
+            "labelAnnotations": [{"description": label, "score": round(rng.uniform(0.6, 0.99), 3)} for label in labels],
+        } for _ in body.get("requests", [{}])]}
+
+    def _nutrients(self, body: Dict, rng: random.Random) -> Dict:
+        return {"foods": [{
+            "food_name": body.get("query", "drink"),
+            "serving_weight_grams": rng.choice([240, 330, 355, 500]),
+            "nf_calories": round(rng.uniform(0, 220), 1),
+            "nf_sugars": round(rng.uniform(0, 50), 1),
+            "nf_caffeine": rng.choice([0, 0, 34, 47, 95, 160]),
+            "nf_sodium": round(rng.uniform(0, 200), 1),
+            "nf_total_carbohydrate": round(rng.uniform(0, 55), 1),
+            "nf_protein": round(rng.uniform(0, 3), 1),
+        }]}
+
+    def _chat_completion(self, body: Dict, rng: random.Random) -> Dict:
+        return {
+            "id": f"stub-{rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "Enjoy it mindfully and balance it with a glass of water."},
+            }],
+            "usage": {"prompt_tokens": 90, "completion_tokens": 14, "total_tokens": 104},
+        }
+
+
+class StubUpstreamServer(ThreadingHTTPServer):
+    """Threaded HTTP server emulating every upstream on one local port"""
+    daemon_threads = True
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _StubHandler)
+        self.config = config or StubConfig()
+        self._seed_rng = random.Random(self.config.seed)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.request_counts: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def profile_for(self, upstream: str):
+        rng = getattr(self._local, "rng", None)
+        if rng is None:
+            with self._lock:
+                rng = random.Random(self._seed_rng.getrandbits(64))
+            self._local.rng = rng
+        return getattr(self.config, upstream), rng
+
+    def record(self, upstream: str):
+        with self._lock:
+            self.request_counts[upstream] = self.request_counts.get(upstream, 0) + 1
+
+    def start(self) -> "StubUpstreamServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Annotation(SimpleNamespace):
+    pass
+
+
+class StubVisionClient:
+    """Duck-typed ``vision.ImageAnnotatorClient`` backed by the stub server.
+
+    Each detection call is a real HTTP round trip, so upstream latency and
+    errors reach ``VisionService`` the same way SDK calls would.
+    """
+
+    def __init__(self, base_url: str):
+        self.endpoint = f"{base_url}/v1/images:annotate"
+        self.session = requests.Session()
+
+    def _annotate(self, feature: str):
+        response = self.session.post(self.endpoint, json={"requests": [{"features": [{"type": feature}]}]}, timeout=30)
+        response.raise_for_status()
+        return response.json()["responses"][0]
+
+    def text_detection(self, image=None):
+        result = self._annotate("TEXT_DETECTION")
+        return _Annotation(text_annotations=[_Annotation(**a) for a in result.get("textAnnotations", [])])
+
+    def label_detection(self, image=None):
+        result = self._annotate("LABEL_DETECTION")
+        return _Annotation(label_annotations=[_Annotation(**a) for a in result.get("labelAnnotations", [])])
+
+
+class StubChatClient:
+    """Minimal stand-in for ``openai.OpenAI`` when the SDK is not installed"""
+
+    def __init__(self, base_url: str):
+        self.endpoint = f"{base_url}/api/v1/chat/completions"
+        self.session = requests.Session()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        response = self.session.post(self.endpoint, json=kwargs, timeout=60)
+        response.raise_for_status()
+        choices = response.json()["choices"]
+        return SimpleNamespace(choices=[
+            SimpleNamespace(message=SimpleNamespace(content=c["message"]["content"])) for c in choices
+        ])
+
+
+def install_stubs(server: StubUpstreamServer, vision_service, nutrition_service, health_tip_service) -> List[str]:
+    """Point the three upstream-backed services at the stub server.
+
+    Returns a note per service describing which client is in use.
+    """
+    from services import health_tip_service as health_tip_module
+    from services import vision_service as vision_module
+
+    notes = []
+    vision_service.client = StubVisionClient(server.url)
+    if vision_module.vision is None:
+        # google-cloud-vision missing: supply the one type the service builds
+        vision_module.vision = SimpleNamespace(Image=lambda content: SimpleNamespace(content=content))
+        notes.append("vision: stub client (google-cloud-vision not installed)")
+    else:
+        notes.append("vision: stub client")
+
+    nutrition_service.nutritionix_app_id = "stub"
+    nutrition_service.nutritionix_app_key = "stub"
+    nutrition_service.base_url = f"{server.url}/v2"
+    notes.append("nutritionix: requests -> stub server")
+
+    if health_tip_module.OPENAI_AVAILABLE:
+        health_tip_service.client = health_tip_module.load_openai()(base_url=f"{server.url}/api/v1", api_key="stub")
+        notes.append("openrouter: openai SDK -> stub server")
+    else:
+        health_tip_service.client = StubChatClient(server.url)
+        notes.append("openrouter: stub client (openai not installed)")
+    return notes
@@ -0,0 +1,100 @@
+"""Write cost of a single profile change as the number of users grows.
+
+For each user count, synthetic profiles are generated into a scratch
+directory and ``UserService.update_notifications`` is timed for random users
+on the sharded layout. For comparison, the same change is timed with the
+pre-sharding save, which rewrote every profile into one users.json.
+
+    python -m benchmarks.users_bench --users 1000,10000,100000 --writes 50
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_data import user_profile  # noqa: E402
+from benchmarks.report import save_report, summarize_latencies  # noqa: E402
+from models.user_models import UpdateNotificationSettings  # noqa: E402
+from services.storage import EntryDocument, JSONFileStorage  # noqa: E402
+from services.user_service import UserService  # noqa: E402
+from services.user_shards import USER_SHARD_SIZE, shard_document  # noqa: E402
+
+
+def write_profiles(data_dir: str, users: int, seed: int):
+    rng = random.Random(seed)
+    now = datetime.now()
+    with open(os.path.join(data_dir, UserService.USERS_DOCUMENT), "w") as f:
+        json.dump({f"user-{i:07d}": user_profile(f"user-{i:07d}", now, rng) for i in range(users)}, f)
+
+
+def run_size(users: int, writes: int, shard_size: int, seed: int) -> Dict:
+    data_dir = tempfile.mkdtemp(prefix="snapdrink-users-")
+    try:
+        write_profiles(data_dir, users, seed)
+        storage = JSONFileStorage(data_dir)
+        service = UserService(data_dir, storage=storage, shard_size=shard_size)
+        start = time.perf_counter()
+        service.save_all()
+        migrate_s = time.perf_counter() - start
+
+        rng = random.Random(seed)
+        user_ids = rng.sample(sorted(service.users_data), min(writes, users))
+        sharded, written = [], []
+        for i, user_id in enumerate(user_ids):
+            settings = UpdateNotificationSettings(daily_reminders=bool(i % 2))
+            start = time.perf_counter()
+            service.update_notifications(user_id, settings)
+            sharded.append(time.perf_counter() - start)
+            written.append(os.path.getsize(storage.path_for(shard_document(service.shards.shard_for(user_id)))))
+
+        # The old layout: every change rewrote all profiles
+        single_file = []
+        for _ in range(min(writes, 10)):
+            start = time.perf_counter()
+            storage.save(UserService.USERS_DOCUMENT, EntryDocument(service.users_data.items))
+            single_file.append(time.perf_counter() - start)
+
+        return {
+            "users": users,
+            "shards": len(service.shards.depths),
+            "migrate_s": round(migrate_s, 3),
+            "sharded_write": summarize_latencies(sharded),
+            "sharded_bytes_per_write": round(sum(written) / len(written)),
+            "single_file_write": summarize_latencies(single_file),
+            "single_file_bytes": os.path.getsize(storage.path_for(UserService.USERS_DOCUMENT)),
+        }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1000,10000,100000", help="comma-separated user counts")
+    parser.add_argument("--writes", type=int, default=50, help="profile changes timed per user count")
+    parser.add_argument("--shard-size", type=int, default=USER_SHARD_SIZE)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="report path (default benchmarks/results/...)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(value) for value in args.users.split(",")]
+    results = [run_size(users, args.writes, args.shard_size, args.seed) for users in sizes]
+    config = {"users": sizes, "writes": args.writes, "shard_size": args.shard_size, "seed": args.seed}
+    path = save_report("users", {"config": config, "results": results}, args.output)
+
+    print(f"{'users':>8} {'shards':>7} {'sharded p50':>12} {'p95':>8} {'bytes':>9} {'single p50':>11} {'bytes':>11}")
+    for r in results:
+        print(f"{r['users']:>8} {r['shards']:>7} {r['sharded_write']['p50_ms']:>10.2f}ms {r['sharded_write']['p95_ms']:>6.2f}ms"
+              f" {r['sharded_bytes_per_write']:>9} {r['single_file_write']['p50_ms']:>9.1f}ms {r['single_file_bytes']:>11}")
+    print(f"report: {path}")
+
+
+if __name__ == "__main__":
+    main()
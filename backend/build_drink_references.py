@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Build the reference set for the local drink classifier.
+
+Reads labeled photos laid out one directory per drink, named as the drink
+should be reported (ideally matching the nutrition database):
+
+    reference_images/
+    ├── Coca Cola/ *.jpg
+    ├── Orange Juice/ *.jpg
+    └── Water/ *.png
+
+and writes color features, labels and the confidence calibration to
+<data-dir>/drink_references.npz (or DRINK_REFERENCES).
+
+    python build_drink_references.py --images-dir reference_images
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.drink_classifier import (  # noqa: E402
+    DEFAULT_NEIGHBORS, REFERENCES_FILE, build_references, decode_image, knn_scores
+)
+from services.nutrition_service import NutritionService  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_images(images_dir: str):
+    images = {}
+    for name in sorted(os.listdir(images_dir)):
+        folder = os.path.join(images_dir, name)
+        if not os.path.isdir(folder):
+            continue
+        for entry in sorted(os.listdir(folder)):
+            if entry.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(folder, entry), 'rb') as f:
+                    images.setdefault(name, []).append(decode_image(f.read()))
+    return images
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images-dir", required=True, help="one sub-directory of photos per drink")
+    parser.add_argument("--output", default=os.getenv("DRINK_REFERENCES")
+                        or os.path.join(os.getenv("DATA_DIR", "data"), REFERENCES_FILE))
+    parser.add_argument("--neighbors", type=int, default=DEFAULT_NEIGHBORS)
+    args = parser.parse_args(argv)
+
+    images = load_images(args.images_dir)
+    if not images:
+        print(f"no labeled images found in {args.images_dir}", file=sys.stderr)
+        return 1
+    unknown = sorted(set(images) - set(NutritionService().nutrition_database))
+    if unknown:
+        print(f"warning: not in the nutrition database, Nutritionix will be asked: {', '.join(unknown)}",
+              file=sys.stderr)
+
+    references = build_references(images, args.neighbors)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    np.savez_compressed(args.output, **references)
+
+    winners, _, _ = knn_scores(references["features"], references["labels"], references["features"],
+                               args.neighbors, exclude_self=True)
+    print(json.dumps({
+        "output": args.output,
+        "drinks": {name: len(group) for name, group in images.items()},
+        "leave_one_out_accuracy": round(float((winners == references["labels"]).mean()), 3),
+        "calibration": [round(float(value), 3) for value in references["calibration"]],
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Move drink history older than the hot window into cold monthly segments.
+
+Run it against a stopped server's data directory (a running server compacts
+itself on DRINK_COMPACTION_INTERVAL_HOURS, or via POST /admin/compaction).
+
+    python compact_history.py --data-dir data
+    python compact_history.py --data-dir data --hot-days 90
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.compaction import CompactionJob  # noqa: E402
+from services.drink_history_service import DrinkHistoryService  # noqa: E402
+from services.drink_segments import DRINK_HOT_DAYS  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"))
+    parser.add_argument("--hot-days", type=int, default=DRINK_HOT_DAYS,
+                        help="keep drinks from the month this many days ago onwards hot")
+    args = parser.parse_args(argv)
+
+    service = DrinkHistoryService(args.data_dir, hot_days=args.hot_days)
+    result = asyncio.run(CompactionJob(service).run())
+    print(json.dumps(result, indent=2))
+    return 1 if "error" in result else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,66 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import uvicorn
 import os
 from dotenv import load_dotenv
 import io
-from PIL import Image
 import base64
+import hmac
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from typing import Optional
 
 from services.vision_service import VisionService
+from services.drink_classifier import DrinkClassifier, REFERENCES_FILE
 from services.nutrition_service import NutritionService
 from services.health_tip_service import HealthTipService
 from services.user_service import UserService
 from services.drink_history_service import DrinkHistoryService
+from services.storage import JSONFileStorage
+from services.unit_of_work import UnitOfWork
+from services.metrics import REGISTRY, CONTENT_TYPE_LATEST, MetricsMiddleware, track_stage
+from services.profiling import SlowRequestProfiler
+from services.reporting import ReportingService, live_sources
+from services.compaction import CompactionJob
+from services.goal_rollover import GoalRolloverJob
+from services.insight_job import InsightJob
+from services.drink_transfer import EXPORT_FORMATS, export_stream, import_stream
+from services.startup import Startup, LazyStartupMiddleware
+from services.admission import AdmissionController, AdmissionMiddleware
+from services.live_updates import LiveStreamResponse, LiveUpdates, TooManyConnections
+from services.encoding import GZIP_LEVEL, GZIP_MIN_BYTES, encoded_response
+from services.bulk_reads import BULK_FORMATS, BULK_MAX_USERS, BulkUserReader
+from services.upstream_transport import upstream_transport
 from models.response_models import DrinkAnalysisResponse
+from models.report_models import CreateReport
 from models.user_models import (
     UpdateNotificationSettings, UpdateHealthPreferences, UpdatePrivacySettings,
-    CreateDailyGoal, UpdateDailyGoal
+    CreateDailyGoal, UpdateDailyGoal, BulkUserQuery
 )
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="SnapDrink AI Backend", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Data stores and SDK clients are built lazily; warm them up off the event loop
+    startup.start_warm_up()
+    compaction = asyncio.create_task(compaction_job.run_periodically(lambda: startup.ready))
+    goal_rollover = asyncio.create_task(goal_rollover_job.run_periodically(lambda: startup.ready))
+    insights = asyncio.create_task(insight_job.run_periodically(lambda: startup.ready))
+    yield
+    compaction.cancel()
+    goal_rollover.cancel()
+    insights.cancel()
 
+app = FastAPI(title="SnapDrink AI Backend", version="1.0.0", lifespan=lifespan)
+startup = Startup()
+
+# Innermost, so compression time is part of the measured request latency
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,13 +69,43 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(LazyStartupMiddleware, startup=startup)
+# Sheds uploads before they reach the app; inside MetricsMiddleware so rejections are counted
+admission_controller = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(SlowRequestProfiler)
 
 # Initialize services
-vision_service = VisionService()
-nutrition_service = NutritionService()
-health_tip_service = HealthTipService()
-user_service = UserService()
-drink_history_service = DrinkHistoryService()
+data_dir = os.getenv("DATA_DIR", "data")
+# Live by default; UPSTREAM_MODE records or replays upstream calls for reproducible benchmarks
+upstream = upstream_transport(data_dir)
+vision_service = VisionService(DrinkClassifier(os.getenv("DRINK_REFERENCES") or os.path.join(data_dir, REFERENCES_FILE)),
+                               transport=upstream)
+nutrition_service = NutritionService(transport=upstream)
+health_tip_service = HealthTipService(transport=upstream)
+storage = JSONFileStorage(data_dir)
+user_service = startup.store("user_service", lambda: UserService(data_dir, storage=storage))
+drink_history_service = startup.store("drink_history_service", lambda: DrinkHistoryService(data_dir, storage=storage))
+startup.client("vision_client", lambda: vision_service.client)
+startup.client("health_tip_client", lambda: health_tip_service.client)
+reporting_service = ReportingService(
+    live_sources(drink_history_service, user_service), os.path.join(data_dir, "reports")
+)
+compaction_job = CompactionJob(drink_history_service)
+goal_rollover_job = GoalRolloverJob(user_service)
+insight_job = InsightJob(drink_history_service, user_service, data_dir)
+bulk_reader = BulkUserReader(user_service, drink_history_service)
+
+def live_snapshot(user_id: str):
+    """Dashboard state pushed to live streams after every change"""
+    return {
+        "totals": drink_history_service.get_daily_totals(user_id, include_drinks=False),
+        "goals": [goal.dict() for goal in user_service.get_daily_goals(user_id)],
+        "insights": drink_history_service.get_health_insights(user_id),
+    }
+
+live_updates = LiveUpdates(live_snapshot)
 
 @app.get("/")
 async def root():
@@ -59,31 +126,40 @@ async def analyze_drink(file: UploadFile = File(...)):
         
         # Read and process image
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
+        with track_stage("image_decode"):
+            # PIL is only needed here, so it is not imported at startup
+            from PIL import Image
+            image = Image.open(io.BytesIO(image_data))
+            
+            # Convert to RGB if necessary
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
         
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Step 1: Identify drink using Vision API
-        drink_name = await vision_service.identify_drink(image_data)
+        # Step 1: Identify drink, locally when confident enough, else with Vision API
+        with track_stage("vision"):
+            drink_name, confidence = await vision_service.classify_drink(image_data)
         
         # Step 2: Get nutrition information
-        nutrition_data = await nutrition_service.get_nutrition_info(drink_name)
+        with track_stage("nutrition"):
+            nutrition_data = await nutrition_service.get_nutrition_info(drink_name)
         
         # Step 3: Generate health tip
-        health_tip = await health_tip_service.generate_health_tip(drink_name, nutrition_data)
+        with track_stage("health_tip"):
+            health_tip = await health_tip_service.generate_health_tip(drink_name, nutrition_data)
         
-        # Step 4: Update daily goals and save drink history
+        # Step 4: Update daily goals and save drink history in one commit
         user_id = "default"  # In real app, get from authentication
-        user_service.update_goals_from_drink(user_id, nutrition_data.dict())
-        drink_history_service.add_drink(user_id, drink_name, nutrition_data, health_tip)
+        with track_stage("persistence"):
+            with UnitOfWork(user_service, drink_history_service):
+                user_service.update_goals_from_drink(user_id, nutrition_data.dict())
+                drink = drink_history_service.add_drink(user_id, drink_name, nutrition_data, health_tip)
+        live_updates.publish(user_id, {"type": "drink_added", "drink": drink})
         
         return DrinkAnalysisResponse(
             drink_name=drink_name,
             nutrition=nutrition_data,
             health_tip=health_tip,
-            confidence_score=0.85  # You can make this dynamic based on vision API confidence
+            confidence_score=round(confidence, 3)
         )
         
     except Exception as e:
@@ -98,17 +174,28 @@ async def health_check():
         "user_service": user_service is not None
     }}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the data stores are loaded"""
+    status = startup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for request latency, analysis stages and storage"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
 # User Profile Endpoints
 @app.get("/user/{user_id}/profile")
-async def get_user_profile(user_id: str = "default"):
+async def get_user_profile(user_id: str = "default", accept: Optional[str] = Header(None)):
     """Get complete user profile"""
     user = user_service.get_or_create_user(user_id)
-    return user.dict()
+    return encoded_response(accept, user.dict())
 
 @app.get("/user/{user_id}/stats")
-async def get_user_stats(user_id: str = "default"):
+async def get_user_stats(user_id: str = "default", accept: Optional[str] = Header(None)):
     """Get user statistics and achievements"""
-    return user_service.get_user_stats(user_id)
+    return encoded_response(accept, user_service.get_user_stats(user_id))
 
 # Notifications Endpoints
 @app.get("/user/{user_id}/notifications")
@@ -160,6 +247,7 @@ async def get_daily_goals(user_id: str = "default"):
 async def create_daily_goal(goal_data: CreateDailyGoal, user_id: str = "default"):
     """Create a new daily goal"""
     new_goal = user_service.create_daily_goal(user_id, goal_data)
+    live_updates.publish(user_id, {"type": "goal_created", "goal_id": new_goal.id})
     return {"message": "Daily goal created", "goal": new_goal.dict()}
 
 @app.put("/user/{user_id}/daily-goals/{goal_id}")
@@ -167,38 +255,117 @@ async def update_daily_goal(goal_id: str, goal_update: UpdateDailyGoal, user_id:
     """Update an existing daily goal"""
     try:
         updated_goal = user_service.update_daily_goal(user_id, goal_id, goal_update)
+        live_updates.publish(user_id, {"type": "goal_updated", "goal_id": goal_id})
         return {"message": "Daily goal updated", "goal": updated_goal.dict()}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@app.get("/user/{user_id}/daily-goals/history")
+async def get_goal_history(user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Get the final goal state of past days, 30 days back by default"""
+    end_date = end_date or date.today() - timedelta(days=1)
+    start_date = start_date or end_date - timedelta(days=29)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    return {"history": user_service.get_goal_history(user_id, start_date, end_date)}
+
+@app.get("/user/{user_id}/daily-goals/streaks")
+async def get_goal_streaks(user_id: str, days: int = 365):
+    """Get current and longest streaks of achieved days per goal"""
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    return {"streaks": user_service.get_goal_streaks(user_id, days)}
+
 @app.get("/user/{user_id}/achievements")
-async def get_achievements(user_id: str = "default"):
-    """Get user achievements"""
-    achievements = user_service.get_achievements(user_id)
+async def get_achievements(user_id: str = "default", days: int = 1):
+    """Get user achievements from the last `days` days, today only by default"""
+    achievements = user_service.get_achievements(user_id, days)
     return {"achievements": achievements}
 
 # Drink History Endpoints
+def drink_fields(fields: Optional[str], exclude: Optional[str]):
+    """Parse the fields/exclude query parameters of the drink list endpoints"""
+    try:
+        return drink_history_service.projection(fields, exclude)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/user/{user_id}/drinks")
-async def get_drink_history(user_id: str = "default", limit: int = None):
-    """Get user's drink history"""
-    drinks = drink_history_service.get_user_drinks(user_id, limit)
-    return {"drinks": drinks}
+async def get_drink_history(user_id: str = "default", limit: int = None, fields: Optional[str] = None,
+                            exclude: Optional[str] = None, accept: Optional[str] = Header(None)):
+    """Get user's drink history, optionally only some fields of each drink"""
+    drinks = drink_history_service.get_user_drinks(user_id, limit, drink_fields(fields, exclude))
+    return encoded_response(accept, {"drinks": drinks})
+
+@app.get("/user/{user_id}/drinks/export")
+async def export_drink_history(user_id: str, format: str = "ndjson"):
+    """Stream user's full drink history, oldest first, as NDJSON or CSV"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format!r}; choose from {', '.join(EXPORT_FORMATS)}")
+    return StreamingResponse(
+        export_stream(drink_history_service.iter_export(user_id), format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{user_id}-drinks.{format}"'}
+    )
+
+@app.post("/user/{user_id}/drinks/import")
+async def import_drink_history(request: Request, user_id: str, format: Optional[str] = None):
+    """Bulk import drinks from a streamed NDJSON or CSV body, one save per batch"""
+    format = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format!r}; choose from {', '.join(EXPORT_FORMATS)}")
+
+    def commit_batch(records):
+        with UnitOfWork(drink_history_service):
+            return drink_history_service.import_drinks(user_id, records)
+
+    summary = await import_stream(request.stream(), format, commit_batch)
+    if summary["imported"]:
+        live_updates.publish(user_id, {"type": "drinks_imported", "count": summary["imported"]})
+    if summary["failed"]:
+        return JSONResponse(status_code=500, content={"detail": summary["failed"], "import": summary})
+    return {"import": summary}
 
 @app.get("/user/{user_id}/drinks/today")
-async def get_today_drinks(user_id: str = "default"):
+async def get_today_drinks(user_id: str = "default", fields: Optional[str] = None,
+                           exclude: Optional[str] = None, accept: Optional[str] = Header(None)):
     """Get today's drinks"""
-    drinks = drink_history_service.get_today_drinks(user_id)
-    totals = drink_history_service.get_daily_totals(user_id)
-    return {
+    drinks = drink_history_service.get_today_drinks(user_id, drink_fields(fields, exclude))
+    # The totals carry the same list; build it once
+    totals = drink_history_service.get_daily_totals(user_id, include_drinks=False)
+    totals["drinks"] = drinks
+    return encoded_response(accept, {
         "drinks": drinks,
         "totals": totals
-    }
+    })
 
 @app.get("/user/{user_id}/drinks/weekly-stats")
-async def get_weekly_stats(user_id: str = "default"):
+async def get_weekly_stats(user_id: str = "default", accept: Optional[str] = Header(None)):
     """Get weekly drinking statistics"""
     stats = drink_history_service.get_weekly_stats(user_id)
-    return {"weekly_stats": stats}
+    return encoded_response(accept, {"weekly_stats": stats})
+
+@app.get("/user/{user_id}/drinks/timeseries")
+async def get_drink_timeseries(user_id: str = "default", field: str = "calories", interval: str = "day",
+                               start_date: Optional[date] = None, end_date: Optional[date] = None,
+                               rolling: Optional[int] = None, by_drink: bool = False):
+    """Get a per-day or per-hour series of a nutrient over a date range"""
+    try:
+        series = drink_history_service.get_timeseries(
+            user_id, field, start_date, end_date, interval, rolling, by_drink
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"timeseries": series}
+
+@app.get("/user/{user_id}/live")
+async def live_dashboard(user_id: str):
+    """Stream dashboard updates as server-sent events instead of polling"""
+    try:
+        subscription = live_updates.subscribe(user_id)
+    except TooManyConnections as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": "30"})
+    return LiveStreamResponse(live_updates, subscription)
 
 @app.get("/user/{user_id}/health-insights")
 async def get_health_insights(user_id: str = "default"):
@@ -211,9 +378,119 @@ async def delete_drink(user_id: str, drink_id: str):
     """Delete a specific drink"""
     success = drink_history_service.delete_drink(user_id, drink_id)
     if success:
+        live_updates.publish(user_id, {"type": "drink_deleted", "drink_id": drink_id})
         return {"message": "Drink deleted successfully"}
     else:
         raise HTTPException(status_code=404, detail="Drink not found")
 
+# Admin Endpoints
+def require_admin(token: Optional[str]):
+    """Check the admin token; admin endpoints stay closed until ADMIN_TOKEN is configured"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if token is None or not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/users/bulk")
+async def bulk_read_users(query: BulkUserQuery, format: Optional[str] = None,
+                          accept: Optional[str] = Header(None), x_admin_token: Optional[str] = Header(None)):
+    """Stream the requested state of many users at once, without creating missing users"""
+    require_admin(x_admin_token)
+    format = format or ("ndjson" if "ndjson" in (accept or "") else "json")
+    if format not in BULK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format!r}; choose from {', '.join(BULK_FORMATS)}")
+    if len(query.user_ids) > BULK_MAX_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_USERS} user ids per request")
+    return StreamingResponse(bulk_reader.stream(query.user_ids, query.fields, format), media_type=BULK_FORMATS[format])
+
+@app.post("/admin/reports", status_code=202)
+async def create_report(request: CreateReport, x_admin_token: Optional[str] = Header(None)):
+    """Start a fleet-wide report on a background thread"""
+    require_admin(x_admin_token)
+    try:
+        report = reporting_service.submit(request.days, request.top_drinks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"report": {key: report[key] for key in ("id", "status", "params")}}
+
+@app.post("/admin/reports/{report_id}/resume", status_code=202)
+async def resume_report(report_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Resume an interrupted report from its last checkpoint"""
+    require_admin(x_admin_token)
+    try:
+        report = reporting_service.start(report_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Report not found")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"report": {key: report[key] for key in ("id", "status", "params", "progress")}}
+
+@app.get("/admin/reports")
+async def list_reports(x_admin_token: Optional[str] = Header(None)):
+    """List fleet-wide reports"""
+    require_admin(x_admin_token)
+    return {"reports": reporting_service.list_reports()}
+
+@app.get("/admin/reports/{report_id}")
+async def get_report(report_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Get a report's progress, or its result once completed"""
+    require_admin(x_admin_token)
+    report = reporting_service.get_report(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    report.pop("state", None)
+    return {"report": report}
+
+@app.post("/admin/compaction", status_code=202)
+async def start_compaction(x_admin_token: Optional[str] = Header(None)):
+    """Move drink history older than the hot window into cold segments now"""
+    require_admin(x_admin_token)
+    try:
+        compaction_job.start()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "started"}
+
+@app.get("/admin/compaction")
+async def get_compaction(x_admin_token: Optional[str] = Header(None)):
+    """Get whether compaction is running and the result of the last run"""
+    require_admin(x_admin_token)
+    return {"running": compaction_job.running, "last_result": compaction_job.last_result}
+
+@app.post("/admin/goal-rollover", status_code=202)
+async def start_goal_rollover(x_admin_token: Optional[str] = Header(None)):
+    """Reset goal progress left over from earlier days now"""
+    require_admin(x_admin_token)
+    try:
+        goal_rollover_job.start()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "started"}
+
+@app.get("/admin/goal-rollover")
+async def get_goal_rollover(x_admin_token: Optional[str] = Header(None)):
+    """Get whether a goal rollover is running and the result of the last run"""
+    require_admin(x_admin_token)
+    return {"running": goal_rollover_job.running, "last_result": goal_rollover_job.last_result}
+
+@app.post("/admin/insights", status_code=202)
+async def start_insights(weekly_reports: Optional[bool] = None, x_admin_token: Optional[str] = Header(None)):
+    """Evaluate the insight rules for every user now, optionally writing weekly reports"""
+    require_admin(x_admin_token)
+    try:
+        insight_job.start(weekly_reports=weekly_reports)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "started"}
+
+@app.get("/admin/insights")
+async def get_insights_run(x_admin_token: Optional[str] = Header(None)):
+    """Get whether an insight run is in progress and the result of the last run"""
+    require_admin(x_admin_token)
+    return {"running": insight_job.running, "last_result": insight_job.last_result}
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
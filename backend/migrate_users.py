@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Migrate users.json to the sharded user layout.
+
+Writes every shard under <data-dir>/users/ plus the shard index in one
+journaled commit, then renames users.json to users.json.migrated. Run it with
+the server stopped; a server started on an unmigrated directory shards the
+users in memory and writes the layout on its first profile change instead.
+
+    python migrate_users.py --data-dir data
+    python migrate_users.py --data-dir data --shard-size 512
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.storage import JSONFileStorage  # noqa: E402
+from services.user_service import UserService  # noqa: E402
+from services.user_shards import SHARD_INDEX_DOCUMENT, USER_SHARD_SIZE  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"))
+    parser.add_argument("--shard-size", type=int, default=USER_SHARD_SIZE, help="users per shard before it splits")
+    args = parser.parse_args(argv)
+
+    storage = JSONFileStorage(args.data_dir)
+    if storage.load(SHARD_INDEX_DOCUMENT):
+        print(f"{args.data_dir} is already sharded", file=sys.stderr)
+        return 1
+    legacy_path = storage.path_for(UserService.USERS_DOCUMENT)
+    if not os.path.exists(legacy_path):
+        print(f"{legacy_path} not found", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    service = UserService(args.data_dir, storage=storage, shard_size=args.shard_size)
+    service.save_all()
+    os.replace(legacy_path, legacy_path + ".migrated")
+    print(json.dumps({
+        "users": len(service.users_data),
+        "shards": len(service.shards.depths),
+        "largest_shard": max((len(users) for users in service.shard_users.values()), default=0),
+        "seconds": round(time.perf_counter() - start, 2),
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
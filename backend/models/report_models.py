@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+class CreateReport(BaseModel):
+    days: int = 30  # report window, ending today
+    top_drinks: int = 10
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional
+from datetime import datetime
 
 class NutritionData(BaseModel):
     calories: float
@@ -10,6 +11,13 @@ class NutritionData(BaseModel):
     carbs_g: Optional[float] = None
     protein_g: Optional[float] = None
 
+class DrinkRecord(NutritionData):
+    """One drink in a bulk import, as produced by the history export"""
+    name: str
+    health_tip: str = ""
+    timestamp: Optional[datetime] = None
+    id: Optional[str] = None
+
 class DrinkAnalysisResponse(BaseModel):
     drink_name: str
     nutrition: NutritionData
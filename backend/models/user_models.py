@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 class ActivityLevel(str, Enum):
@@ -49,6 +49,7 @@ class DailyGoal(BaseModel):
     type: GoalType
     created_at: datetime
     is_achieved: bool = False
+    achieved_at: Optional[datetime] = None
 
 class UserProfile(BaseModel):
     user_id: str
@@ -56,6 +57,8 @@ class UserProfile(BaseModel):
     health_preferences: HealthPreferences = HealthPreferences()
     privacy_settings: PrivacySettings = PrivacySettings()
     daily_goals: List[DailyGoal] = []
+    # Day the goals' progress belongs to; older profiles fall back to updated_at
+    goals_date: Optional[date] = None
     created_at: datetime
     updated_at: datetime
 
@@ -90,4 +93,17 @@ class CreateDailyGoal(BaseModel):
 
 class UpdateDailyGoal(BaseModel):
     target: Optional[float] = None
-    current: Optional[float] = None
\ No newline at end of file
+    current: Optional[float] = None
+
+class BulkUserField(str, Enum):
+    profile = "profile"
+    notifications = "notifications"
+    health_preferences = "health_preferences"
+    privacy = "privacy"
+    daily_goals = "daily_goals"
+    today = "today"
+
+class BulkUserQuery(BaseModel):
+    user_ids: List[str]
+    # Sections returned for each user
+    fields: List[BulkUserField] = [BulkUserField.profile, BulkUserField.daily_goals, BulkUserField.today]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Run a fleet-wide report straight from the data files.
+
+Streams user profiles and drink_history.json one user at a time, plus any
+cold drink segments inside the report window, so it can run beside the server
+or on a copy of production data. Progress is checkpointed under
+<data-dir>/reports; pass --resume with a report id to continue an interrupted
+run.
+
+    python run_report.py --data-dir data --days 30
+    python run_report.py --data-dir data --resume 3f2a9c01b7d4
+"""
+import argparse
+import json
+import os
+import sys
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.drink_history_service import DrinkHistoryService  # noqa: E402
+from services.reporting import REPORT_CHUNK_USERS, ReportingService, storage_sources  # noqa: E402
+from services.storage import JSONFileStorage  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"))
+    parser.add_argument("--days", type=int, default=30, help="report window, ending today")
+    parser.add_argument("--top-drinks", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=REPORT_CHUNK_USERS, help="users per checkpoint")
+    parser.add_argument("--resume", metavar="REPORT_ID", help="continue a report from its last checkpoint")
+    args = parser.parse_args(argv)
+
+    # The server may be writing to the same directory, so its commit journal
+    # and temp files are left for it to recover
+    sources = storage_sources(JSONFileStorage(args.data_dir, recover=False),
+                              os.path.join(args.data_dir, DrinkHistoryService.SEGMENTS_DIR))
+    service = ReportingService(sources,
+                               os.path.join(args.data_dir, "reports"), args.chunk_size, recover=False)
+    if args.resume and service.get_report(args.resume) is None:
+        print(f"report {args.resume} not found", file=sys.stderr)
+        return 1
+    report_id = args.resume or service.create_report(args.days, args.top_drinks)["id"]
+    print(f"report {report_id}", file=sys.stderr)
+    report = service.run(report_id)
+    if report["status"] != "completed":
+        print(f"report {report_id} {report['status']}: {report['error']}", file=sys.stderr)
+        return 1
+    print(json.dumps(report["result"], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
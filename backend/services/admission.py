@@ -0,0 +1,247 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Tuple
+
+from services.metrics import REGISTRY, endpoint_group
+
+# Per-client token bucket for the analysis path; 0 disables rate limiting
+UPLOAD_RATE_PER_MINUTE = float(os.getenv("UPLOAD_RATE_PER_MINUTE", "10"))
+UPLOAD_BURST = int(os.getenv("UPLOAD_BURST", "5"))
+
+# Uploads analysed at once, and how many more may wait for a slot
+UPLOAD_MAX_CONCURRENT = int(os.getenv("UPLOAD_MAX_CONCURRENT", "4"))
+UPLOAD_MAX_QUEUE = int(os.getenv("UPLOAD_MAX_QUEUE", "16"))
+UPLOAD_QUEUE_TIMEOUT_S = float(os.getenv("UPLOAD_QUEUE_TIMEOUT_S", "10"))
+
+# While this many /user/ reads are in flight, uploads drop to the busy cap
+READ_BUSY_THRESHOLD = int(os.getenv("READ_BUSY_THRESHOLD", "8"))
+UPLOAD_BUSY_CONCURRENT = int(os.getenv("UPLOAD_BUSY_CONCURRENT", "1"))
+
+# Token buckets kept for this many recent clients; older idle ones are forgotten
+MAX_TRACKED_CLIENTS = 100_000
+
+ADMISSION_SHED = REGISTRY.counter(
+    "snapdrink_admission_shed_total",
+    "Uploads rejected before analysis, by reason",
+    labels=("reason",),
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "snapdrink_admission_queued",
+    "Uploads waiting for an analysis slot",
+)
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "snapdrink_admission_active",
+    "Uploads being analysed",
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "snapdrink_admission_wait_seconds",
+    "Time uploads spent queued before analysis",
+)
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBuckets:
+    """Per-key token buckets refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, key: str):
+        """Give back a token taken for a request that was shed anyway"""
+        if key in self._buckets:
+            tokens, updated = self._buckets[key]
+            self._buckets[key] = (min(float(self.burst), tokens + 1), updated)
+
+
+class AdmissionController:
+    """Admits uploads under a concurrency cap with a bounded FIFO queue.
+
+    Reads are never queued. They only lower the cap: while ``busy_threshold``
+    or more reads are in flight, queued uploads are dispatched only up to
+    ``busy_concurrent``, so a burst of uploads can't crowd dashboard reads off
+    the event loop. Everything runs on the event loop, so no locks are needed.
+    """
+
+    def __init__(self, max_concurrent: int = UPLOAD_MAX_CONCURRENT, max_queue: int = UPLOAD_MAX_QUEUE,
+                 queue_timeout: float = UPLOAD_QUEUE_TIMEOUT_S, rate_per_minute: float = UPLOAD_RATE_PER_MINUTE,
+                 burst: int = UPLOAD_BURST, busy_threshold: int = READ_BUSY_THRESHOLD,
+                 busy_concurrent: int = UPLOAD_BUSY_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.busy_threshold = busy_threshold
+        self.busy_concurrent = busy_concurrent
+        self.buckets = TokenBuckets(rate_per_minute / 60, burst)
+        self.active = 0
+        self.reads_in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of upload service time, for Retry-After estimates
+        self._service_seconds = 1.0
+
+    def limit(self) -> int:
+        if self.reads_in_flight >= self.busy_threshold:
+            return min(self.busy_concurrent, self.max_concurrent)
+        return self.max_concurrent
+
+    def _estimated_wait(self, position: int) -> float:
+        return self._service_seconds * (position + 1) / max(self.limit(), 1)
+
+    async def acquire(self, key: str):
+        wait = self.buckets.take(key)
+        if wait:
+            ADMISSION_SHED.labels("rate_limited").inc()
+            raise Rejected(429, "Too many uploads, slow down", wait)
+
+        if self.active < self.limit() and not self._waiters:
+            self._admit()
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.buckets.refund(key)
+            ADMISSION_SHED.labels("queue_full").inc()
+            raise Rejected(503, "Upload queue is full", self._estimated_wait(len(self._waiters)))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.inc()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot arrived just as we gave up; pass it on
+                self.release(record=False)
+            else:
+                waiter.cancel()
+                self._discard(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            ADMISSION_SHED.labels("queue_timeout").inc()
+            raise Rejected(503, "Timed out waiting for an upload slot", self._estimated_wait(len(self._waiters)))
+        finally:
+            ADMISSION_WAIT.observe(time.perf_counter() - start)
+
+    def _admit(self):
+        self.active += 1
+        ADMISSION_ACTIVE.set(self.active)
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+            ADMISSION_QUEUED.dec()
+        except ValueError:
+            pass
+
+    def release(self, service_seconds: Optional[float] = None, record: bool = True):
+        self.active -= 1
+        ADMISSION_ACTIVE.set(self.active)
+        if record and service_seconds is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+        self.dispatch()
+
+    def dispatch(self):
+        """Hand free slots to queued uploads, oldest first"""
+        while self._waiters and self.active < self.limit():
+            waiter = self._waiters.popleft()
+            ADMISSION_QUEUED.dec()
+            if not waiter.done():
+                self._admit()
+                waiter.set_result(None)
+
+    def read_started(self):
+        self.reads_in_flight += 1
+
+    def read_finished(self):
+        self.reads_in_flight -= 1
+        self.dispatch()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying admission control to POST /upload.
+
+    Uploads are rate limited per client address. Uploads carry no
+    authenticated user, and a client-supplied id would let a client dodge
+    its limit or drain someone else's. Rejections are answered before the
+    body is read, with a ``Retry-After`` header: 429 when the client is over
+    its rate, 503 when the queue is full or the wait timed out.
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths=("/upload",)):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if endpoint_group(scope["path"]) == "user":
+            self.controller.read_started()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.controller.read_finished()
+            return
+
+        if scope["path"] not in self.paths or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(self._key(scope))
+        except Rejected as e:
+            await self._reject(send, e)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - start)
+
+    def _key(self, scope) -> str:
+        client = scope.get("client")
+        return "addr:" + (client[0] if client else "unknown")
+
+    async def _reject(self, send, rejection: Rejected):
+        body = json.dumps({"detail": rejection.reason}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": rejection.status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejection.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
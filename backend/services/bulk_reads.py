@@ -0,0 +1,83 @@
+import os
+from typing import AsyncIterator, Dict, Iterator, List
+
+from models.user_models import BulkUserField
+from services.drink_history_service import DrinkHistoryService
+from services.encoding import encode
+from services.metrics import REGISTRY
+from services.user_service import UserService
+
+BULK_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+# User ids accepted by one bulk read
+BULK_MAX_USERS = int(os.getenv("BULK_MAX_USERS", "100000"))
+
+# Users encoded per chunk of the streamed response
+BULK_CHUNK_USERS = 500
+
+BULK_USERS = REGISTRY.counter(
+    "snapdrink_bulk_read_users_total",
+    "Users looked up by bulk reads, by whether a profile was found",
+    labels=("found",),
+)
+
+
+class BulkUserReader:
+    """Reads the profile, goal and daily-total state of many users in one pass.
+
+    Each user is looked up once in the in-memory stores and only the
+    requested sections are built. Unlike the per-user endpoints, nothing is
+    created or saved: unknown users come back with ``found: false``. Users
+    are encoded a chunk at a time, so a large id list streams without the
+    whole response held in memory.
+    """
+
+    def __init__(self, user_service: UserService, drink_history_service: DrinkHistoryService,
+                 chunk_users: int = BULK_CHUNK_USERS):
+        self.user_service = user_service
+        self.drink_history_service = drink_history_service
+        self.chunk_users = chunk_users
+
+    def read(self, user_id: str, fields: List[BulkUserField]) -> Dict:
+        user = self.user_service.find_user(user_id)
+        BULK_USERS.labels("true" if user is not None else "false").inc()
+        if user is None:
+            return {"user_id": user_id, "found": False}
+        entry: Dict = {"user_id": user_id, "found": True}
+        for field in fields:
+            if field == BulkUserField.profile:
+                entry["profile"] = user.dict()
+            elif field == BulkUserField.notifications:
+                entry["notifications"] = user.notifications.dict()
+            elif field == BulkUserField.health_preferences:
+                entry["health_preferences"] = user.health_preferences.dict()
+            elif field == BulkUserField.privacy:
+                entry["privacy"] = user.privacy_settings.dict()
+            elif field == BulkUserField.daily_goals:
+                entry["daily_goals"] = [goal.dict() for goal in user.daily_goals]
+            elif field == BulkUserField.today:
+                entry["today"] = self.drink_history_service.get_daily_totals(user_id, include_drinks=False)
+        return entry
+
+    def chunks(self, user_ids: List[str], fields: List[BulkUserField]) -> Iterator[List[Dict]]:
+        user_ids = list(dict.fromkeys(user_ids))
+        fields = list(dict.fromkeys(fields))
+        for start in range(0, len(user_ids), self.chunk_users):
+            yield [self.read(user_id, fields) for user_id in user_ids[start:start + self.chunk_users]]
+
+    async def stream(self, user_ids: List[str], fields: List[BulkUserField], format: str) -> AsyncIterator[bytes]:
+        """One NDJSON line per user, or a JSON ``{"users": [...]}`` document written a chunk at a time"""
+        separator = b""
+        if format == "json":
+            yield b'{"users":['
+        for entries in self.chunks(user_ids, fields):
+            if format == "ndjson":
+                yield b"".join(encode(entry) + b"\n" for entry in entries)
+            else:
+                yield separator + b",".join(encode(entry) for entry in entries)
+                separator = b","
+        if format == "json":
+            yield b"]}"
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime
+from typing import Callable, Dict, Optional
+
+from services.drink_history_service import DrinkHistoryService
+from services.drink_segments import cold_cutoff
+from services.metrics import track_stage
+
+# Hours between scheduled compactions; 0 disables the schedule
+DRINK_COMPACTION_INTERVAL_HOURS = float(os.getenv("DRINK_COMPACTION_INTERVAL_HOURS", "24"))
+
+# Drinks moved between two commits of the hot document and segment index
+COMPACTION_COMMIT_DRINKS = 250_000
+
+
+class CompactionJob:
+    """Moves drink history older than the hot window into cold monthly segments.
+
+    Planning and applying happen on the event loop, between requests, while
+    segment files are written on a worker thread. Moved drinks leave memory
+    right away but the hot document and segment index are only committed
+    every ``commit_drinks`` drinks; if the process dies before that, the hot
+    document still holds them and the unreferenced parts are rewritten by the
+    next run.
+    """
+
+    def __init__(self, drink_history_service: DrinkHistoryService, commit_drinks: int = COMPACTION_COMMIT_DRINKS):
+        self.drink_history_service = drink_history_service
+        self.commit_drinks = commit_drinks
+        self.last_result: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, today: Optional[date] = None) -> asyncio.Task:
+        """Start a compaction on the running event loop"""
+        if self.running:
+            raise RuntimeError("Compaction is already running")
+        self._task = asyncio.get_running_loop().create_task(self._run(today or date.today()))
+        return self._task
+
+    async def run(self, today: Optional[date] = None) -> Dict:
+        return await self.start(today)
+
+    async def _run(self, today: date) -> Dict:
+        try:
+            with track_stage("compaction.run"):
+                self.last_result = await self._compact(today)
+        except Exception as e:
+            print(f"Error compacting drink history: {e}")
+            self.last_result = {"error": str(e), "finished_at": datetime.now().isoformat()}
+        return self.last_result
+
+    async def _compact(self, today: date) -> Dict:
+        service = self.drink_history_service
+        cutoff = cold_cutoff(today, service.hot_days)
+        started = time.perf_counter()
+        result = {"cutoff": cutoff.isoformat(), "users": 0, "drinks": 0, "segments": 0, "commits": 0}
+        uncommitted = 0
+        for user_id in service.compaction_candidates(cutoff):
+            plan = service.plan_compaction(user_id, cutoff)
+            if not plan:
+                continue
+            await asyncio.to_thread(self._write_segments, user_id, plan)
+            moved = service.apply_compaction(user_id, cutoff, plan)
+            result["users"] += 1
+            result["drinks"] += moved
+            result["segments"] += len(plan)
+            uncommitted += moved
+            if uncommitted >= self.commit_drinks:
+                service.commit_compaction()
+                result["commits"] += 1
+                uncommitted = 0
+        if result["segments"]:
+            service.commit_compaction()
+            result["commits"] += 1
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        result["finished_at"] = datetime.now().isoformat()
+        return result
+
+    def _write_segments(self, user_id: str, plan: Dict):
+        for month, (part, rows) in plan.items():
+            self.drink_history_service.segments.write(user_id, month, part, rows)
+
+    async def run_periodically(self, ready: Callable[[], bool],
+                               interval_hours: float = DRINK_COMPACTION_INTERVAL_HOURS):
+        """Compact on a fixed interval once the data stores are loaded"""
+        if interval_hours <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval_hours * 3600)
+            if ready() and not self.running:
+                await self.run()
@@ -0,0 +1,182 @@
+import io
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Reference set built by build_drink_references.py; without it the local tier is off
+REFERENCES_FILE = "drink_references.npz"
+
+# Images are reduced to this size before their colors are counted
+THUMBNAIL_SIZE = 64
+
+# Share of width and height kept around the center; drink photos are framed
+# on the drink, so this drops most of the background
+CENTER_CROP = 0.6
+
+# HSV histogram bins per channel: hue carries most of a drink's identity
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 12, 4, 4
+FEATURE_SIZE = HUE_BINS * SATURATION_BINS * VALUE_BINS
+
+CALIBRATION_BINS = 10
+DEFAULT_NEIGHBORS = 5
+
+
+def color_features(image) -> np.ndarray:
+    """L1-normalized HSV histogram of a PIL image, square-rooted.
+
+    Euclidean distance between square-rooted histograms is the Hellinger
+    distance, which weighs small color regions (a label, a lid) fairly
+    against the dominant liquid color.
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    margin_x, margin_y = int(width * (1 - CENTER_CROP) / 2), int(height * (1 - CENTER_CROP) / 2)
+    image = image.crop((margin_x, margin_y, width - margin_x, height - margin_y))
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    hsv = np.asarray(image.convert("HSV"), dtype=np.uint16).reshape(-1, 3)
+    bins = ((hsv[:, 0] * HUE_BINS >> 8) * SATURATION_BINS + (hsv[:, 1] * SATURATION_BINS >> 8)) * VALUE_BINS \
+        + (hsv[:, 2] * VALUE_BINS >> 8)
+    histogram = np.bincount(bins, minlength=FEATURE_SIZE).astype(np.float32)
+    return np.sqrt(histogram / histogram.sum())
+
+
+def decode_image(image_data: bytes):
+    from PIL import Image
+    image = Image.open(io.BytesIO(image_data))
+    # JPEG can decode straight to a reduced size, which skips most of the work
+    image.draft("RGB", (THUMBNAIL_SIZE * 2, THUMBNAIL_SIZE * 2))
+    return image
+
+
+def knn_scores(features: np.ndarray, labels: np.ndarray, queries: np.ndarray, k: int,
+               exclude_self: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Winning label index, vote share and nearest distance for each query row.
+
+    Neighbors vote with weight 1 / distance, so an exact match dominates.
+    """
+    distances = np.sqrt(np.maximum(
+        (queries ** 2).sum(1)[:, None] + (features ** 2).sum(1)[None, :] - 2 * queries @ features.T, 0))
+    if exclude_self:
+        np.fill_diagonal(distances, np.inf)
+    k = min(k, features.shape[0] - (1 if exclude_self else 0))
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+    weights = 1.0 / (nearest_distances + 1e-6)
+
+    classes = int(labels.max()) + 1
+    votes = np.zeros((queries.shape[0], classes))
+    np.add.at(votes, (np.arange(queries.shape[0])[:, None], labels[nearest]), weights)
+    winners = votes.argmax(1)
+    shares = votes[np.arange(queries.shape[0]), winners] / votes.sum(1)
+    return winners, shares, nearest_distances.min(1)
+
+
+def calibrate(shares: np.ndarray, correct: np.ndarray) -> np.ndarray:
+    """Accuracy per vote-share bin, smoothed and made non-decreasing.
+
+    Each bin is shrunk towards the overall accuracy, so sparse bins can't
+    claim certainty, then adjacent bins that break monotonicity are pooled
+    (isotonic regression).
+    """
+    bins = np.minimum((shares * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    hits = np.bincount(bins, weights=correct.astype(float), minlength=CALIBRATION_BINS)
+    totals = np.bincount(bins, minlength=CALIBRATION_BINS).astype(float)
+    prior = correct.mean()
+    hits, totals = hits + 2 * prior, totals + 2
+
+    blocks: List[List[float]] = []
+    for bin_hits, bin_total in zip(hits, totals):
+        blocks.append([bin_hits, bin_total, 1])
+        while len(blocks) > 1 and blocks[-2][0] / blocks[-2][1] > blocks[-1][0] / blocks[-1][1]:
+            merged_hits, merged_total, width = blocks.pop()
+            blocks[-1] = [blocks[-1][0] + merged_hits, blocks[-1][1] + merged_total, blocks[-1][2] + width]
+    return np.asarray([block_hits / block_total for block_hits, block_total, width in blocks
+                       for _ in range(width)], dtype=np.float32)
+
+
+def build_references(images: Dict[str, Sequence], k: int = DEFAULT_NEIGHBORS) -> Dict[str, np.ndarray]:
+    """Reference arrays for DrinkClassifier from {label: [PIL images]}.
+
+    Confidence is calibrated on leave-one-out predictions over the reference
+    set itself, and the 99th percentile of nearest-neighbor distances marks
+    where an image stops looking like any known drink.
+    """
+    names = sorted(images)
+    features, labels = [], []
+    for index, name in enumerate(names):
+        for image in images[name]:
+            features.append(color_features(image))
+            labels.append(index)
+    if len(features) < 2:
+        raise ValueError("Need at least two reference images")
+    features = np.stack(features)
+    labels = np.asarray(labels, dtype=np.int32)
+
+    winners, shares, distances = knn_scores(features, labels, features, k, exclude_self=True)
+    return {
+        "features": features,
+        "labels": labels,
+        "names": np.asarray(names),
+        "calibration": calibrate(shares, winners == labels),
+        "max_distance": np.float32(np.percentile(distances, 99)),
+        "k": np.int32(k),
+    }
+
+
+class DrinkClassifier:
+    """Offline kNN drink classifier over color histograms of reference images.
+
+    Returns a label with a confidence calibrated against leave-one-out
+    accuracy on the reference set, so 0.9 means roughly nine in ten such
+    predictions were right. Images further from every reference than the
+    reference set's own spread get zero confidence.
+    """
+
+    def __init__(self, path: str = os.path.join("data", REFERENCES_FILE)):
+        self.path = path
+        self._references: Optional[Dict[str, np.ndarray]] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> Optional[Dict[str, np.ndarray]]:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        with np.load(self.path) as data:
+                            self._references = {key: data[key] for key in data.files}
+                    except FileNotFoundError:
+                        self._references = None
+                    except Exception as e:
+                        print(f"Drink references could not be loaded: {e}")
+                        self._references = None
+                    self._loaded = True
+        return self._references
+
+    def is_available(self) -> bool:
+        return self._load() is not None
+
+    def labels(self) -> List[str]:
+        references = self._load()
+        return [str(name) for name in references["names"]] if references is not None else []
+
+    def classify(self, image_data: bytes) -> Optional[Tuple[str, float]]:
+        """(drink name, calibrated confidence), or None without a reference set"""
+        references = self._load()
+        if references is None:
+            return None
+        return self.classify_features(color_features(decode_image(image_data)))
+
+    def classify_features(self, features: np.ndarray) -> Optional[Tuple[str, float]]:
+        references = self._load()
+        if references is None:
+            return None
+        winners, shares, distances = knn_scores(references["features"], references["labels"],
+                                                features[None, :], int(references["k"]))
+        name = str(references["names"][winners[0]])
+        if distances[0] > references["max_distance"]:
+            return name, 0.0
+        calibration = references["calibration"]
+        return name, float(calibration[min(int(shares[0] * len(calibration)), len(calibration) - 1)])
@@ -0,0 +1,370 @@
+import math
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Nutrient columns in the order they appear in a drink entry
+NUTRIENT_FIELDS = ("calories", "sugar_g", "caffeine_mg", "water_ml", "sodium_mg", "carbs_g", "protein_g")
+OPTIONAL_NUTRIENTS = frozenset(("sodium_mg", "carbs_g", "protein_g"))
+
+# Timestamps are naive local datetimes, stored as microseconds since this epoch
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Ids minted by add_drink: "<user_id>_<sequence>_<unix seconds>"
+_ID_SUFFIX = re.compile(r"_(\d+)_(\d+)$")
+
+
+def to_micros(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - EPOCH) // _MICROSECOND
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def day_bounds(start_date: date, end_date: date) -> Tuple[int, int]:
+    """Half-open microsecond range covering start_date through end_date"""
+    start = to_micros(datetime.combine(start_date, datetime.min.time()))
+    end = to_micros(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return start, end
+
+
+def entry_timestamp(entry: Dict) -> datetime:
+    """Timestamp of a serialized drink, falling back to midnight of its date"""
+    timestamp = entry.get('timestamp')
+    if isinstance(timestamp, datetime):
+        return timestamp
+    if timestamp:
+        return datetime.fromisoformat(timestamp)
+    return datetime.combine(date.fromisoformat(entry.get('date') or '1970-01-01'), datetime.min.time())
+
+
+def _nutrient_value(value: float) -> float:
+    # float32 storage: trim the representation noise (0.7 -> 0.699999988)
+    return round(value, 4)
+
+
+def _clean_values(values: List[float]) -> List[Optional[float]]:
+    """Trim float32 noise and map NaN to None, converting each distinct value once"""
+    # Nutrient columns repeat a handful of values, so a per-call memo beats
+    # rounding every element. NaN keys still hit because lookups match by identity.
+    cleaned = {v: (None if v != v else _nutrient_value(v)) for v in set(values)}
+    return [cleaned[v] for v in values]
+
+
+class StringTable:
+    """Interns repeated strings, such as drink names and health tips, as integer ids"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.values.append(value)
+            self._ids[value] = string_id
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.values[string_id]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class UserDrinkColumns:
+    """One user's drink history as parallel typed arrays, ordered by timestamp.
+
+    Each drink costs ~57 bytes: int64 timestamp and id time, int32 sequence,
+    name and tip ids, seven float32 nutrients (NaN for a missing optional
+    value) and a one-byte cold flag marking rows loaded from a cold segment.
+    Entry dicts are only built by ``row``, when a response needs them. Ids
+    that don't follow the ``<user>_<seq>_<ts>`` scheme are kept in a sparse
+    side list.
+    """
+
+    __slots__ = ("user_id", "names", "tips", "timestamps", "sequences", "id_times",
+                 "name_ids", "tip_ids", "nutrients", "cold", "custom_ids")
+
+    def __init__(self, user_id: str, names: StringTable, tips: StringTable):
+        self.user_id = user_id
+        self.names = names
+        self.tips = tips
+        self.timestamps = array('q')
+        self.sequences = array('i')
+        self.id_times = array('q')
+        self.name_ids = array('i')
+        self.tip_ids = array('i')
+        self.nutrients = {field: array('f') for field in NUTRIENT_FIELDS}
+        self.cold = array('b')
+        self.custom_ids: Optional[List[Optional[str]]] = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def insert(self, drink_id: str, name: str, nutrition: Dict, health_tip: str, timestamp: datetime) -> int:
+        """Insert a drink in timestamp order and return its row index"""
+        micros = to_micros(timestamp)
+        index = bisect_right(self.timestamps, micros)
+        sequence, id_time, custom_id = self._split_id(drink_id)
+
+        self.timestamps.insert(index, micros)
+        self.sequences.insert(index, sequence)
+        self.id_times.insert(index, id_time)
+        self.name_ids.insert(index, self.names.intern(name))
+        self.tip_ids.insert(index, self.tips.intern(health_tip or ""))
+        for field in NUTRIENT_FIELDS:
+            value = nutrition.get(field)
+            self.nutrients[field].insert(index, math.nan if value is None else float(value))
+        self.cold.insert(index, 0)
+
+        if custom_id is not None and self.custom_ids is None:
+            self.custom_ids = [None] * (len(self.timestamps) - 1)
+        if self.custom_ids is not None:
+            self.custom_ids.insert(index, custom_id)
+        return index
+
+    def insert_entry(self, entry: Dict) -> int:
+        """Insert a drink from its serialized dict form"""
+        return self.insert(entry.get('id', ''), entry.get('name', 'Unknown'), entry,
+                           entry.get('health_tip', ''), entry_timestamp(entry))
+
+    @classmethod
+    def from_entries(cls, user_id: str, entries: Iterable[Dict], names: StringTable,
+                     tips: StringTable, cold: bool = False) -> "UserDrinkColumns":
+        """Build columns from serialized entries in one pass per column"""
+        columns = cls(user_id, names, tips)
+        columns._extend(entries, cold)
+        return columns
+
+    def _extend(self, entries: Iterable[Dict], cold: bool):
+        """Append entries in timestamp order; callers re-sort if they may overlap existing rows"""
+        dated = sorted(((to_micros(entry_timestamp(entry)), entry) for entry in entries), key=lambda pair: pair[0])
+        split_ids = [self._split_id(entry.get('id', '')) for _, entry in dated]
+
+        self.timestamps.extend(micros for micros, _ in dated)
+        self.sequences.extend(sequence for sequence, _, _ in split_ids)
+        self.id_times.extend(id_time for _, id_time, _ in split_ids)
+        self.name_ids.extend(self.names.intern(entry.get('name', 'Unknown')) for _, entry in dated)
+        self.tip_ids.extend(self.tips.intern(entry.get('health_tip') or "") for _, entry in dated)
+        for field in NUTRIENT_FIELDS:
+            self.nutrients[field].extend(
+                math.nan if entry.get(field) is None else float(entry[field]) for _, entry in dated
+            )
+        self.cold.extend([1 if cold else 0] * len(dated))
+        if self.custom_ids is not None or any(custom_id is not None for _, _, custom_id in split_ids):
+            if self.custom_ids is None:
+                self.custom_ids = [None] * (len(self.timestamps) - len(dated))
+            self.custom_ids.extend(custom_id for _, _, custom_id in split_ids)
+
+    def merge_entries(self, entries: Iterable[Dict], cold: bool = False) -> int:
+        """Add serialized entries anywhere in the timeline and return how many were added"""
+        before = len(self)
+        self._extend(entries, cold)
+        added = len(self) - before
+        if added and before and self.timestamps[before] < self.timestamps[before - 1]:
+            order = sorted(range(len(self)), key=self.timestamps.__getitem__)
+            self._reorder(order)
+        return added
+
+    def copy_rows(self, lo: int, hi: int) -> "UserDrinkColumns":
+        """Rows [lo, hi) as independent columns, with string tables of their own"""
+        copy = UserDrinkColumns(self.user_id, StringTable(), StringTable())
+        for slot in ("timestamps", "sequences", "id_times", "cold"):
+            setattr(copy, slot, getattr(self, slot)[lo:hi])
+        names, tips = self.names.values, self.tips.values
+        copy.name_ids = array('i', [copy.names.intern(names[name_id]) for name_id in self.name_ids[lo:hi]])
+        copy.tip_ids = array('i', [copy.tips.intern(tips[tip_id]) for tip_id in self.tip_ids[lo:hi]])
+        copy.nutrients = {field: column[lo:hi] for field, column in self.nutrients.items()}
+        if self.custom_ids is not None:
+            copy.custom_ids = self.custom_ids[lo:hi]
+        return copy
+
+    def keep_rows(self, keep: Callable[[int], bool]) -> int:
+        """Drop every row whose index fails ``keep`` and return how many were dropped"""
+        order = [index for index in range(len(self)) if keep(index)]
+        dropped = len(self) - len(order)
+        if dropped:
+            self._reorder(order)
+        return dropped
+
+    def _reorder(self, order: List[int]):
+        """Rebuild every column from the given row indices"""
+        for slot in ("timestamps", "sequences", "id_times", "name_ids", "tip_ids", "cold"):
+            column = getattr(self, slot)
+            setattr(self, slot, array(column.typecode, [column[i] for i in order]))
+        for field, column in self.nutrients.items():
+            self.nutrients[field] = array(column.typecode, [column[i] for i in order])
+        if self.custom_ids is not None:
+            self.custom_ids = [self.custom_ids[i] for i in order]
+
+    def delete(self, index: int):
+        for column in (self.timestamps, self.sequences, self.id_times, self.name_ids, self.tip_ids, self.cold):
+            del column[index]
+        for column in self.nutrients.values():
+            del column[index]
+        if self.custom_ids is not None:
+            del self.custom_ids[index]
+
+    def find(self, drink_id: str) -> Optional[int]:
+        """Row index of the drink with this id, or None"""
+        sequence, id_time, custom_id = self._split_id(drink_id)
+        if custom_id is not None:
+            if self.custom_ids is None:
+                return None
+            try:
+                return self.custom_ids.index(custom_id)
+            except ValueError:
+                return None
+
+        # Sequence numbers repeat after deletions, so confirm with the id time
+        start = 0
+        while True:
+            try:
+                index = self.sequences.index(sequence, start)
+            except ValueError:
+                return None
+            if self.id_times[index] == id_time and (self.custom_ids is None or self.custom_ids[index] is None):
+                return index
+            start = index + 1
+
+    def id_key(self, drink_id: str) -> Tuple:
+        """Hashable identity of a drink id, matching the entries of ``id_keys``"""
+        sequence, id_time, custom_id = self._split_id(drink_id)
+        return (custom_id,) if custom_id is not None else (sequence, id_time)
+
+    def id_keys(self) -> set:
+        """Identities of every stored drink, for checking many ids at once"""
+        keys = set(zip(self.sequences, self.id_times))
+        if self.custom_ids is not None:
+            keys = {(custom_id,) if custom_id is not None else key
+                    for key, custom_id in zip(zip(self.sequences, self.id_times), self.custom_ids)}
+        return keys
+
+    def drink_id(self, index: int) -> str:
+        if self.custom_ids is not None and self.custom_ids[index] is not None:
+            return self.custom_ids[index]
+        return f"{self.user_id}_{self.sequences[index]}_{self.id_times[index]}"
+
+    def row(self, index: int) -> Dict:
+        """Build the dict view of one drink, in the historical key order"""
+        entry = {"id": self.drink_id(index), "name": self.names[self.name_ids[index]]}
+        for field in NUTRIENT_FIELDS:
+            value = self.nutrients[field][index]
+            entry[field] = None if value != value else _nutrient_value(value)
+        timestamp = from_micros(self.timestamps[index])
+        entry["health_tip"] = self.tips[self.tip_ids[index]]
+        entry["timestamp"] = timestamp.isoformat()
+        entry["date"] = timestamp.date().isoformat()
+        return entry
+
+    def _field_values(self, field: str, lo: int, hi: int) -> List:
+        """One field of rows [lo, hi) as a list"""
+        if field in self.nutrients:
+            return _clean_values(self.nutrients[field][lo:hi].tolist())
+        if field == "name":
+            names = self.names.values
+            return [names[name_id] for name_id in self.name_ids[lo:hi]]
+        if field == "health_tip":
+            tips = self.tips.values
+            return [tips[tip_id] for tip_id in self.tip_ids[lo:hi]]
+        if field == "id":
+            return [self.drink_id(index) for index in range(lo, hi)]
+        timestamps = [(EPOCH + timedelta(microseconds=micros)).isoformat() for micros in self.timestamps[lo:hi]]
+        return [timestamp[:10] for timestamp in timestamps] if field == "date" else timestamps
+
+    def rows_between(self, lo: int, hi: int, newest_first: bool = False,
+                     fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+        """Dict views of rows [lo, hi), built column-wise for speed.
+
+        ``fields`` limits each dict to those keys, in that order; only the
+        columns asked for are read.
+        """
+        if hi <= lo:
+            return []
+        if fields is not None:
+            rows = [dict(zip(fields, values)) for values in zip(*(self._field_values(field, lo, hi) for field in fields))]
+            if newest_first:
+                rows.reverse()
+            return rows
+        names, tips, user_id = self.names.values, self.tips.values, self.user_id
+        custom = self.custom_ids[lo:hi] if self.custom_ids is not None else [None] * (hi - lo)
+        nutrient_columns = [_clean_values(self.nutrients[field][lo:hi].tolist()) for field in NUTRIENT_FIELDS]
+        rows = []
+        for custom_id, sequence, id_time, name_id, tip_id, micros, calories, sugar, caffeine, water, sodium, carbs, protein in zip(
+                custom, self.sequences[lo:hi], self.id_times[lo:hi], self.name_ids[lo:hi], self.tip_ids[lo:hi],
+                self.timestamps[lo:hi], *nutrient_columns):
+            timestamp = (EPOCH + timedelta(microseconds=micros)).isoformat()
+            rows.append({
+                "id": custom_id if custom_id is not None else f"{user_id}_{sequence}_{id_time}",
+                "name": names[name_id],
+                "calories": calories,
+                "sugar_g": sugar,
+                "caffeine_mg": caffeine,
+                "water_ml": water,
+                "sodium_mg": sodium,
+                "carbs_g": carbs,
+                "protein_g": protein,
+                "health_tip": tips[tip_id],
+                "timestamp": timestamp,
+                "date": timestamp[:10],
+            })
+        if newest_first:
+            rows.reverse()
+        return rows
+
+    def range_for(self, start_micros: int, end_micros: int) -> Tuple[int, int]:
+        """Row slice [lo, hi) with start <= timestamp < end"""
+        return bisect_left(self.timestamps, start_micros), bisect_left(self.timestamps, end_micros)
+
+    def total(self, field: str, lo: int, hi: int) -> float:
+        """Sum of a nutrient column over rows [lo, hi), ignoring missing values"""
+        column = self.nutrients[field]
+        if field in OPTIONAL_NUTRIENTS:
+            return _nutrient_value(sum(v for v in column[lo:hi] if v == v))
+        return _nutrient_value(sum(column[lo:hi]))
+
+    def name_counts(self, lo: int, hi: int) -> Dict[str, int]:
+        """Drinks per name over rows [lo, hi), in first-seen order"""
+        return {self.names[name_id]: count for name_id, count in Counter(self.name_ids[lo:hi]).items()}
+
+    def chunk_after(self, after_micros: Optional[int], limit: int) -> Tuple[int, int]:
+        """Row slice of up to ``limit`` rows timestamped after ``after_micros``.
+
+        The slice is widened rather than split inside a run of equal timestamps,
+        so a cursor on the last timestamp resumes exactly where it stopped even
+        if rows were inserted or deleted in between.
+        """
+        lo = 0 if after_micros is None else bisect_right(self.timestamps, after_micros)
+        if lo >= len(self.timestamps):
+            return lo, lo
+        hi = min(lo + limit, len(self.timestamps))
+        return lo, bisect_right(self.timestamps, self.timestamps[hi - 1])
+
+    def iter_rows(self, chunk_size: int = 10000, hot_only: bool = False) -> Iterator[Dict]:
+        for lo in range(0, len(self), chunk_size):
+            hi = min(lo + chunk_size, len(self))
+            rows = self.rows_between(lo, hi)
+            if hot_only and any(self.cold[lo:hi]):
+                rows = [row for row, cold in zip(rows, self.cold[lo:hi]) if not cold]
+            yield from rows
+
+    def hot_count(self) -> int:
+        return len(self) - sum(self.cold)
+
+    def _split_id(self, drink_id: str) -> Tuple[int, int, Optional[str]]:
+        prefix = f"{self.user_id}_"
+        if drink_id.startswith(prefix):
+            match = _ID_SUFFIX.fullmatch(drink_id, len(prefix) - 1)
+            if match and int(match.group(1)) < 2 ** 31:
+                return int(match.group(1)), int(match.group(2)), None
+        return 0, 0, drink_id
+
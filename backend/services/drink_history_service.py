@@ -1,168 +1,499 @@
-import json
 import os
+from bisect import bisect_left
+from collections import OrderedDict
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Optional
-from models.response_models import NutritionData
+from typing import Iterator, List, Dict, Optional, Tuple
+import numpy as np
+from models.response_models import NutritionData, DrinkRecord
+from services.storage import StorageBackend, JSONFileStorage, EntryDocument
+from services.metrics import timed
+from services.drink_columns import (
+    NUTRIENT_FIELDS, StringTable, UserDrinkColumns, day_bounds, from_micros, to_micros
+)
+from services.drink_segments import DRINK_HOT_DAYS, SegmentIndex, SegmentStore, month_bounds, month_key
+from services.drink_timeseries import bucket_series
+from services.insight_rules import AGGREGATES, INSIGHT_FIELDS, RuleSet, load_rules
+
+# Cold drinks kept in memory after a range query loaded them, across all users
+DRINK_COLD_CACHE = int(os.getenv("DRINK_COLD_CACHE", "1000000"))
+
+# Users whose health insights stay cached until their drinks change or the day ends
+INSIGHT_CACHE_USERS = int(os.getenv("INSIGHT_CACHE_USERS", "100000"))
+
+# Covers every representable timestamp when a whole history is needed
+ALL_TIME = (-2 ** 62, 2 ** 62)
 
 class DrinkHistoryService:
-    def __init__(self, data_dir: str = "data"):
+    DRINKS_DOCUMENT = "drink_history.json"
+    SEGMENTS_DOCUMENT = "drink_segments.json"
+    SEGMENTS_DIR = "drink_segments"
+    EXPORT_FIELDS = ("id", "name") + NUTRIENT_FIELDS + ("health_tip", "timestamp", "date")
+
+    def __init__(self, data_dir: str = "data", storage: Optional[StorageBackend] = None,
+                 hot_days: int = DRINK_HOT_DAYS, cold_cache: int = DRINK_COLD_CACHE,
+                 insight_rules: Optional[RuleSet] = None):
         self.data_dir = data_dir
-        os.makedirs(data_dir, exist_ok=True)
-        self.drinks_file = os.path.join(data_dir, "drink_history.json")
+        self.storage = storage or JSONFileStorage(data_dir)
+        self.drinks_file = os.path.join(data_dir, self.DRINKS_DOCUMENT)
+        self.segments = SegmentStore(os.path.join(data_dir, self.SEGMENTS_DIR))
+        self.hot_days = hot_days
+        self.cold_cache = cold_cache
+        self.insight_rules = insight_rules or load_rules()
+        self._unit_of_work = None
         self._load_data()
 
     def _load_data(self):
-        """Load drink history from file"""
-        try:
-            with open(self.drinks_file, 'r') as f:
-                self.drinks_data = json.load(f)
-        except FileNotFoundError:
-            self.drinks_data = {}
+        """Load drink history from storage into per-user column stores"""
+        self.drink_names = StringTable()
+        self.health_tips = StringTable()
+        self.user_columns: Dict[str, UserDrinkColumns] = {}
+        for user_id, entries in self.storage.iter_entries(self.DRINKS_DOCUMENT):
+            self.user_columns[user_id] = UserDrinkColumns.from_entries(
+                user_id, entries, self.drink_names, self.health_tips
+            )
+        self.segment_index = SegmentIndex(self.storage.load(self.SEGMENTS_DOCUMENT))
+        self._index_dirty = False
+        # Cold months merged into each user's columns, and cold rows per user in LRU order
+        self._loaded_months: Dict[str, set] = {}
+        self._cold_users: "OrderedDict[str, int]" = OrderedDict()
+        self._cold_rows = 0
+        # Bumped on every change to a user's drinks; cached insights carry the version they saw
+        self._versions: Dict[str, int] = {}
+        self._insight_cache: "OrderedDict[str, Tuple[Tuple[int, date], List[str]]]" = OrderedDict()
 
+    def _iter_document(self):
+        """Serialize one user at a time, so saving never holds every entry dict"""
+        for user_id, columns in self.user_columns.items():
+            # Cold rows loaded for a query already live in their segments
+            rows = list(columns.iter_rows(hot_only=True))
+            if rows:
+                yield user_id, rows
+
+    @timed("drinks.save_data")
     def _save_data(self):
-        """Save drink history to file"""
-        with open(self.drinks_file, 'w') as f:
-            json.dump(self.drinks_data, f, indent=2, default=str)
+        """Save drink history, deferring to the open unit of work if any"""
+        documents = {self.DRINKS_DOCUMENT: EntryDocument(self._iter_document)}
+        if self._index_dirty:
+            documents[self.SEGMENTS_DOCUMENT] = EntryDocument(self.segment_index.users.copy().items)
+        if self._unit_of_work is not None:
+            for name, document in documents.items():
+                self._unit_of_work.stage(name, document)
+            self._index_dirty = False
+            return
+        self.storage.save_many(documents)
+        self._index_dirty = False
+
+    def _changed(self, user_id: str):
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        self._insight_cache.pop(user_id, None)
+
+    def _columns(self, user_id: str) -> Optional[UserDrinkColumns]:
+        return self.user_columns.get(user_id)
+
+    def _user_columns(self, user_id: str) -> UserDrinkColumns:
+        columns = self.user_columns.get(user_id)
+        if columns is None:
+            columns = UserDrinkColumns(user_id, self.drink_names, self.health_tips)
+            self.user_columns[user_id] = columns
+        return columns
+
+    def _ensure_range(self, user_id: str, start_micros: int, end_micros: int) -> Optional[UserDrinkColumns]:
+        """Merge the user's cold months overlapping [start, end) into memory and return the columns"""
+        loaded = self._loaded_months.get(user_id, ())
+        for month in self.segment_index.overlapping(user_id, start_micros, end_micros):
+            if month not in loaded:
+                self._load_month(user_id, month)
+                loaded = self._loaded_months[user_id]
+        if user_id in self._cold_users:
+            self._cold_users.move_to_end(user_id)
+        return self._columns(user_id)
+
+    def _ensure_latest(self, user_id: str, limit: int) -> Optional[UserDrinkColumns]:
+        """Load cold months newest first until the newest ``limit`` drinks are all in memory"""
+        for month in self.segment_index.overlapping(user_id, *ALL_TIME):
+            columns = self._columns(user_id)
+            month_end = month_bounds(month)[1]
+            if columns is not None and len(columns) - bisect_left(columns.timestamps, month_end) >= limit:
+                break
+            self._ensure_range(user_id, *month_bounds(month))
+        return self._columns(user_id)
+
+    @timed("drinks.load_segment")
+    def _load_month(self, user_id: str, month: str):
+        parts = self.segment_index.months(user_id)[month]
+        deleted = set(self.segment_index.deleted(user_id))
+        entries = [entry for entry in self.segments.read(user_id, month, parts) if entry.get('id') not in deleted]
+        added = self._user_columns(user_id).merge_entries(entries, cold=True)
+        self._loaded_months.setdefault(user_id, set()).add(month)
+        self._cold_users[user_id] = self._cold_users.pop(user_id, 0) + added
+        self._cold_rows += added
+        self._evict_cold(keep=user_id)
+
+    def _evict_cold(self, keep: str):
+        """Drop other users' cold rows, least recently queried first, until the cache fits"""
+        while self._cold_rows > self.cold_cache:
+            user_id = next((user for user in self._cold_users if user != keep), None)
+            if user_id is None:
+                return
+            self._drop_cold(user_id)
+
+    def _drop_cold(self, user_id: str):
+        columns = self._columns(user_id)
+        if columns is not None:
+            columns.keep_rows(lambda index: not columns.cold[index])
+        self._loaded_months.pop(user_id, None)
+        self._cold_rows -= self._cold_users.pop(user_id, 0)
 
+    @timed("drinks.add_drink")
     def add_drink(self, user_id: str, drink_name: str, nutrition: NutritionData, health_tip: str) -> Dict:
         """Add a drink to user's history"""
-        if user_id not in self.drinks_data:
-            self.drinks_data[user_id] = []
-
-        drink_entry = {
-            "id": f"{user_id}_{len(self.drinks_data[user_id]) + 1}_{int(datetime.now().timestamp())}",
-            "name": drink_name,
-            "calories": nutrition.calories,
-            "sugar_g": nutrition.sugar_g,
-            "caffeine_mg": nutrition.caffeine_mg,
-            "water_ml": nutrition.water_ml,
-            "sodium_mg": nutrition.sodium_mg,
-            "carbs_g": nutrition.carbs_g,
-            "protein_g": nutrition.protein_g,
-            "health_tip": health_tip,
-            "timestamp": datetime.now().isoformat(),
-            "date": date.today().isoformat()
-        }
+        columns = self._user_columns(user_id)
 
-        self.drinks_data[user_id].append(drink_entry)
+        now = datetime.now()
+        drink_id = f"{user_id}_{len(columns) + 1}_{int(now.timestamp())}"
+        index = columns.insert(drink_id, drink_name, nutrition.dict(), health_tip, now)
+        self._changed(user_id)
         self._save_data()
-        return drink_entry
+        return columns.row(index)
+
+    @timed("drinks.import_drinks")
+    def import_drinks(self, user_id: str, records: List[DrinkRecord]) -> Dict:
+        """Add a batch of drinks to user's history with a single save"""
+        # Own ids may duplicate drinks in cold months, so those months are checked too
+        times = [to_micros(record.timestamp) for record in records
+                 if record.timestamp and record.id and record.id.startswith(f"{user_id}_")]
+        if times:
+            self._ensure_range(user_id, min(times), max(times) + 1)
+        columns = self._user_columns(user_id)
+
+        imported = duplicates = 0
+        existing = None
+        for record in records:
+            # Ids from this user's own export are kept, so re-importing it is a no-op
+            own_id = record.id if record.id and record.id.startswith(f"{user_id}_") else None
+            if own_id:
+                if existing is None:
+                    existing = columns.id_keys()
+                key = columns.id_key(own_id)
+                if key in existing:
+                    duplicates += 1
+                    continue
+                existing.add(key)
+            timestamp = record.timestamp or datetime.now()
+            drink_id = own_id or f"{user_id}_{len(columns) + 1}_{int(timestamp.timestamp())}"
+            columns.insert(drink_id, record.name, record.dict(), record.health_tip, timestamp)
+            imported += 1
+
+        if imported:
+            self._changed(user_id)
+            self._save_data()
+        return {"imported": imported, "duplicates": duplicates}
+
+    def iter_export(self, user_id: str, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """Yield user's drinks oldest first, in chunks, resuming by timestamp between chunks"""
+        self._ensure_range(user_id, *ALL_TIME)
+        after = None
+        while True:
+            columns = self._columns(user_id)
+            if columns is None:
+                return
+            lo, hi = columns.chunk_after(after, chunk_size)
+            if hi <= lo:
+                return
+            after = columns.timestamps[hi - 1]
+            yield columns.rows_between(lo, hi)
+
+    @classmethod
+    def projection(cls, fields: Optional[str] = None, exclude: Optional[str] = None) -> Optional[Tuple[str, ...]]:
+        """Drink fields to return from comma-separated ``fields`` and ``exclude`` lists; None for all"""
+        if not fields and not exclude:
+            return None
+        selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(cls.EXPORT_FIELDS)
+        excluded = {field.strip() for field in exclude.split(",") if field.strip()} if exclude else set()
+        unknown = [field for field in [*selected, *excluded] if field not in cls.EXPORT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown drink field {unknown[0]!r}; choose from {', '.join(cls.EXPORT_FIELDS)}")
+        projected = tuple(dict.fromkeys(field for field in selected if field not in excluded))
+        if not projected:
+            raise ValueError("No drink fields left to return")
+        return projected
 
-    def get_user_drinks(self, user_id: str, limit: Optional[int] = None) -> List[Dict]:
+    @timed("drinks.get_user_drinks")
+    def get_user_drinks(self, user_id: str, limit: Optional[int] = None,
+                        fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
         """Get all drinks for a user"""
-        user_drinks = self.drinks_data.get(user_id, [])
-        # Sort by timestamp (newest first)
-        user_drinks.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        if limit:
-            return user_drinks[:limit]
-        return user_drinks
-
-    def get_today_drinks(self, user_id: str) -> List[Dict]:
+        columns = self._ensure_latest(user_id, limit) if limit else self._ensure_range(user_id, *ALL_TIME)
+        if columns is None:
+            return []
+        # Rows are kept in timestamp order, so the newest are at the end
+        count = len(columns)
+        start = max(count - limit, 0) if limit else 0
+        return columns.rows_between(start, count, newest_first=True, fields=fields)
+
+    @timed("drinks.get_today_drinks")
+    def get_today_drinks(self, user_id: str, fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
         """Get today's drinks for a user"""
-        today = date.today().isoformat()
-        user_drinks = self.drinks_data.get(user_id, [])
-        return [drink for drink in user_drinks if drink.get('date') == today]
+        today = date.today()
+        return self.get_drinks_by_date_range(user_id, today, today, fields)
 
-    def get_drinks_by_date_range(self, user_id: str, start_date: date, end_date: date) -> List[Dict]:
+    @timed("drinks.get_drinks_by_date_range")
+    def get_drinks_by_date_range(self, user_id: str, start_date: date, end_date: date,
+                                 fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
         """Get drinks within a date range"""
-        user_drinks = self.drinks_data.get(user_id, [])
-        filtered_drinks = []
-        
-        for drink in user_drinks:
-            drink_date = date.fromisoformat(drink.get('date', '1970-01-01'))
-            if start_date <= drink_date <= end_date:
-                filtered_drinks.append(drink)
-        
-        return filtered_drinks
+        bounds = day_bounds(start_date, end_date)
+        columns = self._ensure_range(user_id, *bounds)
+        if columns is None:
+            return []
+        lo, hi = columns.range_for(*bounds)
+        return columns.rows_between(lo, hi, fields=fields)
+
+    def _range_totals(self, user_id: str, start_date: date, end_date: date) -> Dict:
+        """Nutrient totals and drink counts over a date range, without building rows"""
+        bounds = day_bounds(start_date, end_date)
+        columns = self._ensure_range(user_id, *bounds)
+        if columns is None:
+            return {"count": 0, "calories": 0, "sugar_g": 0, "caffeine_mg": 0, "water_ml": 0, "names": {}}
+        lo, hi = columns.range_for(*bounds)
+        return {
+            "count": hi - lo,
+            "calories": columns.total("calories", lo, hi),
+            "sugar_g": columns.total("sugar_g", lo, hi),
+            "caffeine_mg": columns.total("caffeine_mg", lo, hi),
+            "water_ml": columns.total("water_ml", lo, hi),
+            "names": columns.name_counts(lo, hi),
+        }
 
+    @timed("drinks.get_weekly_stats")
     def get_weekly_stats(self, user_id: str) -> Dict:
         """Get weekly drinking statistics"""
         end_date = date.today()
         start_date = end_date - timedelta(days=7)
-        week_drinks = self.get_drinks_by_date_range(user_id, start_date, end_date)
-        
-        total_calories = sum(drink.get('calories', 0) for drink in week_drinks)
-        total_sugar = sum(drink.get('sugar_g', 0) for drink in week_drinks)
-        total_caffeine = sum(drink.get('caffeine_mg', 0) for drink in week_drinks)
-        total_water = sum(drink.get('water_ml', 0) for drink in week_drinks)
-        
+        totals = self._range_totals(user_id, start_date, end_date)
+
         # Group by drink type
-        drink_types = {}
-        for drink in week_drinks:
-            name = drink.get('name', 'Unknown')
-            if name not in drink_types:
-                drink_types[name] = 0
-            drink_types[name] += 1
-        
+        drink_types = totals["names"]
+
         # Get most consumed drink
         most_consumed = max(drink_types.items(), key=lambda x: x[1]) if drink_types else ('None', 0)
-        
+
         return {
-            "total_drinks": len(week_drinks),
-            "total_calories": total_calories,
-            "total_sugar_g": total_sugar,
-            "total_caffeine_mg": total_caffeine,
-            "total_water_ml": total_water,
-            "avg_calories_per_day": total_calories / 7,
-            "avg_drinks_per_day": len(week_drinks) / 7,
+            "total_drinks": totals["count"],
+            "total_calories": totals["calories"],
+            "total_sugar_g": totals["sugar_g"],
+            "total_caffeine_mg": totals["caffeine_mg"],
+            "total_water_ml": totals["water_ml"],
+            "avg_calories_per_day": totals["calories"] / 7,
+            "avg_drinks_per_day": totals["count"] / 7,
             "most_consumed_drink": most_consumed[0],
             "most_consumed_count": most_consumed[1],
             "drink_breakdown": drink_types,
             "period": f"{start_date} to {end_date}"
         }
 
-    def get_daily_totals(self, user_id: str) -> Dict:
+    @timed("drinks.get_daily_totals")
+    def get_daily_totals(self, user_id: str, include_drinks: bool = True) -> Dict:
         """Get today's totals for dashboard"""
-        today_drinks = self.get_today_drinks(user_id)
-        
-        return {
-            "calories": sum(drink.get('calories', 0) for drink in today_drinks),
-            "sugar_g": sum(drink.get('sugar_g', 0) for drink in today_drinks),
-            "caffeine_mg": sum(drink.get('caffeine_mg', 0) for drink in today_drinks),
-            "water_ml": sum(drink.get('water_ml', 0) for drink in today_drinks),
-            "drink_count": len(today_drinks),
-            "drinks": today_drinks
+        today = date.today()
+        totals = self._range_totals(user_id, today, today)
+
+        daily_totals = {
+            "calories": totals["calories"],
+            "sugar_g": totals["sugar_g"],
+            "caffeine_mg": totals["caffeine_mg"],
+            "water_ml": totals["water_ml"],
+            "drink_count": totals["count"],
         }
+        if include_drinks:
+            daily_totals["drinks"] = self.get_today_drinks(user_id)
+        return daily_totals
 
+    @timed("drinks.get_timeseries")
+    def get_timeseries(self, user_id: str, field: str = "calories", start_date: Optional[date] = None,
+                       end_date: Optional[date] = None, interval: str = "day", rolling: Optional[int] = None,
+                       by_drink: bool = False) -> Dict:
+        """Get per-day or per-hour totals of a nutrient (or drink count) over a date range"""
+        end_date = end_date or date.today()
+        if start_date is None:
+            start_date = end_date if interval == "hour" else end_date - timedelta(days=29)
+        # Rolling means read back before the start date, so the lead-in is loaded too
+        lead_in = timedelta(days=rolling or 0)
+        columns = self._ensure_range(user_id, *day_bounds(start_date - lead_in, end_date))
+        return bucket_series(columns, field, start_date, end_date, interval, rolling, by_drink)
+
+    @timed("drinks.delete_drink")
     def delete_drink(self, user_id: str, drink_id: str) -> bool:
         """Delete a specific drink"""
-        if user_id not in self.drinks_data:
+        columns = self._columns(user_id)
+        index = columns.find(drink_id) if columns is not None else None
+        if index is None and self.segment_index.months(user_id):
+            columns = self._ensure_range(user_id, *ALL_TIME)
+            index = columns.find(drink_id)
+        if index is None:
             return False
-        
-        user_drinks = self.drinks_data[user_id]
-        for i, drink in enumerate(user_drinks):
-            if drink.get('id') == drink_id:
-                del user_drinks[i]
-                self._save_data()
+        if columns.cold[index]:
+            # Segments are immutable, so a cold drink is hidden by a tombstone
+            self.segment_index.add_deleted(user_id, drink_id)
+            self._index_dirty = True
+            self._cold_users[user_id] -= 1
+            self._cold_rows -= 1
+        columns.delete(index)
+        self._changed(user_id)
+        self._save_data()
+        return True
+
+    def compaction_candidates(self, cutoff: datetime) -> List[str]:
+        """Users with hot drinks older than the cutoff"""
+        cutoff_micros = to_micros(cutoff)
+        candidates = []
+        for user_id, columns in list(self.user_columns.items()):
+            hi = bisect_left(columns.timestamps, cutoff_micros)
+            if hi and sum(columns.cold[:hi]) < hi:
+                candidates.append(user_id)
+        return candidates
+
+    def plan_compaction(self, user_id: str, cutoff: datetime) -> Dict[str, Tuple[int, List[Dict]]]:
+        """Hot drinks older than the cutoff, grouped by month with the segment part each goes to"""
+        columns = self._columns(user_id)
+        if columns is None:
+            return {}
+        hi = bisect_left(columns.timestamps, to_micros(cutoff))
+        plan: Dict[str, Tuple[int, List[Dict]]] = {}
+        for row, cold in zip(columns.rows_between(0, hi), columns.cold[:hi]):
+            if cold:
+                continue
+            month = row['timestamp'][:7]
+            if month not in plan:
+                plan[month] = (self.segment_index.months(user_id).get(month, 0) + 1, [])
+            plan[month][1].append(row)
+        return plan
+
+    def apply_compaction(self, user_id: str, cutoff: datetime, plan: Dict[str, Tuple[int, List[Dict]]]) -> int:
+        """Move planned drinks out of the hot tier once their segments are written.
+
+        Drinks deleted while the segments were being written get a tombstone;
+        drinks in months already loaded for a query stay in memory as cold rows.
+        Nothing is persisted until the next save commits the hot document and
+        the segment index together.
+        """
+        columns = self._columns(user_id)
+        ids = {columns.id_key(row['id']): row['id'] for _, rows in plan.values() for row in rows}
+        loaded = self._loaded_months.get(user_id, ())
+        cutoff_micros = to_micros(cutoff)
+        moved = set()
+
+        def keep(index: int) -> bool:
+            if columns.cold[index] or columns.timestamps[index] >= cutoff_micros:
+                return True
+            key = columns.id_key(columns.drink_id(index))
+            if key not in ids:
+                return True
+            moved.add(key)
+            if month_key(from_micros(columns.timestamps[index])) in loaded:
+                columns.cold[index] = 1
+                self._cold_users[user_id] = self._cold_users.get(user_id, 0) + 1
+                self._cold_rows += 1
                 return True
-        
-        return False
+            return False
+
+        columns.keep_rows(keep)
+        for month, (part, _) in plan.items():
+            if self.segment_index.add_part(user_id, month) != part:
+                raise RuntimeError(f"Segment part {month}.{part} of {user_id} was reserved twice")
+        for key, drink_id in ids.items():
+            if key not in moved:
+                self.segment_index.add_deleted(user_id, drink_id)
+        if not len(columns) and not self._cold_users.get(user_id):
+            del self.user_columns[user_id]
+        self._index_dirty = True
+        return len(moved)
+
+    def commit_compaction(self):
+        self._save_data()
+
+    def columns_for_range(self, user_id: str, start_micros: int, end_micros: int) -> Optional[UserDrinkColumns]:
+        """A copy of a user's drinks in [start, end) for background readers, without caching cold months.
+
+        Like every other method it must be called on the event loop, where
+        the live columns are mutated. The copy has its own arrays and string
+        tables, so it can then be read on any thread.
+        """
+        months = dict(self.segment_index.months(user_id))
+        loaded = set(self._loaded_months.get(user_id, ()))
+        missing = [month for month in months if month not in loaded
+                   and month_bounds(month)[0] < end_micros and month_bounds(month)[1] > start_micros]
+        columns = self._columns(user_id)
+        if columns is not None:
+            copy = columns.copy_rows(*columns.range_for(start_micros, end_micros))
+        elif missing:
+            copy = UserDrinkColumns(user_id, StringTable(), StringTable())
+        else:
+            return None
+        if missing:
+            deleted = set(self.segment_index.deleted(user_id))
+            copy.merge_entries((entry for month in missing for entry in self.segments.read(user_id, month, months[month])
+                                if entry.get('id') not in deleted), cold=True)
+        return copy
 
+    def user_ids(self) -> List[str]:
+        """Every user with drink history, hot or cold"""
+        return list(dict.fromkeys([*list(self.user_columns), *list(self.segment_index.users)]))
+
+    def _insight_aggregates(self, user_id: str, today: date, out: np.ndarray, columns_used: List[int]):
+        """Fill one row of the insight aggregate matrix (columns as AGGREGATES)"""
+        windows = ((today, today), (today - timedelta(days=7), today))
+        for window, (start_date, end_date) in enumerate(windows):
+            bounds = day_bounds(start_date, end_date)
+            columns = self._ensure_range(user_id, *bounds)
+            if columns is None:
+                continue
+            lo, hi = columns.range_for(*bounds)
+            for column in columns_used:
+                if column // len(INSIGHT_FIELDS) != window:
+                    continue
+                field = INSIGHT_FIELDS[column % len(INSIGHT_FIELDS)]
+                out[column] = hi - lo if field == "drinks" else columns.total(field, lo, hi)
+
+    def insight_aggregates(self, user_ids: List[str], today: Optional[date] = None,
+                           all_columns: bool = False) -> np.ndarray:
+        """Today's and this week's totals for each user, one row per user.
+
+        Only the columns some insight rule reads are filled unless
+        ``all_columns`` is set; the rest stay zero.
+        """
+        today = today or date.today()
+        columns_used = list(range(len(AGGREGATES))) if all_columns else self.insight_rules.aggregates_used
+        aggregates = np.zeros((len(user_ids), len(AGGREGATES)))
+        for row, user_id in enumerate(user_ids):
+            self._insight_aggregates(user_id, today, aggregates[row], columns_used)
+        return aggregates
+
+    def _cache_insights(self, user_id: str, key: Tuple[int, date], insights: List[str]):
+        self._insight_cache[user_id] = (key, insights)
+        self._insight_cache.move_to_end(user_id)
+        while len(self._insight_cache) > INSIGHT_CACHE_USERS:
+            self._insight_cache.popitem(last=False)
+
+    @timed("drinks.get_health_insights")
     def get_health_insights(self, user_id: str) -> List[str]:
         """Generate health insights based on drinking patterns"""
-        week_stats = self.get_weekly_stats(user_id)
-        today_totals = self.get_daily_totals(user_id)
-        insights = []
-        
-        # High sugar warning
-        if today_totals['sugar_g'] > 50:
-            insights.append(f"You've consumed {today_totals['sugar_g']:.1f}g of sugar today, which exceeds the recommended daily limit.")
-        
-        # High caffeine warning
-        if today_totals['caffeine_mg'] > 400:
-            insights.append(f"Your caffeine intake ({today_totals['caffeine_mg']}mg) is above the recommended daily limit of 400mg.")
-        
-        # Hydration encouragement
-        if today_totals['water_ml'] < 1000:
-            insights.append("Consider drinking more water to stay properly hydrated throughout the day.")
-        
-        # Weekly patterns
-        if week_stats['avg_drinks_per_day'] > 5:
-            insights.append("You're averaging more than 5 drinks per day. Consider moderating your intake.")
-        
-        # Positive reinforcement
-        if len(insights) == 0:
-            insights.append("Great job maintaining a balanced drinking pattern!")
-        
-        return insights
\ No newline at end of file
+        today = date.today()
+        key = (self._versions.get(user_id, 0), today)
+        cached = self._insight_cache.get(user_id)
+        if cached is not None and cached[0] == key:
+            self._insight_cache.move_to_end(user_id)
+            return list(cached[1])
+        insights = self.insight_rules.insights(self.insight_aggregates([user_id], today))[0]
+        self._cache_insights(user_id, key, insights)
+        return list(insights)
+
+    @timed("drinks.batch_health_insights")
+    def batch_health_insights(self, user_ids: List[str], today: Optional[date] = None,
+                              aggregates: Optional[np.ndarray] = None) -> Dict[str, List[str]]:
+        """Evaluate the insight rules for many users at once and cache the results"""
+        today = today or date.today()
+        if aggregates is None:
+            aggregates = self.insight_aggregates(user_ids, today)
+        results = dict(zip(user_ids, self.insight_rules.insights(aggregates)))
+        for user_id, insights in results.items():
+            self._cache_insights(user_id, (self._versions.get(user_id, 0), today), insights)
+        return results
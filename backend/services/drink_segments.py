@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.drink_columns import to_micros
+from services.metrics import STORAGE_WRITE_BYTES, timed
+from services.storage import JSONFileStorage
+
+# Drinks older than this many days (rounded down to a month boundary) move to cold segments
+DRINK_HOT_DAYS = int(os.getenv("DRINK_HOT_DAYS", "35"))
+
+_SAFE_USER_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+
+def user_dirname(user_id: str) -> str:
+    """A user's directory name under a per-user store"""
+    if _SAFE_USER_ID.fullmatch(user_id):
+        return user_id
+    # Ids that aren't safe as a directory name are hashed
+    return "~" + hashlib.sha1(user_id.encode()).hexdigest()
+
+
+def month_key(value: datetime) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def month_bounds(month: str) -> Tuple[int, int]:
+    """Half-open microsecond range of a "YYYY-MM" month"""
+    year, number = int(month[:4]), int(month[5:7])
+    start = datetime(year, number, 1)
+    end = datetime(year + number // 12, number % 12 + 1, 1)
+    return to_micros(start), to_micros(end)
+
+
+def cold_cutoff(today: date, hot_days: int = DRINK_HOT_DAYS) -> datetime:
+    """First instant that stays hot: the start of the month ``hot_days`` ago.
+
+    Cutting at month boundaries means a month is only ever compacted once it
+    is complete, so segments never need to be rewritten.
+    """
+    boundary = today - timedelta(days=hot_days)
+    return datetime(boundary.year, boundary.month, 1)
+
+
+class SegmentStore:
+    """Compressed, immutable per-user monthly segments of cold drink history.
+
+    A month can have several parts, written by successive compactions (for
+    example after an import backfilled an already compacted month). Each part
+    is gzipped NDJSON, written to a temp file, fsynced and renamed into place;
+    it only becomes visible once the segment index referencing it is
+    committed, so a crash mid-compaction leaves at most an unreferenced part
+    that the next compaction overwrites.
+    """
+
+    SUFFIX = ".json.gz"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def user_dir(self, user_id: str) -> str:
+        return os.path.join(self.root_dir, user_dirname(user_id))
+
+    def path_for(self, user_id: str, month: str, part: int) -> str:
+        return os.path.join(self.user_dir(user_id), f"{month}.{part}{self.SUFFIX}")
+
+    @timed("segments.write")
+    def write(self, user_id: str, month: str, part: int, entries: List[Dict]):
+        path = self.path_for(user_id, month, part)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = gzip.compress(
+            "".join(json.dumps(entry, separators=(",", ":"), default=str) + "\n" for entry in entries).encode(),
+            compresslevel=6,
+        )
+        temp_path = path + JSONFileStorage.TEMP_SUFFIX
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        STORAGE_WRITE_BYTES.labels("drink_segments").observe(len(payload))
+
+    @timed("segments.read")
+    def read(self, user_id: str, month: str, parts: int) -> Iterator[Dict]:
+        for part in range(1, parts + 1):
+            with gzip.open(self.path_for(user_id, month, part), 'rt') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+class SegmentIndex:
+    """Which cold months each user has, and ids deleted from them.
+
+    Stored as one small document next to the hot history and committed in the
+    same ``save_many`` batch, so the hot file and the index never disagree
+    about where a drink lives.
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        self.users: Dict[str, Dict] = data or {}
+
+    def months(self, user_id: str) -> Dict[str, int]:
+        return self.users.get(user_id, {}).get("months", {})
+
+    def deleted(self, user_id: str) -> List[str]:
+        return self.users.get(user_id, {}).get("deleted", [])
+
+    def add_part(self, user_id: str, month: str) -> int:
+        """Reserve the next part number of a month and return it"""
+        months = self.users.setdefault(user_id, {}).setdefault("months", {})
+        months[month] = months.get(month, 0) + 1
+        return months[month]
+
+    def add_deleted(self, user_id: str, drink_id: str):
+        self.users.setdefault(user_id, {}).setdefault("deleted", []).append(drink_id)
+
+    def overlapping(self, user_id: str, start_micros: int, end_micros: int) -> List[str]:
+        """Months with segments that intersect [start, end), newest first"""
+        return sorted((month for month in self.months(user_id)
+                       if month_bounds(month)[0] < end_micros and month_bounds(month)[1] > start_micros),
+                      reverse=True)
@@ -0,0 +1,100 @@
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.drink_columns import NUTRIENT_FIELDS, UserDrinkColumns, day_bounds, from_micros
+
+# Series that can be requested: any nutrient column, or the number of drinks
+SERIES_FIELDS = NUTRIENT_FIELDS + ("count",)
+
+INTERVALS = {
+    "day": 86_400_000_000,
+    "hour": 3_600_000_000,
+}
+
+# Upper bound on buckets per request (about ten years of days, or 400 days of hours)
+MAX_BUCKETS = 10_000
+
+
+def column_view(column) -> np.ndarray:
+    """Zero-copy NumPy view of a typed ``array`` column.
+
+    The array can't be resized while a view exists, so views must not outlive
+    the call that made them.
+    """
+    return np.frombuffer(column, dtype=np.int64 if column.typecode == 'q' else
+                         np.float32 if column.typecode == 'f' else np.int32)
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over ``window`` buckets; values carries window - 1 lead-in buckets"""
+    cumulative = np.cumsum(np.concatenate(([0.0], values)))
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+
+def _round(values: np.ndarray) -> List[float]:
+    return np.round(values, 4).tolist()
+
+
+def bucket_series(columns: Optional[UserDrinkColumns], field: str, start_date: date, end_date: date,
+                  interval: str = "day", rolling: Optional[int] = None, by_drink: bool = False) -> Dict:
+    """Per-bucket totals of one field over [start_date, end_date], computed on the raw columns"""
+    if field not in SERIES_FIELDS:
+        raise ValueError(f"Unknown field {field!r}; choose from {', '.join(SERIES_FIELDS)}")
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval {interval!r}; choose from {', '.join(INTERVALS)}")
+    if end_date < start_date:
+        raise ValueError("end date is before start date")
+    if rolling is not None and rolling < 1:
+        raise ValueError("rolling window must be at least 1")
+
+    bucket = INTERVALS[interval]
+    start, end = day_bounds(start_date, end_date)
+    buckets = (end - start) // bucket
+    lead = (rolling - 1) if rolling else 0
+    if buckets + lead > MAX_BUCKETS:
+        raise ValueError(f"Range too large: {buckets + lead} {interval} buckets (max {MAX_BUCKETS})")
+
+    # Rolling averages need the buckets just before the range as lead-in
+    scan_start = start - lead * bucket
+    total_buckets = buckets + lead
+    values = np.zeros(total_buckets, dtype=np.int64 if field == "count" else np.float64)
+    breakdown: Dict[str, List[float]] = {}
+
+    if columns is not None and len(columns):
+        lo, hi = columns.range_for(scan_start, end)
+        timestamps = column_view(columns.timestamps)[lo:hi]
+        bins = (timestamps - scan_start) // bucket
+        if field == "count":
+            weights = None
+        else:
+            # Missing optional nutrients are stored as NaN and count as zero
+            weights = np.nan_to_num(column_view(columns.nutrients[field])[lo:hi].astype(np.float64))
+        values = np.bincount(bins, weights=weights, minlength=total_buckets)
+
+        if by_drink and hi > lo:
+            names, inverse = np.unique(column_view(columns.name_ids)[lo:hi], return_inverse=True)
+            in_range = bins >= lead
+            grid = np.bincount(inverse[in_range] * buckets + (bins[in_range] - lead),
+                               weights=None if weights is None else weights[in_range],
+                               minlength=len(names) * buckets).reshape(len(names), buckets)
+            breakdown = {columns.names[int(name_id)]: _round(row)
+                         for name_id, row in zip(names, grid) if row.any()}
+
+    labels = [from_micros(start + i * bucket) for i in range(buckets)]
+    series = {
+        "field": field,
+        "interval": interval,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "buckets": [label.date().isoformat() if interval == "day" else label.isoformat() for label in labels],
+        "values": _round(values[lead:]),
+        "total": round(float(values[lead:].sum()), 4),
+    }
+    if rolling:
+        series["rolling_window"] = rolling
+        series["rolling_average"] = _round(_rolling_mean(values, rolling))
+    if by_drink:
+        series["by_drink"] = breakdown
+    return series
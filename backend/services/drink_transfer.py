@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from models.response_models import DrinkRecord
+from services.drink_history_service import DrinkHistoryService
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Records committed per storage write during a bulk import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+# Rejected records listed individually in the import summary; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+FIELDS = DrinkHistoryService.EXPORT_FIELDS
+
+
+def encode_rows(rows: List[Dict], format: str) -> str:
+    if format == "ndjson":
+        return "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, FIELDS, extrasaction="ignore").writerows(rows)
+    return buffer.getvalue()
+
+
+def csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(FIELDS)
+    return buffer.getvalue()
+
+
+async def export_stream(chunks: Iterator[List[Dict]], format: str) -> AsyncIterator[str]:
+    """Encode history chunks as they are produced, so memory stays at one chunk"""
+    if format == "csv":
+        yield csv_header()
+    for rows in chunks:
+        yield encode_rows(rows, format)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a streamed body into lines without buffering more than one partial line"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if pending:
+        yield pending.decode("utf-8")
+
+
+async def iter_raw_records(lines: AsyncIterator[str], format: str) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (line number, parsed dict or parse error) for each record in the body"""
+    if format == "ndjson":
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+        return
+
+    header: Optional[List[str]] = None
+    record, start, line_number = "", 0, 0
+    async for line in lines:
+        line_number += 1
+        record = record + "\n" + line if record else line
+        start = start or line_number
+        # A quoted field can span lines; the record ends once every quote is closed
+        if record.count('"') % 2:
+            continue
+        text, record, first_line, start = record, "", start, 0
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = values
+            continue
+        if len(values) != len(header):
+            yield first_line, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        # Empty CSV cells mean a missing optional value
+        yield first_line, {key: value for key, value in zip(header, values) if value != ""}
+    if record:
+        yield start, ValueError("Unterminated quoted field")
+
+
+def validate_record(raw: object) -> DrinkRecord:
+    if not isinstance(raw, dict):
+        raise ValueError("Expected a JSON object")
+    return DrinkRecord(**raw)
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+
+async def import_stream(chunks: AsyncIterator[bytes], format: str,
+                        commit_batch: Callable[[List[DrinkRecord]], Dict],
+                        batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """Validate streamed records and hand them to ``commit_batch`` in batches.
+
+    Batches committed before a failing one stay committed; the summary's
+    ``failed`` field then says why the import stopped.
+    """
+    summary = {"imported": 0, "duplicates": 0, "rejected": 0, "batches": 0, "errors": [], "failed": None}
+
+    def commit(batch: List[DrinkRecord]) -> bool:
+        try:
+            result = commit_batch(batch)
+        except Exception as e:
+            print(f"Error committing import batch: {e}")
+            summary["failed"] = f"Batch {summary['batches'] + 1} was not saved: {e}"
+            return False
+        summary["imported"] += result["imported"]
+        summary["duplicates"] += result["duplicates"]
+        summary["batches"] += 1
+        return True
+
+    batch: List[DrinkRecord] = []
+    async for line_number, raw in iter_raw_records(iter_lines(chunks), format):
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            batch.append(validate_record(raw))
+        except (ValueError, TypeError) as e:
+            summary["rejected"] += 1
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append({"line": line_number, "error": _describe(e)})
+            continue
+        if len(batch) >= batch_size:
+            if not commit(batch):
+                return summary
+            batch = []
+    if batch:
+        commit(batch)
+    return summary
@@ -0,0 +1,81 @@
+import importlib.util
+import json
+import os
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from services.metrics import track_stage
+
+# orjson is a dependency and msgpack the "msgpack" extra; responses still fall back
+# to the stdlib json module when either is missing
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+MSGPACK_AVAILABLE = importlib.util.find_spec("msgpack") is not None
+if ORJSON_AVAILABLE:
+    import orjson
+if MSGPACK_AVAILABLE:
+    import msgpack
+
+# Responses at least this large are gzipped for clients that accept it
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1000"))
+
+# zlib level for response compression; 6 costs about a third of level 9's CPU for nearly the same size
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _default(value: Any) -> Any:
+    """Types the fast encoders don't know natively"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, "dict"):
+        return value.dict()
+    raise TypeError(f"Can't encode {type(value).__name__}")
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """MessagePack when the client asks for it and msgpack is installed, JSON otherwise"""
+    if accept and MSGPACK_AVAILABLE:
+        for part in accept.split(","):
+            media_type, *params = part.split(";")
+            if media_type.strip() not in MSGPACK_MEDIA_TYPES:
+                continue
+            quality = 1.0
+            for param in params:
+                name, _, value = param.strip().partition("=")
+                if name == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        pass
+            if quality > 0:
+                return MSGPACK_MEDIA_TYPES[0]
+    return JSON_MEDIA_TYPE
+
+
+def encode(content: Any, media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return msgpack.packb(content, default=_default, use_bin_type=True)
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def encoded_response(accept: Optional[str], content: Any, status_code: int = 200) -> Response:
+    """Encode plain response data in the representation the client accepts.
+
+    Endpoints returning large dicts use this instead of FastAPI's default
+    response, which walks the whole structure with ``jsonable_encoder``
+    before encoding it again with ``json.dumps``.
+    """
+    media_type = negotiate(accept)
+    with track_stage("encode"):
+        body = encode(content, media_type)
+    return Response(content=body, status_code=status_code, media_type=media_type, headers={"Vary": "Accept"})
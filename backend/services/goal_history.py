@@ -0,0 +1,89 @@
+import json
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Tuple
+
+from services.drink_segments import user_dirname
+from services.metrics import STORAGE_WRITE_BYTES, timed
+
+GOAL_HISTORY_DIR = "goal_history"
+
+
+def goal_snapshot(goals: Iterable[Dict]) -> List[Dict]:
+    """The fields of each goal worth keeping once its day is over"""
+    snapshot = []
+    for goal in goals:
+        achieved_at = goal.get("achieved_at")
+        snapshot.append({
+            "id": goal["id"],
+            "name": goal["name"],
+            "type": getattr(goal["type"], "value", goal["type"]),
+            "unit": goal["unit"],
+            "target": goal["target"],
+            "current": goal["current"],
+            "achieved": bool(goal.get("is_achieved")),
+            "achieved_at": achieved_at.isoformat() if isinstance(achieved_at, datetime) else achieved_at,
+        })
+    return snapshot
+
+
+class GoalHistoryStore:
+    """Final goal state of each past day, one NDJSON file per user and year.
+
+    The rollover appends a user's days in date order, so any range of a
+    user's history is a read of one or two small files. Days without goal
+    progress are not recorded. A day written twice (a rollover retried after
+    a crash) keeps its last line. A line cut short by a crash is skipped on
+    read and terminated by the next append, so it never swallows a new day.
+    """
+
+    SUFFIX = ".ndjson"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def path_for(self, user_id: str, year: int) -> str:
+        return os.path.join(self.root_dir, user_dirname(user_id), f"{year:04d}{self.SUFFIX}")
+
+    @timed("goal_history.append")
+    def append(self, records: Iterable[Tuple[str, date, List[Dict]]]) -> int:
+        """Append (user_id, day, goal snapshot) records; returns the days written"""
+        lines: Dict[str, List[str]] = defaultdict(list)
+        for user_id, day, goals in records:
+            lines[self.path_for(user_id, day.year)].append(
+                json.dumps({"date": day.isoformat(), "goals": goals}, separators=(",", ":")) + "\n"
+            )
+        written = 0
+        for path, file_lines in lines.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            payload = "".join(file_lines).encode()
+            with open(path, 'ab+') as f:
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        payload = b"\n" + payload
+                f.write(payload)
+            STORAGE_WRITE_BYTES.labels("goal_history").observe(len(payload))
+            written += len(file_lines)
+        return written
+
+    @timed("goal_history.read")
+    def read(self, user_id: str, start_date: date, end_date: date) -> Dict[date, List[Dict]]:
+        """Goal snapshots by day for an inclusive date range, oldest first"""
+        days: Dict[date, List[Dict]] = {}
+        for year in range(start_date.year, end_date.year + 1):
+            try:
+                with open(self.path_for(user_id, year), 'rb') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # A line cut short by a crash mid-append
+                            continue
+                        day = date.fromisoformat(record["date"])
+                        if start_date <= day <= end_date:
+                            days[day] = record["goals"]
+            except FileNotFoundError:
+                continue
+        return dict(sorted(days.items()))
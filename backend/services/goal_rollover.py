@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from services.metrics import track_stage
+from services.user_service import UserService
+
+# Seconds after local midnight the daily goal rollover runs; negative disables the schedule
+GOAL_ROLLOVER_DELAY_S = float(os.getenv("GOAL_ROLLOVER_DELAY_S", "5"))
+
+# Profile shards reset and saved per step, so the event loop is never held for long
+ROLLOVER_BATCH_SHARDS = 4
+
+
+def seconds_until_rollover(now: datetime, delay_s: float = GOAL_ROLLOVER_DELAY_S) -> float:
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds() + delay_s
+
+
+class GoalRolloverJob:
+    """Resets every user's daily goal progress at the start of a new day.
+
+    Users are handled a few profile shards at a time. For each batch, the
+    final goal state of the old day is snapshotted on the event loop and
+    appended to the goal history on a worker thread. Then the goals are
+    reset and the shards saved, back on the loop. The history is written
+    before the reset is, so a crash in between only repeats a day in the
+    history, which reads deduplicate.
+    """
+
+    def __init__(self, user_service: UserService, batch_shards: int = ROLLOVER_BATCH_SHARDS):
+        self.user_service = user_service
+        self.batch_shards = batch_shards
+        self.last_result: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, today: Optional[date] = None) -> asyncio.Task:
+        """Start a rollover on the running event loop"""
+        if self.running:
+            raise RuntimeError("Goal rollover is already running")
+        self._task = asyncio.get_running_loop().create_task(self._run(today or date.today()))
+        return self._task
+
+    async def run(self, today: Optional[date] = None) -> Dict:
+        return await self.start(today)
+
+    async def _run(self, today: date) -> Dict:
+        try:
+            with track_stage("goal_rollover.run"):
+                self.last_result = await self._roll_over(today)
+        except Exception as e:
+            print(f"Error rolling over daily goals: {e}")
+            self.last_result = {"error": str(e), "finished_at": datetime.now().isoformat()}
+        return self.last_result
+
+    async def _roll_over(self, today: date) -> Dict:
+        service = self.user_service
+        started = time.perf_counter()
+        shards = service.rollover_shards(today)
+        result = {"date": today.isoformat(), "shards": len(shards), "users": 0, "history_days": 0}
+        for start in range(0, len(shards), self.batch_shards):
+            records = service.goal_snapshots(shards[start:start + self.batch_shards], today)
+            if not records:
+                continue
+            result["history_days"] += await asyncio.to_thread(service.goal_history.append, records)
+            result["users"] += service.reset_goals([user_id for user_id, _, _ in records], today)
+            service.commit_rollover()
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        result["finished_at"] = datetime.now().isoformat()
+        return result
+
+    async def run_periodically(self, ready: Callable[[], bool], delay_s: float = GOAL_ROLLOVER_DELAY_S):
+        """Catch up once the data stores are loaded, then roll over after every midnight"""
+        if delay_s < 0:
+            return
+        while not ready():
+            await asyncio.sleep(1)
+        if not self.running:
+            await self.run()
+        while True:
+            await asyncio.sleep(seconds_until_rollover(datetime.now(), delay_s))
+            if not self.running:
+                await self.run()
@@ -1,20 +1,34 @@
+import asyncio
 import os
+import random
+import threading
+import importlib.util
 from models.response_models import NutritionData
-from typing import Dict, Any
+from services.metrics import FALLBACK_USAGE
+from services.upstream_transport import LiveTransport, UpstreamTransport, fallback_rng
+from typing import Dict, Any, Optional
 
-# Conditional import for OpenAI
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    OpenAI = None
+# OpenAI is imported on first use, so startup doesn't pay for the SDK
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+OpenAI = None
+
+_TIP_FALLBACKS = FALLBACK_USAGE.labels("health_tip")
+
+def load_openai():
+    global OpenAI
+    if OpenAI is None:
+        from openai import OpenAI as openai_client
+        OpenAI = openai_client
+    return OpenAI
 
 class HealthTipService:
-    def __init__(self):
-        # Initialize OpenAI client for OpenRouter
-        self.client = None
-        self._setup_client()
+    def __init__(self, transport: Optional[UpstreamTransport] = None, rng: Optional[random.Random] = None):
+        self.transport = transport or LiveTransport()
+        self.rng = rng or fallback_rng("health_tip")
+        # OpenAI client for OpenRouter, created on first use
+        self._client = None
+        self._client_ready = False
+        self._client_lock = threading.Lock()
         
         # Predefined health tips for fallback
         self.health_tips_database = {
@@ -45,22 +59,38 @@ class HealthTipService:
             ]
         }
     
+    @property
+    def client(self):
+        """OpenAI client for OpenRouter, created on first use"""
+        if not self._client_ready:
+            self._setup_client()
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+        self._client_ready = True
+
     def _setup_client(self):
         """Initialize OpenAI client for OpenRouter"""
-        try:
-            openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
-            if OPENAI_AVAILABLE and openrouter_api_key:
-                self.client = OpenAI(
-                    base_url="https://openrouter.ai/api/v1",
-                    api_key=openrouter_api_key,
-                )
-        except Exception as e:
-            print(f"OpenRouter setup failed: {e}")
-            self.client = None
+        with self._client_lock:
+            if self._client_ready:
+                return
+            try:
+                openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
+                if OPENAI_AVAILABLE and openrouter_api_key:
+                    self._client = load_openai()(
+                        base_url=os.getenv('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1"),
+                        api_key=openrouter_api_key,
+                    )
+            except Exception as e:
+                print(f"OpenRouter setup failed: {e}")
+                self._client = None
+            self._client_ready = True
     
     async def generate_health_tip(self, drink_name: str, nutrition_data: NutritionData) -> str:
         """Generate a health tip based on drink and nutrition data"""
-        if self.client:
+        if self.transport.replays or self.client:
             try:
                 return await self._generate_ai_tip(drink_name, nutrition_data)
             except Exception as e:
@@ -83,21 +113,28 @@ class HealthTipService:
         Make the tip practical, encouraging, and focused on balance rather than restriction.
         """
         
-        response = self.client.chat.completions.create(
-            model="anthropic/claude-3.5-sonnet",  # You can change this to other models
-            messages=[
+        request = {
+            "model": "anthropic/claude-3.5-sonnet",  # You can change this to other models
+            "messages": [
                 {"role": "system", "content": "You are a friendly, knowledgeable nutritionist who gives practical, positive health advice."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=100,
-            temperature=0.7
-        )
+            "max_tokens": 100,
+            "temperature": 0.7
+        }
+        
+        def complete():
+            response = self.client.chat.completions.create(**request)
+            return {"content": response.choices[0].message.content}
+        
+        # The OpenAI client blocks, so the call runs off the event loop
+        response = await asyncio.to_thread(self.transport.call, "openrouter", request, complete)
         
-        return response.choices[0].message.content.strip()
+        return response["content"].strip()
     
     def _generate_fallback_tip(self, nutrition_data: NutritionData) -> str:
         """Generate health tip from predefined database"""
-        import random
+        _TIP_FALLBACKS.inc()
         
         # Categorize the drink based on nutrition
         category = self._categorize_drink(nutrition_data)
@@ -105,7 +142,7 @@ class HealthTipService:
         # Get appropriate tips for the category
         tips = self.health_tips_database.get(category, self.health_tips_database["moderate"])
         
-        return random.choice(tips)
+        return self.rng.choice(tips)
     
     def _categorize_drink(self, nutrition_data: NutritionData) -> str:
         """Categorize drink based on nutritional content"""
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from services.drink_history_service import DrinkHistoryService
+from services.goal_rollover import seconds_until_rollover
+from services.insight_rules import AGGREGATES, INSIGHT_FIELDS, WEEK_DAYS
+from services.metrics import STORAGE_WRITE_BYTES, track_stage
+from services.storage import JSONFileStorage
+from services.user_service import UserService
+
+# Seconds after local midnight the nightly insight run starts; negative disables the schedule
+INSIGHT_JOB_DELAY_S = float(os.getenv("INSIGHT_JOB_DELAY_S", "600"))
+
+# Weekday (0 = Monday) whose nightly run also writes weekly reports; negative disables them
+WEEKLY_REPORT_WEEKDAY = int(os.getenv("WEEKLY_REPORT_WEEKDAY", "0"))
+
+WEEKLY_REPORTS_DIR = "weekly_reports"
+
+# Users evaluated per step, so the event loop is never held for long
+INSIGHT_BATCH_USERS = 2000
+
+
+class InsightJob:
+    """Evaluates the insight rules for every user once a night.
+
+    Users are handled in batches: their aggregates are gathered and the
+    rules evaluated for the whole batch at once, which also fills the
+    insight cache for the new day. On the weekly report day, users who opted
+    into weekly reports get a line in ``weekly_reports/<date>.ndjson`` with
+    the totals and insights of the week that ended yesterday; the file is an
+    outbox for whatever delivers the notifications.
+    """
+
+    def __init__(self, drink_history_service: DrinkHistoryService, user_service: UserService,
+                 data_dir: str = "data", batch_users: int = INSIGHT_BATCH_USERS,
+                 report_weekday: int = WEEKLY_REPORT_WEEKDAY):
+        self.drink_history_service = drink_history_service
+        self.user_service = user_service
+        self.reports_dir = os.path.join(data_dir, WEEKLY_REPORTS_DIR)
+        self.batch_users = batch_users
+        self.report_weekday = report_weekday
+        self.last_result: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, today: Optional[date] = None, weekly_reports: Optional[bool] = None) -> asyncio.Task:
+        """Start an insight run on the running event loop"""
+        if self.running:
+            raise RuntimeError("Insight run is already in progress")
+        today = today or date.today()
+        if weekly_reports is None:
+            weekly_reports = today.weekday() == self.report_weekday
+        self._task = asyncio.get_running_loop().create_task(self._run(today, weekly_reports))
+        return self._task
+
+    async def run(self, today: Optional[date] = None, weekly_reports: Optional[bool] = None) -> Dict:
+        return await self.start(today, weekly_reports)
+
+    async def _run(self, today: date, weekly_reports: bool) -> Dict:
+        try:
+            with track_stage("insights.run"):
+                self.last_result = await self._evaluate(today, weekly_reports)
+        except Exception as e:
+            print(f"Error evaluating health insights: {e}")
+            self.last_result = {"error": str(e), "finished_at": datetime.now().isoformat()}
+        return self.last_result
+
+    def report_path(self, end_date: date) -> str:
+        return os.path.join(self.reports_dir, f"{end_date.isoformat()}.ndjson")
+
+    async def _evaluate(self, today: date, weekly_reports: bool) -> Dict:
+        history = self.drink_history_service
+        started = time.perf_counter()
+        user_ids = history.user_ids()
+        result = {"date": today.isoformat(), "users": len(user_ids), "insights": 0}
+        for start in range(0, len(user_ids), self.batch_users):
+            batch = user_ids[start:start + self.batch_users]
+            results = history.batch_health_insights(batch, today)
+            result["insights"] += sum(len(insights) for insights in results.values())
+            await asyncio.sleep(0)
+        if weekly_reports:
+            result["weekly_reports"] = await self._weekly_reports(today - timedelta(days=1))
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        result["finished_at"] = datetime.now().isoformat()
+        return result
+
+    def _report_recipients(self) -> List[str]:
+        return [user_id for user_id, profile in self.user_service.users_data.items()
+                if profile.get("notifications", {}).get("weekly_reports")]
+
+    async def _weekly_reports(self, end_date: date) -> Dict:
+        """Write the report lines for the week ending ``end_date``"""
+        history = self.drink_history_service
+        recipients = self._report_recipients()
+        period = {"start_date": (end_date - timedelta(days=WEEK_DAYS)).isoformat(), "end_date": end_date.isoformat()}
+        week = len(INSIGHT_FIELDS)
+        lines = []
+        for start in range(0, len(recipients), self.batch_users):
+            batch = recipients[start:start + self.batch_users]
+            aggregates = history.insight_aggregates(batch, end_date, all_columns=True)
+            insights = history.insight_rules.insights(aggregates)
+            for user_id, row, user_insights in zip(batch, aggregates.tolist(), insights):
+                totals = {f"total_{name.split('.')[1]}": value for name, value in zip(AGGREGATES[week:], row[week:])}
+                totals["total_drinks"] = int(totals["total_drinks"])
+                totals["avg_drinks_per_day"] = totals["total_drinks"] / WEEK_DAYS
+                lines.append(json.dumps({"user_id": user_id, "period": period, **totals, "insights": user_insights},
+                                        separators=(",", ":")) + "\n")
+            await asyncio.sleep(0)
+        path = self.report_path(end_date)
+        await asyncio.to_thread(self._write_reports, path, lines)
+        return {"path": path, "users": len(lines)}
+
+    @staticmethod
+    def _write_reports(path: str, lines: List[str]):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = "".join(lines).encode()
+        # Written whole and renamed, so a retried run replaces rather than duplicates
+        temp_path = path + JSONFileStorage.TEMP_SUFFIX
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, path)
+        STORAGE_WRITE_BYTES.labels("weekly_reports").observe(len(payload))
+
+    async def run_periodically(self, ready: Callable[[], bool], delay_s: float = INSIGHT_JOB_DELAY_S):
+        """Evaluate every user after each midnight, once the data stores are loaded"""
+        if delay_s < 0:
+            return
+        while True:
+            await asyncio.sleep(seconds_until_rollover(datetime.now(), delay_s))
+            while not ready():
+                await asyncio.sleep(1)
+            if not self.running:
+                await self.run()
@@ -0,0 +1,176 @@
+import json
+import operator
+import os
+import re
+from string import Formatter
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Declarative health-insight rules; see insight_rules.json for the format
+INSIGHT_RULES_FILE = os.getenv("INSIGHT_RULES_FILE") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "insight_rules.json"
+)
+
+INSIGHT_FIELDS = ("calories", "sugar_g", "caffeine_mg", "water_ml", "sodium_mg", "drinks")
+
+# The week runs from seven days ago through today and is averaged over seven
+# days, as in get_weekly_stats
+WEEK_DAYS = 7
+
+# Columns of the aggregate matrix: one row per user, totals per window
+AGGREGATES = tuple(f"{window}.{field}" for window in ("today", "week") for field in INSIGHT_FIELDS)
+
+# Names rules can test: the aggregates plus the week's daily averages
+METRICS = AGGREGATES + tuple(f"week.avg_{field}" for field in INSIGHT_FIELDS)
+
+_CONDITION = re.compile(r"\s*([a-z_]+\.[a-z_]+)\s*(>=|<=|==|!=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+# Work on floats and elementwise on arrays alike
+_OPERATORS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+OTHERWISE = "otherwise"
+
+
+class InsightRuleError(ValueError):
+    pass
+
+
+def metric_matrix(aggregates: np.ndarray) -> np.ndarray:
+    """Append the week's daily averages to an aggregate matrix"""
+    week = aggregates[:, len(INSIGHT_FIELDS):]
+    return np.hstack([aggregates, week / WEEK_DAYS])
+
+
+def _aggregate_for(metric: str) -> int:
+    """Aggregate column a metric is derived from"""
+    return AGGREGATES.index(metric.replace(".avg_", "."))
+
+
+def _namespaces(metrics) -> Dict[str, SimpleNamespace]:
+    values: Dict[str, Dict] = {"today": {}, "week": {}}
+    for name, value in zip(METRICS, list(metrics)):
+        window, field = name.split(".")
+        values[window][field] = int(value) if field == "drinks" else value
+    return {window: SimpleNamespace(**fields) for window, fields in values.items()}
+
+
+class InsightRule:
+    def __init__(self, rule_id: str, message: str, conditions: List[Tuple[int, Callable, float]], otherwise: bool):
+        self.id = rule_id
+        self.message = message
+        self.conditions = conditions
+        self.otherwise = otherwise
+        # Messages without placeholders are returned as they are
+        self.templated = "{" in message
+
+
+class RuleSet:
+    """Insight rules compiled once into column tests over a metric matrix.
+
+    Each rule's ``when`` is one or more ``<metric> <op> <number>`` tests
+    joined by ``and``, or ``otherwise`` for a rule that fires when no other
+    rule does. Messages may use ``str.format`` fields such as
+    ``{today.sugar_g:.1f}``. Evaluation tests every user at once with one
+    vectorized comparison per condition. ``aggregates_used`` lists the only
+    aggregate columns the rules read, so callers can skip the rest.
+    """
+
+    def __init__(self, rules: List[Dict]):
+        self.rules: List[InsightRule] = []
+        used: Set[int] = set()
+        seen = set()
+        for position, rule in enumerate(rules):
+            rule_id = rule.get("id") or f"rule_{position + 1}"
+            if rule_id in seen:
+                raise InsightRuleError(f"Duplicate insight rule id {rule_id!r}")
+            seen.add(rule_id)
+            if not isinstance(rule.get("message"), str) or not isinstance(rule.get("when"), str):
+                raise InsightRuleError(f"Insight rule {rule_id!r} needs a 'when' and a 'message'")
+            otherwise = rule["when"].strip() == OTHERWISE
+            conditions = [] if otherwise else [self._compile_condition(rule_id, part)
+                                               for part in rule["when"].split(" and ")]
+            compiled = InsightRule(rule_id, rule["message"], conditions, otherwise)
+            used.update(_aggregate_for(METRICS[index]) for index, _, _ in conditions)
+            for _, field, _, _ in Formatter().parse(rule["message"]):
+                if field in METRICS:
+                    used.add(_aggregate_for(field))
+            try:
+                self._format(compiled, _namespaces(np.zeros(len(METRICS))))
+            except (AttributeError, KeyError, IndexError, ValueError) as e:
+                raise InsightRuleError(f"Insight rule {rule_id!r} has a bad message: {e}")
+            self.rules.append(compiled)
+        self._regular = np.array([not rule.otherwise for rule in self.rules], dtype=bool)
+        self.aggregates_used = sorted(used)
+
+    @staticmethod
+    def _compile_condition(rule_id: str, condition: str) -> Tuple[int, Callable, float]:
+        match = _CONDITION.match(condition)
+        if not match:
+            raise InsightRuleError(f"Insight rule {rule_id!r}: can't parse {condition.strip()!r}")
+        metric, symbol, threshold = match.groups()
+        if metric not in METRICS:
+            raise InsightRuleError(f"Insight rule {rule_id!r}: unknown metric {metric!r}; choose from {', '.join(METRICS)}")
+        return METRICS.index(metric), _OPERATORS[symbol], float(threshold)
+
+    @staticmethod
+    def _format(rule: InsightRule, namespaces: Dict[str, SimpleNamespace]) -> str:
+        return rule.message.format(**namespaces) if rule.templated else rule.message
+
+    def evaluate(self, metrics: np.ndarray) -> np.ndarray:
+        """Boolean matrix of which rules fire, one row per metric row"""
+        fired = np.zeros((metrics.shape[0], len(self.rules)), dtype=bool)
+        for column, rule in enumerate(self.rules):
+            if rule.otherwise:
+                continue
+            hit = np.ones(metrics.shape[0], dtype=bool)
+            for index, op, threshold in rule.conditions:
+                hit &= op(metrics[:, index], threshold)
+            fired[:, column] = hit
+        if not self._regular.all():
+            quiet = ~fired[:, self._regular].any(axis=1)
+            fired[:, ~self._regular] = quiet[:, None]
+        return fired
+
+    def _row_insights(self, aggregates: List[float]) -> List[str]:
+        """Scalar path for a single user, where array overhead would dominate"""
+        week = len(INSIGHT_FIELDS)
+        metrics = aggregates + [value / WEEK_DAYS for value in aggregates[week:]]
+        fired = [not rule.otherwise and all(op(metrics[index], threshold) for index, op, threshold in rule.conditions)
+                 for rule in self.rules]
+        if not any(fired):
+            fired = [rule.otherwise for rule in self.rules]
+        namespaces = None
+        messages = []
+        for rule, hit in zip(self.rules, fired):
+            if hit:
+                if rule.templated and namespaces is None:
+                    namespaces = _namespaces(metrics)
+                messages.append(self._format(rule, namespaces))
+        return messages
+
+    def insights(self, aggregates: np.ndarray) -> List[List[str]]:
+        """Insight messages for each row of an aggregate matrix (columns as AGGREGATES)"""
+        if aggregates.shape[0] == 1:
+            return [self._row_insights(aggregates[0].tolist())]
+        metrics = metric_matrix(aggregates)
+        fired = self.evaluate(metrics)
+        results = []
+        for row in range(metrics.shape[0]):
+            namespaces: Optional[Dict[str, SimpleNamespace]] = None
+            messages = []
+            for column in np.flatnonzero(fired[row]):
+                rule = self.rules[column]
+                if rule.templated and namespaces is None:
+                    namespaces = _namespaces(metrics[row].tolist())
+                messages.append(self._format(rule, namespaces))
+            results.append(messages)
+        return results
+
+
+def load_rules(path: str = INSIGHT_RULES_FILE) -> RuleSet:
+    with open(path) as f:
+        config = json.load(f)
+    return RuleSet(config.get("rules", []))
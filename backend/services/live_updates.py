@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from services.metrics import REGISTRY
+
+# Open live streams allowed in total and per user; more are answered with 429
+LIVE_MAX_CONNECTIONS = int(os.getenv("LIVE_MAX_CONNECTIONS", "1000"))
+LIVE_MAX_PER_USER = int(os.getenv("LIVE_MAX_PER_USER", "5"))
+
+# Seconds between keep-alive comments on an idle stream
+LIVE_HEARTBEAT_S = float(os.getenv("LIVE_HEARTBEAT_S", "15"))
+
+# Changes buffered for a slow stream before it is told to resync instead
+LIVE_MAX_PENDING = 32
+
+# Clients reconnect after this many milliseconds when a stream drops
+LIVE_RETRY_MS = 5000
+
+LIVE_CONNECTIONS = REGISTRY.gauge(
+    "snapdrink_live_connections",
+    "Open live dashboard streams",
+)
+LIVE_REJECTED = REGISTRY.counter(
+    "snapdrink_live_rejected_total",
+    "Live streams refused by connection limits, by reason",
+    labels=("reason",),
+)
+LIVE_EVENTS = REGISTRY.counter(
+    "snapdrink_live_events_total",
+    "Events sent on live streams, by type",
+    labels=("event",),
+)
+LIVE_PUBLISHED = REGISTRY.counter(
+    "snapdrink_live_published_total",
+    "Changes published for users with at least one live stream",
+)
+
+
+class TooManyConnections(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def sse_frame(event: str, data: Dict, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, default=str, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscription:
+    """One open stream: changes not yet sent, and the insights it last saw"""
+
+    def __init__(self, user_id: str, max_pending: int = LIVE_MAX_PENDING):
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.changes: List[Dict] = []
+        self.resync = False
+        self.insights: List[str] = []
+        self.sequence = 0
+        self._wake = asyncio.Event()
+
+    def push(self, change: Dict):
+        if len(self.changes) >= self.max_pending:
+            # Too far behind for a change list to be useful; send a snapshot
+            self.changes = []
+            self.resync = True
+        elif not self.resync:
+            self.changes.append(change)
+        self._wake.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for changes; False when the timeout passed without any"""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._wake.clear()
+        return True
+
+    def drain(self):
+        changes, resync = self.changes, self.resync
+        self.changes, self.resync = [], False
+        return changes, resync
+
+    def next_id(self) -> int:
+        self.sequence += 1
+        return self.sequence
+
+
+class LiveUpdates:
+    """In-process pub/sub fanning user changes out to open dashboard streams.
+
+    Writers call ``publish(user_id, change)`` after their commit. Each open
+    stream buffers the change and, once it wakes, sends one ``update`` event
+    with every buffered change plus fresh daily totals, goal progress and the
+    insights added or removed since its last event. The ``snapshot``
+    callable supplies those, so it runs once per event and only for users
+    with an open stream. Bursts of changes are coalesced into one event.
+    """
+
+    def __init__(self, snapshot: Callable[[str], Dict], max_connections: int = LIVE_MAX_CONNECTIONS,
+                 max_per_user: int = LIVE_MAX_PER_USER, heartbeat_s: float = LIVE_HEARTBEAT_S):
+        self.snapshot = snapshot
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.heartbeat_s = heartbeat_s
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._connections = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    def subscribe(self, user_id: str) -> Subscription:
+        if self._connections >= self.max_connections:
+            LIVE_REJECTED.labels("server_limit").inc()
+            raise TooManyConnections("Too many live connections")
+        subscribers = self._subscribers.setdefault(user_id, set())
+        if len(subscribers) >= self.max_per_user:
+            LIVE_REJECTED.labels("user_limit").inc()
+            raise TooManyConnections("Too many live connections for this user")
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(user_id)
+        subscribers.add(subscription)
+        self._connections += 1
+        LIVE_CONNECTIONS.set(self._connections)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if not subscribers or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+        self._connections -= 1
+        LIVE_CONNECTIONS.set(self._connections)
+
+    def publish(self, user_id: str, change: Dict):
+        """Queue a change for the user's streams; safe to call from any thread"""
+        if user_id not in self._subscribers or self._loop is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(user_id, change)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, user_id, change)
+
+    def _deliver(self, user_id: str, change: Dict):
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return
+        LIVE_PUBLISHED.inc()
+        for subscription in subscribers:
+            subscription.push(change)
+
+    def _snapshot_event(self, subscription: Subscription) -> str:
+        snapshot = self.snapshot(subscription.user_id)
+        subscription.insights = snapshot["insights"]
+        LIVE_EVENTS.labels("snapshot").inc()
+        return sse_frame("snapshot", snapshot, subscription.next_id())
+
+    def _update_event(self, subscription: Subscription, changes: List[Dict]) -> str:
+        snapshot = self.snapshot(subscription.user_id)
+        insights = snapshot.pop("insights")
+        previous = set(subscription.insights)
+        current = set(insights)
+        snapshot["insights"] = {
+            "added": [insight for insight in insights if insight not in previous],
+            "removed": [insight for insight in subscription.insights if insight not in current],
+        }
+        snapshot["changes"] = changes
+        subscription.insights = insights
+        LIVE_EVENTS.labels("update").inc()
+        return sse_frame("update", snapshot, subscription.next_id())
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[str]:
+        """Server-sent events for one subscription, starting with a snapshot"""
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n" + self._snapshot_event(subscription)
+            while True:
+                if not await subscription.wait(self.heartbeat_s):
+                    yield ": keep-alive\n\n"
+                    continue
+                changes, resync = subscription.drain()
+                if resync:
+                    yield self._snapshot_event(subscription)
+                elif changes:
+                    yield self._update_event(subscription, changes)
+        finally:
+            self.unsubscribe(subscription)
+
+
+class LiveStreamResponse(StreamingResponse):
+    """Server-sent events for one subscription, releasing its slot however the response ends.
+
+    The stream generator's own cleanup only runs once it has started; a
+    client that disconnects before the first chunk would otherwise keep
+    its connection slot forever.
+    """
+
+    def __init__(self, live_updates: LiveUpdates, subscription: Subscription):
+        super().__init__(
+            live_updates.stream(subscription),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.live_updates = live_updates
+        self.subscription = subscription
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.live_updates.unsubscribe(self.subscription)
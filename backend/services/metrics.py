@@ -0,0 +1,332 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Prometheus text exposition format, kept dependency-free so the hot path is
+# just a lock, a bisect and a couple of additions per observation.
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def labels(self, *values: str):
+        """Return the child series for the given label values"""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(child.value)}"]
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bucket_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.bucket_bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        bounds = list(self.bucket_bounds) + [float("inf")]
+        for bound, bucket_count in zip(bounds, child.counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric exposed on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "snapdrink_stage_duration_seconds",
+    "Time spent in each stage of drink analysis",
+    labels=("stage",),
+)
+FALLBACK_USAGE = REGISTRY.counter(
+    "snapdrink_fallback_total",
+    "Times a service answered from its local fallback instead of the upstream API",
+    labels=("kind",),
+)
+VISION_RESULTS = REGISTRY.counter(
+    "snapdrink_vision_results_total",
+    "Drink identifications by the tier that produced them (local, cloud or fallback)",
+    labels=("tier",),
+)
+STORAGE_WRITE_BYTES = REGISTRY.histogram(
+    "snapdrink_storage_write_bytes",
+    "Bytes written per document save",
+    labels=("document",),
+    buckets=SIZE_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "snapdrink_http_requests_in_flight",
+    "HTTP requests currently being served",
+    labels=("endpoint",),
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "snapdrink_http_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    labels=("endpoint",),
+)
+
+
+# Stage timings for the request being served, rendered as a Server-Timing header
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Time a block of work and record it under the given stage label"""
+    child = STAGE_LATENCY.labels(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        child.observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def timed(stage: str):
+    """Decorator form of track_stage for synchronous service methods"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def format_server_timing(timings: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """Render stage timings as a Server-Timing header value in milliseconds"""
+    entries = [f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in timings]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+# First path segments that get their own endpoint label; anything else
+# (scanners, typos) is "other", so unknown paths can't mint new series
+ENDPOINT_GROUPS = frozenset({"upload", "admin", "metrics", "health", "ready", "docs", "redoc", "openapi.json"})
+
+
+def endpoint_group(path: str) -> str:
+    """Collapse a request path to a low-cardinality label"""
+    if path.startswith("/user/"):
+        # Live streams stay open for minutes; keep them out of read latency
+        return "live" if path.endswith("/live") else "user"
+    head = path.strip("/").split("/", 1)[0]
+    if not head:
+        return "root"
+    return head if head in ENDPOINT_GROUPS else "other"
+
+
+class MetricsMiddleware:
+    """ASGI middleware tracking in-flight requests and request latency.
+
+    It also collects the stages timed while serving the request and attaches
+    them to the response as a ``Server-Timing`` header. The collected list is
+    left in ``scope["server_timing"]`` for outer middleware.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = endpoint_group(scope.get("path", ""))
+        in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+        timings: List[Tuple[str, float]] = []
+        scope["server_timing"] = timings
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = format_server_timing(timings, time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+            _request_timings.reset(token)
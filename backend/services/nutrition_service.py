@@ -1,13 +1,19 @@
+import asyncio
 import os
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from models.response_models import NutritionData
+from services.metrics import FALLBACK_USAGE
+from services.upstream_transport import LiveTransport, UpstreamTransport
+
+_NUTRITION_FALLBACKS = FALLBACK_USAGE.labels("nutrition_db")
 
 class NutritionService:
-    def __init__(self):
+    def __init__(self, transport: Optional[UpstreamTransport] = None):
+        self.transport = transport or LiveTransport()
         self.nutritionix_app_id = os.getenv('NUTRITIONIX_APP_ID')
         self.nutritionix_app_key = os.getenv('NUTRITIONIX_APP_KEY')
-        self.base_url = "https://trackapi.nutritionix.com/v2"
+        self.base_url = os.getenv('NUTRITIONIX_BASE_URL', "https://trackapi.nutritionix.com/v2")
         
         # Comprehensive nutrition database for common drinks
         self.nutrition_database = {
@@ -33,7 +39,7 @@ class NutritionService:
     async def get_nutrition_info(self, drink_name: str) -> NutritionData:
         """Get nutrition information for a drink"""
         # First try Nutritionix API if available
-        if self.nutritionix_app_id and self.nutritionix_app_key:
+        if self.transport.replays or (self.nutritionix_app_id and self.nutritionix_app_key):
             try:
                 nutrition_data = await self._get_from_nutritionix(drink_name)
                 if nutrition_data:
@@ -42,6 +48,7 @@ class NutritionService:
                 print(f"Nutritionix API failed: {e}")
         
         # Fallback to local database
+        _NUTRITION_FALLBACKS.inc()
         return self._get_from_database(drink_name)
     
     async def _get_from_nutritionix(self, drink_name: str) -> NutritionData:
@@ -57,15 +64,16 @@ class NutritionService:
             "num_servings": 1
         }
         
-        response = requests.post(
-            f"{self.base_url}/natural/nutrients",
-            headers=headers,
-            json=data,
-            timeout=10
-        )
+        def post():
+            response = requests.post(f"{self.base_url}/natural/nutrients", headers=headers, json=data, timeout=10)
+            return {"status_code": response.status_code,
+                    "body": response.json() if response.status_code == 200 else None}
+        
+        # requests blocks, so the call runs off the event loop
+        response = await asyncio.to_thread(self.transport.call, "nutritionix", data, post)
         
-        if response.status_code == 200:
-            result = response.json()
+        if response["status_code"] == 200:
+            result = response["body"]
             if result.get('foods'):
                 food = result['foods'][0]
                 return NutritionData(
@@ -0,0 +1,174 @@
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from services.metrics import endpoint_group
+
+
+class _StackSampler:
+    """Samples the stack of one thread at a fixed interval.
+
+    Produces collapsed stacks ("frame;frame;frame count") that flame graph
+    tools read directly. Cheaper than cProfile because the profiled thread
+    is never traced, only inspected from the outside.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class SlowRequestProfiler:
+    """ASGI middleware that profiles requests and keeps the slow ones.
+
+    Opt-in through environment variables:
+
+    - ``PROFILE_SLOW_REQUESTS_MS``: latency threshold; unset disables profiling
+    - ``PROFILE_DIR``: where profiles are written (default ``profiles``)
+    - ``PROFILER``: ``cprofile`` (default) or ``sampling``
+    - ``PROFILE_SAMPLE_RATE``: fraction of requests to profile (default 1.0)
+
+    A request has to be profiled before we know whether it will be slow, so
+    profiling starts on every sampled request and the result is written only
+    if the request crossed the threshold. Only one request is profiled at a
+    time; concurrent requests run unprofiled. Both profilers watch the event
+    loop thread, so interleaved requests can show up in the same profile.
+    """
+
+    def __init__(self, app, threshold_ms: Optional[float] = None, output_dir: Optional[str] = None,
+                 profiler: Optional[str] = None, sample_rate: Optional[float] = None,
+                 sampling_interval: float = 0.005):
+        self.app = app
+        if threshold_ms is None and os.getenv('PROFILE_SLOW_REQUESTS_MS'):
+            threshold_ms = float(os.getenv('PROFILE_SLOW_REQUESTS_MS'))
+        self.threshold_ms = threshold_ms
+        self.output_dir = output_dir or os.getenv('PROFILE_DIR', 'profiles')
+        self.profiler = profiler or os.getenv('PROFILER', 'cprofile')
+        if self.profiler not in ('cprofile', 'sampling'):
+            raise ValueError(f"Unknown profiler {self.profiler!r}, expected 'cprofile' or 'sampling'")
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('PROFILE_SAMPLE_RATE', '1.0'))
+        self.sampling_interval = sampling_interval
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms is not None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        # A live stream would hold the profiler for as long as it stays open
+        if endpoint_group(scope.get("path", "")) == "live":
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": None}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        profile = self._start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._stop(profile)
+            try:
+                if profile is not None and elapsed_ms >= self.threshold_ms:
+                    self._dump(profile, scope, status["code"], elapsed_ms)
+            finally:
+                self._busy.release()
+
+    def _start(self):
+        if self.profiler == 'sampling':
+            sampler = _StackSampler(threading.get_ident(), self.sampling_interval)
+            sampler.start()
+            return sampler
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) already owns the hook
+            return None
+        return profile
+
+    def _stop(self, profile):
+        if profile is None:
+            return
+        if isinstance(profile, _StackSampler):
+            profile.stop()
+        else:
+            profile.disable()
+
+    def _dump(self, profile, scope, status_code: Optional[int], elapsed_ms: float):
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', scope.get("path", "")).strip('_') or 'root'
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        base = os.path.join(self.output_dir, f"{stamp}_{scope.get('method', 'GET')}_{slug}_{int(elapsed_ms)}ms")
+
+        if isinstance(profile, _StackSampler):
+            profile_path = base + ".folded"
+            profile.dump(profile_path)
+        else:
+            profile_path = base + ".prof"
+            profile.dump_stats(profile_path)
+
+        metadata = {
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "query_string": scope.get("query_string", b"").decode("latin-1"),
+            "status_code": status_code,
+            "duration_ms": round(elapsed_ms, 3),
+            "threshold_ms": self.threshold_ms,
+            "profiler": self.profiler,
+            "profile_file": os.path.basename(profile_path),
+            "server_timing": [
+                {"stage": stage, "duration_ms": round(elapsed * 1000, 3)}
+                for stage, elapsed in scope.get("server_timing", [])
+            ],
+            "pid": os.getpid(),
+            "recorded_at": datetime.now().isoformat(),
+        }
+        with open(base + ".json", 'w') as f:
+            json.dump(metadata, f, indent=2)
@@ -0,0 +1,363 @@
+import asyncio
+import os
+import threading
+import traceback
+import uuid
+from collections import Counter
+from itertools import chain, islice
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from services.drink_columns import StringTable, UserDrinkColumns, day_bounds
+from services.drink_history_service import DrinkHistoryService
+from services.drink_segments import SegmentIndex, SegmentStore
+from services.metrics import timed
+from services.storage import JSONFileStorage, StorageBackend
+from services.user_service import UserService
+
+DAY_MICROS = 86_400_000_000
+
+# Users folded into the report between two checkpoints
+REPORT_CHUNK_USERS = int(os.getenv("REPORT_CHUNK_USERS", "1000"))
+
+# Users whose history is copied per trip to the event loop during a live scan
+REPORT_SNAPSHOT_USERS = 200
+
+# Per-user daily averages are kept as fixed-width histograms, so the report
+# state stays the same size however many users are scanned
+DAILY_HISTOGRAMS = {
+    "calories": 50.0,
+    "sugar_g": 5.0,
+    "caffeine_mg": 25.0,
+    "water_ml": 100.0,
+}
+HISTOGRAM_BUCKETS = 200
+
+
+class FleetReport:
+    """Running fleet-wide aggregates, folded in one user at a time"""
+
+    def __init__(self, start_date: date, end_date: date, state: Optional[Dict] = None):
+        self.start_date = start_date
+        self.end_date = end_date
+        state = state or {}
+        self.users = state.get("users", 0)
+        self.active_users = state.get("active_users", 0)
+        self.drinks = state.get("drinks", 0)
+        self.drink_counts = Counter(state.get("drink_counts", {}))
+        self.daily = {
+            field: {
+                "sum": 0.0, "users": 0,
+                "histogram": [0] * HISTOGRAM_BUCKETS,
+                **state.get("daily", {}).get(field, {}),
+            }
+            for field in DAILY_HISTOGRAMS
+        }
+        self.goals = {goal_type: dict(counts) for goal_type, counts in state.get("goals", {}).items()}
+
+    def add_history(self, columns: Optional[UserDrinkColumns]):
+        """Fold one user's drinks within the report window into the aggregates"""
+        if columns is None:
+            return
+        lo, hi = columns.range_for(*day_bounds(self.start_date, self.end_date))
+        # Sources hand over columns nothing else mutates, so NumPy can view them in place
+        timestamps = np.frombuffer(columns.timestamps, dtype=np.int64)[lo:hi]
+        if not len(timestamps):
+            return
+        start_micros = day_bounds(self.start_date, self.start_date)[0]
+        active_days = len(np.unique((timestamps - start_micros) // DAY_MICROS))
+
+        self.active_users += 1
+        self.drinks += hi - lo
+        self.drink_counts.update(columns.name_counts(lo, hi))
+        for field, width in DAILY_HISTOGRAMS.items():
+            average = columns.total(field, lo, hi) / active_days
+            daily = self.daily[field]
+            daily["sum"] += average
+            daily["users"] += 1
+            daily["histogram"][min(int(average // width), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def add_profile(self, profile: Dict):
+        """Fold one user's goal state into the achievement rates"""
+        self.users += 1
+        for goal in profile.get("daily_goals", []):
+            goal_type = getattr(goal.get("type"), "value", goal.get("type"))
+            counts = self.goals.setdefault(goal_type, {"total": 0, "achieved": 0})
+            counts["total"] += 1
+            counts["achieved"] += 1 if goal.get("is_achieved") else 0
+
+    def state(self) -> Dict:
+        return {
+            "users": self.users,
+            "active_users": self.active_users,
+            "drinks": self.drinks,
+            "drink_counts": dict(self.drink_counts),
+            "daily": self.daily,
+            "goals": self.goals,
+        }
+
+    def summary(self, top_drinks: int = 10) -> Dict:
+        daily = {}
+        for field, width in DAILY_HISTOGRAMS.items():
+            stats = self.daily[field]
+            daily[field] = {
+                "mean": round(stats["sum"] / stats["users"], 2) if stats["users"] else 0.0,
+                "p50": _histogram_percentile(stats["histogram"], width, 0.5),
+                "p90": _histogram_percentile(stats["histogram"], width, 0.9),
+            }
+        total_goals = sum(counts["total"] for counts in self.goals.values())
+        achieved_goals = sum(counts["achieved"] for counts in self.goals.values())
+        return {
+            "period": f"{self.start_date} to {self.end_date}",
+            "users": self.users,
+            "active_users": self.active_users,
+            "total_drinks": self.drinks,
+            "top_drinks": [{"name": name, "count": count} for name, count in self.drink_counts.most_common(top_drinks)],
+            "avg_daily_per_active_user": daily,
+            "goal_achievement": {
+                "overall_rate": round(achieved_goals / total_goals, 4) if total_goals else 0.0,
+                "by_type": {
+                    goal_type: {**counts, "rate": round(counts["achieved"] / counts["total"], 4) if counts["total"] else 0.0}
+                    for goal_type, counts in sorted(self.goals.items())
+                },
+            },
+        }
+
+
+def _histogram_percentile(histogram: List[int], width: float, quantile: float) -> float:
+    """Upper edge of the bucket holding the given quantile"""
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    running = 0
+    for index, count in enumerate(histogram):
+        running += count
+        if running >= quantile * total:
+            return (index + 1) * width
+    return len(histogram) * width
+
+
+# A source is called with the report window and the event loop the report was
+# started from (None when run without one), and yields (user_id, item) pairs
+# in a stable order, so a checkpointed position can be resumed by skipping
+# that many pairs
+Source = Callable[[date, date, Optional[asyncio.AbstractEventLoop]], Iterator[Tuple[str, object]]]
+
+
+def on_loop(loop: Optional[asyncio.AbstractEventLoop], function: Callable, *args):
+    """Call ``function`` on the event loop and wait for its result; directly when there is no loop"""
+    if loop is None:
+        return function(*args)
+
+    async def call():
+        return function(*args)
+
+    return asyncio.run_coroutine_threadsafe(call(), loop).result()
+
+
+def live_sources(drink_history_service: DrinkHistoryService, user_service: UserService) -> Dict[str, Source]:
+    """Scan the in-memory services of a running app.
+
+    The services are only mutated on the event loop, so everything the
+    report thread reads is copied there, a batch of users at a time.
+    """
+    def profiles(start_date: date, end_date: date, loop: Optional[asyncio.AbstractEventLoop]):
+        return iter(on_loop(loop, lambda: list(user_service.users_data.items())))
+
+    def history(start_date: date, end_date: date, loop: Optional[asyncio.AbstractEventLoop]):
+        # Cold months in the window are read for the report without being cached
+        bounds = day_bounds(start_date, end_date)
+
+        def snapshot(user_ids: List[str]) -> List[Tuple[str, Optional[UserDrinkColumns]]]:
+            return [(user_id, drink_history_service.columns_for_range(user_id, *bounds)) for user_id in user_ids]
+
+        user_ids = on_loop(loop, drink_history_service.user_ids)
+        for start in range(0, len(user_ids), REPORT_SNAPSHOT_USERS):
+            yield from on_loop(loop, snapshot, user_ids[start:start + REPORT_SNAPSHOT_USERS])
+
+    return {
+        "profiles": profiles,
+        "history": history,
+    }
+
+
+def storage_sources(storage: StorageBackend, segments_dir: str) -> Dict[str, Source]:
+    """Stream the documents and cold segments from storage, holding one user at a time"""
+    def history(start_date: date, end_date: date, loop: Optional[asyncio.AbstractEventLoop]):
+        names, tips = StringTable(), StringTable()
+        index = SegmentIndex(storage.load(DrinkHistoryService.SEGMENTS_DOCUMENT))
+        segments = SegmentStore(segments_dir)
+        bounds = day_bounds(start_date, end_date)
+
+        def cold_entries(user_id: str):
+            deleted = set(index.deleted(user_id))
+            for month in index.overlapping(user_id, *bounds):
+                for entry in segments.read(user_id, month, index.months(user_id)[month]):
+                    if entry.get('id') not in deleted:
+                        yield entry
+
+        hot_users = set()
+        for user_id, entries in storage.iter_entries(DrinkHistoryService.DRINKS_DOCUMENT):
+            hot_users.add(user_id)
+            yield user_id, UserDrinkColumns.from_entries(user_id, chain(entries, cold_entries(user_id)), names, tips)
+        for user_id in index.users:
+            if user_id not in hot_users:
+                yield user_id, UserDrinkColumns.from_entries(user_id, cold_entries(user_id), names, tips)
+
+    return {
+        "profiles": lambda start_date, end_date, loop: UserService.iter_stored_users(storage),
+        "history": history,
+    }
+
+
+class ReportingService:
+    """Runs checkpointed fleet-wide reports over all users"""
+
+    PHASES = ("profiles", "history")
+
+    def __init__(self, sources: Dict[str, Source], reports_dir: str = os.path.join("data", "reports"),
+                 chunk_size: int = REPORT_CHUNK_USERS, recover: bool = True):
+        self.sources = sources
+        # Without recovery when another process (the server) also writes reports here
+        self.storage = JSONFileStorage(reports_dir, recover=recover)
+        self.reports_dir = reports_dir
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._running: Optional[threading.Thread] = None
+        # The loop of the app whose services the sources read; set when a report is spawned from it
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _document(self, report_id: str) -> str:
+        return f"{report_id}.json"
+
+    def get_report(self, report_id: str) -> Optional[Dict]:
+        """Get a report's status, progress and (once finished) result"""
+        if not report_id.isalnum():
+            return None
+        report = self.storage.load(self._document(report_id))
+        return report or None
+
+    def list_reports(self) -> List[Dict]:
+        """List known reports, newest first, without their results"""
+        reports = []
+        for entry in os.listdir(self.reports_dir):
+            if entry.endswith(".json"):
+                report = self.storage.load(entry)
+                reports.append({key: report.get(key) for key in ("id", "status", "params", "progress", "updated_at")})
+        return sorted(reports, key=lambda r: r.get("updated_at") or "", reverse=True)
+
+    def create_report(self, days: int = 30, top_drinks: int = 10, end_date: Optional[date] = None) -> Dict:
+        """Create a pending report; run it with ``run`` or ``start``"""
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        end_date = end_date or date.today()
+        report = {
+            "id": uuid.uuid4().hex[:12],
+            "status": "pending",
+            "params": {
+                "start_date": (end_date - timedelta(days=days - 1)).isoformat(),
+                "end_date": end_date.isoformat(),
+                "top_drinks": top_drinks,
+            },
+            "progress": {"phase": self.PHASES[0], "position": 0, "last_user_id": None},
+            "state": None,
+            "result": None,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+        }
+        self.storage.save(self._document(report["id"]), report)
+        return report
+
+    def submit(self, days: int = 30, top_drinks: int = 10) -> Dict:
+        """Create a report and run it on a background thread"""
+        with self._lock:
+            self._check_idle()
+            report = self.create_report(days, top_drinks)
+            self._spawn(report["id"])
+        return report
+
+    def start(self, report_id: str) -> Dict:
+        """Run (or resume) an existing report on a background thread"""
+        with self._lock:
+            self._check_idle()
+            report = self.get_report(report_id)
+            if report is None:
+                raise KeyError(report_id)
+            self._spawn(report_id)
+        return report
+
+    def _check_idle(self):
+        # One report at a time keeps the scan from competing with itself for the GIL
+        if self._running is not None and self._running.is_alive():
+            raise RuntimeError("Another report is already running")
+
+    def _spawn(self, report_id: str):
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self._running = threading.Thread(target=self.run, args=(report_id,), name=f"report-{report_id}", daemon=True)
+        self._running.start()
+
+    @timed("reports.run")
+    def run(self, report_id: str) -> Dict:
+        """Run (or resume) a report to completion, checkpointing after every chunk"""
+        report = self.get_report(report_id)
+        if report is None:
+            raise KeyError(report_id)
+        if report["status"] == "completed":
+            return report
+
+        params = report["params"]
+        aggregate = FleetReport(date.fromisoformat(params["start_date"]), date.fromisoformat(params["end_date"]),
+                                report["state"])
+        progress = report["progress"]
+        report["status"] = "running"
+        self._checkpoint(report, aggregate)
+
+        try:
+            for phase in self.PHASES[self.PHASES.index(progress["phase"]):]:
+                if progress["phase"] != phase:
+                    progress.update({"phase": phase, "position": 0, "last_user_id": None})
+                self._scan(report, phase, aggregate)
+            report["status"] = "completed"
+            report["result"] = aggregate.summary(params["top_drinks"])
+        except Exception as e:
+            print(f"Report {report_id} failed: {e}")
+            traceback.print_exc()
+            report["status"] = "failed"
+            report["error"] = str(e)
+        self._checkpoint(report, aggregate)
+        return report
+
+    def _scan(self, report: Dict, phase: str, aggregate: FleetReport):
+        progress = report["progress"]
+        fold = aggregate.add_profile if phase == "profiles" else aggregate.add_history
+        loop = self._loop if threading.current_thread() is self._running else None
+        entries = self.sources[phase](aggregate.start_date, aggregate.end_date, loop)
+
+        # Skip what an earlier run already folded in
+        skipped = None
+        for skipped, _ in islice(entries, progress["position"]):
+            pass
+        if progress["position"] and skipped != progress["last_user_id"]:
+            raise RuntimeError(f"Data changed since the checkpoint at user {progress['last_user_id']}; "
+                               "start a new report")
+
+        in_chunk = 0
+        for user_id, item in entries:
+            fold(item)
+            progress["position"] += 1
+            progress["last_user_id"] = user_id
+            in_chunk += 1
+            if in_chunk == self.chunk_size:
+                self._checkpoint(report, aggregate)
+                in_chunk = 0
+
+    def _checkpoint(self, report: Dict, aggregate: FleetReport):
+        report["state"] = aggregate.state()
+        report["updated_at"] = datetime.now().isoformat()
+        self.storage.save(self._document(report["id"]), report)
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import anyio
+
+from services.metrics import track_stage
+
+# "background" loads data stores and SDK clients on a thread right after
+# startup; "off" leaves everything to the first request that needs it
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+
+# Paths served without touching the data stores
+LIVENESS_PATHS = frozenset(("/", "/health", "/ready", "/metrics"))
+
+
+class Lazy:
+    """Proxy that builds its target on first attribute access.
+
+    Attribute reads and writes are forwarded to the target, so the proxy can
+    stand in for a service anywhere, including inside a ``UnitOfWork``.
+    """
+
+    def __init__(self, name: str, factory: Callable):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "load_seconds", None)
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def get(self):
+        target = self._target
+        if target is None:
+            with self._lock:
+                target = self._target
+                if target is None:
+                    start = time.perf_counter()
+                    with track_stage(f"startup.{self._name}"):
+                        target = self._factory()
+                    object.__setattr__(self, "load_seconds", time.perf_counter() - start)
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self.get(), name, value)
+
+
+class Startup:
+    """Tracks the lazily built parts of the app and warms them up.
+
+    Data stores gate readiness: ``/ready`` answers 503 until every store is
+    loaded. SDK clients are warmed too, but a missing or slow SDK only costs
+    the first upload that needs it.
+    """
+
+    def __init__(self):
+        self.stores: List[Lazy] = []
+        self.clients: Dict[str, Callable] = {}
+        self.started_at = time.perf_counter()
+        self.warm_up_error: Optional[str] = None
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+    def store(self, name: str, factory: Callable) -> Lazy:
+        lazy = Lazy(name, factory)
+        self.stores.append(lazy)
+        return lazy
+
+    def client(self, name: str, setup: Callable):
+        """Register an SDK client setup to run during warm-up"""
+        self.clients[name] = setup
+
+    @property
+    def ready(self) -> bool:
+        return all(store.loaded for store in self.stores)
+
+    def load_stores(self):
+        for store in self.stores:
+            store.get()
+
+    def warm_up(self):
+        try:
+            self.load_stores()
+            for name, setup in self.clients.items():
+                with track_stage(f"startup.{name}"):
+                    setup()
+        except Exception as e:
+            print(f"Warm-up failed: {e}")
+            self.warm_up_error = str(e)
+
+    def start_warm_up(self, mode: str = STARTUP_WARMUP):
+        if mode == "background" and self._warm_up_thread is None:
+            self._warm_up_thread = threading.Thread(target=self.warm_up, name="warm-up", daemon=True)
+            self._warm_up_thread.start()
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "uptime_s": round(time.perf_counter() - self.started_at, 3),
+            "stores": {
+                store._name: {"loaded": store.loaded, "load_s": round(store.load_seconds, 3) if store.loaded else None}
+                for store in self.stores
+            },
+            "warm_up_error": self.warm_up_error,
+        }
+
+
+class LazyStartupMiddleware:
+    """ASGI middleware that loads the data stores before the first request needing them.
+
+    Loading runs on a worker thread, so the event loop keeps answering
+    liveness and readiness probes while a large history is parsed.
+    """
+
+    def __init__(self, app, startup: Startup):
+        self.app = app
+        self.startup = startup
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not self.startup.ready and scope["path"] not in LIVENESS_PATHS:
+            await anyio.to_thread.run_sync(self.startup.load_stores)
+        await self.app(scope, receive, send)
@@ -0,0 +1,190 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+from services.metrics import STORAGE_WRITE_BYTES, timed
+
+
+class EntryDocument:
+    """A top-level JSON object produced entry by entry when it is saved.
+
+    Services whose in-memory form is not plain JSON (such as the columnar
+    drink history) hand one of these to the storage backend, so the full
+    document is never materialized at once.
+    """
+
+    def __init__(self, entries: Callable[[], Iterable[Tuple[str, Any]]]):
+        self._entries = entries
+
+    def items(self) -> Iterable[Tuple[str, Any]]:
+        return self._entries()
+
+
+class StorageBackend(ABC):
+    """Interface for the document store shared by the data services"""
+
+    @abstractmethod
+    def load(self, name: str) -> Any:
+        """Load a document, returning an empty dict if it does not exist"""
+
+    def iter_entries(self, name: str) -> Iterator[Tuple[str, Any]]:
+        """Yield the top-level (key, value) pairs of a document"""
+        yield from self.load(name).items()
+
+    @abstractmethod
+    def save(self, name: str, data: Any):
+        """Persist a single document (a JSON value or an EntryDocument)"""
+
+    def save_many(self, documents: Dict[str, Any]):
+        """Persist several documents as one commit"""
+        for name, data in documents.items():
+            self.save(name, data)
+
+
+class JSONFileStorage(StorageBackend):
+    """Stores each document as a JSON file inside the data directory.
+
+    Single saves go through a temp file and an atomic rename, so a crash never
+    leaves a half-written document behind. ``save_many`` stages every document
+    to a temp file first and records the pending renames in a small journal;
+    the journal is the commit point and is replayed on startup if the process
+    died while applying it. Other writers under the data directory (user
+    shards, cold segments, weekly reports) use the same temp suffix, so
+    startup recovery clears their leftovers too.
+
+    An ``EntryDocument`` is written one top-level entry per line, which lets
+    ``iter_entries`` read it back without parsing the whole file at once.
+
+    Opening a directory that another process is writing, such as a report
+    run beside the server, must pass ``recover=False``: recovery would apply
+    or delete that process's in-flight journal and temp files.
+    """
+
+    JOURNAL_NAME = ".commit_journal.json"
+    TEMP_SUFFIX = ".pending"
+
+    def __init__(self, data_dir: str = "data", recover: bool = True):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.journal_file = os.path.join(data_dir, self.JOURNAL_NAME)
+        if recover:
+            self._recover()
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    def load(self, name: str) -> Any:
+        try:
+            with open(self.path_for(name), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def iter_entries(self, name: str) -> Iterator[Tuple[str, Any]]:
+        try:
+            f = open(self.path_for(name), 'r')
+        except FileNotFoundError:
+            return
+        with f:
+            first = f.readline()
+            pending = f.readline() if first.rstrip("\n") == "{" else ""
+            if pending[:1].isspace():
+                # Indented output from json.dump(indent=...), not one entry per line
+                pending = ""
+            try:
+                entry = self._parse_entry_line(pending) if pending else None
+            except ValueError:
+                entry = None
+            if entry is None:
+                # Not written one entry per line (e.g. indented JSON); parse it whole
+                f.seek(0)
+                yield from json.load(f).items()
+                return
+
+            yield entry
+            for line in f:
+                if line.strip() == "}":
+                    return
+                yield self._parse_entry_line(line)
+
+    def _parse_entry_line(self, line: str) -> Tuple[str, Any]:
+        line = line.strip().rstrip(",")
+        entry = json.loads("{" + line + "}")
+        if len(entry) != 1:
+            raise ValueError("Expected exactly one entry per line")
+        return next(iter(entry.items()))
+
+    @timed("storage.save")
+    def save(self, name: str, data: Any):
+        path = self.path_for(name)
+        temp_path = path + self.TEMP_SUFFIX
+        self._write_file(temp_path, self._encode(name, data), sync=False)
+        os.replace(temp_path, path)
+
+    @timed("storage.save_many")
+    def save_many(self, documents: Dict[str, Any]):
+        if len(documents) <= 1:
+            for name, data in documents.items():
+                self.save(name, data)
+            return
+
+        for name, data in documents.items():
+            temp_path = self.path_for(name) + self.TEMP_SUFFIX
+            self._write_file(temp_path, self._encode(name, data), sync=True)
+
+        # Commit point: once the journal is on disk the batch will be applied
+        names = list(documents)
+        self._write_file(self.journal_file, [json.dumps(names).encode()], sync=True)
+        self._apply_renames(names)
+        os.remove(self.journal_file)
+
+    def _encode(self, name: str, data: Any) -> Iterator[bytes]:
+        written = 0
+        for chunk in self._encode_chunks(data):
+            payload = chunk.encode()
+            written += len(payload)
+            yield payload
+        STORAGE_WRITE_BYTES.labels(name).observe(written)
+
+    def _encode_chunks(self, data: Any) -> Iterator[str]:
+        if not isinstance(data, EntryDocument):
+            yield json.dumps(data, indent=2, default=str)
+            return
+        yield "{"
+        separator = "\n"
+        for key, value in data.items():
+            yield separator + json.dumps(key) + ":" + json.dumps(value, separators=(",", ":"), default=str)
+            separator = ",\n"
+        yield "\n}\n"
+
+    def _write_file(self, path: str, payload: Iterable[bytes], sync: bool):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'wb') as f:
+            f.writelines(payload)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _apply_renames(self, names):
+        for name in names:
+            path = self.path_for(name)
+            if os.path.exists(path + self.TEMP_SUFFIX):
+                os.replace(path + self.TEMP_SUFFIX, path)
+
+    def _recover(self):
+        """Finish a committed batch or discard an uncommitted one"""
+        if os.path.exists(self.journal_file):
+            try:
+                with open(self.journal_file, 'r') as f:
+                    names = json.load(f)
+            except ValueError:
+                # The journal itself was torn, so the batch never committed
+                names = []
+            self._apply_renames(names)
+            os.remove(self.journal_file)
+
+        # Temp files of writes cut short, in every directory written under data_dir
+        for directory, _, files in os.walk(self.data_dir):
+            for entry in files:
+                if entry.endswith(self.TEMP_SUFFIX):
+                    os.remove(os.path.join(directory, entry))
@@ -0,0 +1,62 @@
+from typing import Any, Dict
+
+
+class UnitOfWork:
+    """Groups the writes of several services into a single storage commit.
+
+    While the unit of work is open, participating services stage their
+    documents here instead of writing them. Leaving the block commits every
+    staged document through ``StorageBackend.save_many``; an exception rolls
+    the services back to what is on disk.
+
+        with UnitOfWork(user_service, drink_history_service):
+            user_service.update_goals_from_drink(user_id, nutrition)
+            drink_history_service.add_drink(user_id, name, nutrition, tip)
+    """
+
+    def __init__(self, *services):
+        if not services:
+            raise ValueError("UnitOfWork needs at least one service")
+        storages = {id(service.storage) for service in services}
+        if len(storages) != 1:
+            raise ValueError("All services in a unit of work must share one storage backend")
+        self.services = services
+        self.storage = services[0].storage
+        self._staged: Dict[str, Any] = {}
+
+    def stage(self, name: str, data: Any):
+        """Record a document to be written when the unit of work commits"""
+        self._staged[name] = data
+
+    def commit(self):
+        if self._staged:
+            self.storage.save_many(self._staged)
+            self._staged = {}
+
+    def rollback(self):
+        self._staged = {}
+        for service in self.services:
+            service._load_data()
+
+    def __enter__(self):
+        for service in self.services:
+            if service._unit_of_work is not None:
+                raise RuntimeError(f"{type(service).__name__} is already part of a unit of work")
+        for service in self.services:
+            service._unit_of_work = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                try:
+                    self.commit()
+                except Exception:
+                    self.rollback()
+                    raise
+            else:
+                self.rollback()
+        finally:
+            for service in self.services:
+                service._unit_of_work = None
+        return False
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from services.metrics import REGISTRY
+
+# How upstream calls are made: live, record (live, and saved to the cassette) or replay (from the cassette only)
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live")
+
+# NDJSON file of recorded upstream exchanges; defaults to upstream_cassette.ndjson in the data directory
+UPSTREAM_CASSETTE = os.getenv("UPSTREAM_CASSETTE")
+
+# Replay delay per call: "recorded" sleeps the recorded latency, a number sleeps that many milliseconds
+UPSTREAM_REPLAY_LATENCY = os.getenv("UPSTREAM_REPLAY_LATENCY", "recorded")
+
+# Seeds the random fallbacks (drink guesses, canned health tips); unset keeps them unseeded
+FALLBACK_SEED = os.getenv("FALLBACK_SEED")
+
+UPSTREAM_MODES = ("live", "record", "replay")
+
+UPSTREAM_REPLAYS = REGISTRY.counter(
+    "snapdrink_upstream_replays_total",
+    "Upstream calls answered from the cassette, by upstream and whether a recording matched",
+    labels=("upstream", "outcome"),
+)
+
+
+def fallback_rng(name: str, seed: Optional[str] = FALLBACK_SEED) -> random.Random:
+    """Random source for one service's fallbacks; seeded per service so they don't share a sequence"""
+    return random.Random(f"{seed}:{name}") if seed is not None else random.Random()
+
+
+def request_key(upstream: str, request: Dict) -> str:
+    """Stable identity of an upstream request, independent of key order"""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{upstream}\n{canonical}".encode()).hexdigest()
+
+
+class UpstreamError(RuntimeError):
+    """A recorded upstream failure, raised again on replay"""
+
+
+class ReplayMiss(LookupError):
+    """No recording matches a replayed request"""
+
+
+class UpstreamTransport:
+    """Makes the upstream calls of the vision, nutrition and health-tip services.
+
+    Services describe each call as an upstream name, a JSON request that
+    identifies it (no credentials), and a ``perform`` callable that makes the
+    real call and returns a JSON-serializable response. Calls run on worker
+    threads, so implementations may block.
+    """
+
+    # Replaying transports answer without the upstream clients being configured
+    replays = False
+
+    def call(self, upstream: str, request: Dict, perform: Callable[[], Any]) -> Any:
+        raise NotImplementedError
+
+
+class LiveTransport(UpstreamTransport):
+    def call(self, upstream: str, request: Dict, perform: Callable[[], Any]) -> Any:
+        return perform()
+
+
+class RecordingTransport(UpstreamTransport):
+    """Makes live calls and appends each exchange, with its latency, to a cassette"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def call(self, upstream: str, request: Dict, perform: Callable[[], Any]) -> Any:
+        record = {"upstream": upstream, "key": request_key(upstream, request), "request": request}
+        start = time.perf_counter()
+        try:
+            response = perform()
+            record["response"] = response
+            return response
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            record["recorded_at"] = datetime.now().isoformat()
+            self._append(record)
+
+    def _append(self, record: Dict):
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+class ReplayTransport(UpstreamTransport):
+    """Answers upstream calls from a cassette, never touching the network.
+
+    Recordings of the same request are served in recorded order and then
+    start over, so a replayed run sees the same sequence of answers as the
+    recorded one. Recorded failures are raised again as ``UpstreamError``;
+    requests without a recording raise ``ReplayMiss``. Either way the
+    service takes its usual fallback path.
+    """
+
+    replays = True
+
+    def __init__(self, path: str, latency: str = UPSTREAM_REPLAY_LATENCY):
+        self.path = path
+        self.latency_ms = None if latency == "recorded" else float(latency)
+        self.recordings: Dict[str, List[Dict]] = {}
+        # Calls served per "upstream:hit" or "upstream:miss", for benchmark reports
+        self.outcomes: Dict[str, int] = {}
+        self._next: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short while recording
+                        continue
+                    self.recordings.setdefault(record["key"], []).append(record)
+        except FileNotFoundError:
+            print(f"Upstream cassette {self.path} not found; every replayed call will fall back")
+
+    def call(self, upstream: str, request: Dict, perform: Callable[[], Any]) -> Any:
+        key = request_key(upstream, request)
+        recordings = self.recordings.get(key)
+        if not recordings:
+            self._count(upstream, "miss")
+            raise ReplayMiss(f"No recorded {upstream} response for this request")
+        with self._lock:
+            position = self._next.get(key, 0)
+            self._next[key] = (position + 1) % len(recordings)
+        record = recordings[position]
+        self._count(upstream, "hit")
+        delay_ms = record.get("latency_ms", 0) if self.latency_ms is None else self.latency_ms
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        if "error" in record:
+            raise UpstreamError(record["error"])
+        return record["response"]
+
+    def _count(self, upstream: str, outcome: str):
+        UPSTREAM_REPLAYS.labels(upstream, outcome).inc()
+        name = f"{upstream}:{outcome}"
+        with self._lock:
+            self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+
+def upstream_transport(data_dir: str = "data", mode: str = UPSTREAM_MODE) -> UpstreamTransport:
+    """The transport configured by UPSTREAM_MODE and UPSTREAM_CASSETTE"""
+    if mode not in UPSTREAM_MODES:
+        raise ValueError(f"Unknown UPSTREAM_MODE {mode!r}; choose from {', '.join(UPSTREAM_MODES)}")
+    path = UPSTREAM_CASSETTE or os.path.join(data_dir, "upstream_cassette.ndjson")
+    if mode == "record":
+        return RecordingTransport(path)
+    if mode == "replay":
+        return ReplayTransport(path)
+    return LiveTransport()
@@ -1,35 +1,124 @@
-import json
 import os
-from datetime import datetime, date
-from typing import Dict, List, Optional
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from models.user_models import (
     UserProfile, NotificationSettings, HealthPreferences, PrivacySettings,
     DailyGoal, CreateDailyGoal, UpdateDailyGoal, UpdateNotificationSettings,
     UpdateHealthPreferences, UpdatePrivacySettings, GoalType
 )
+from services.storage import StorageBackend, JSONFileStorage, EntryDocument
+from services.metrics import timed
+from services.user_shards import USER_SHARD_SIZE, SHARD_INDEX_DOCUMENT, ShardDirectory, shard_document
+from services.goal_history import GOAL_HISTORY_DIR, GoalHistoryStore, goal_snapshot
+from functools import partial
 import uuid
 
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value).date()
+
+
+def goals_day(profile: Dict) -> date:
+    """Day a stored profile's goal progress belongs to"""
+    return _as_date(profile.get("goals_date") or profile["updated_at"])
+
+
+def has_goal_progress(profile: Dict) -> bool:
+    return any(goal["current"] or goal.get("is_achieved") for goal in profile.get("daily_goals", ()))
+
+
 class UserService:
-    def __init__(self, data_dir: str = "data"):
+    # Single-file layout from before sharding; only read until it is migrated
+    USERS_DOCUMENT = "users.json"
+
+    def __init__(self, data_dir: str = "data", storage: Optional[StorageBackend] = None,
+                 shard_size: int = USER_SHARD_SIZE, goal_history: Optional[GoalHistoryStore] = None):
         self.data_dir = data_dir
-        os.makedirs(data_dir, exist_ok=True)
-        self.users_file = os.path.join(data_dir, "users.json")
+        self.storage = storage or JSONFileStorage(data_dir)
+        self.goal_history = goal_history or GoalHistoryStore(os.path.join(data_dir, GOAL_HISTORY_DIR))
+        self.users_file = os.path.join(data_dir, self.USERS_DOCUMENT)
         self.drinks_file = os.path.join(data_dir, "drinks.json")
+        self.shard_size = shard_size
+        self._unit_of_work = None
         self._load_data()
 
     def _load_data(self):
-        """Load user data from file"""
-        try:
-            with open(self.users_file, 'r') as f:
-                self.users_data = json.load(f)
-        except FileNotFoundError:
-            self.users_data = {}
-
-    def _save_data(self):
-        """Save user data to file"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users_data, f, indent=2, default=str)
+        """Load user data from storage, one shard at a time"""
+        index = self.storage.load(SHARD_INDEX_DOCUMENT)
+        self.shards = ShardDirectory(index)
+        self.shard_users: Dict[str, Set[str]] = {}
+        self.users_data = {}
+        self._dirty_shards: Set[str] = set()
+        self._index_dirty = not index
+        if index:
+            for shard in self.shards.shards():
+                for user_id, profile in self.storage.iter_entries(shard_document(shard)):
+                    self.users_data[user_id] = profile
+                    self.shard_users.setdefault(shard, set()).add(user_id)
+            return
+        # Not migrated yet: shard the single file in memory; the first save writes every shard
+        for user_id, profile in self.storage.iter_entries(self.USERS_DOCUMENT):
+            self.users_data[user_id] = profile
+            self._place(user_id)
+        self._dirty_shards = set(self.shards.shards())
+
+    def _place(self, user_id: str):
+        """Add a user to its shard, splitting the shard while it is over size"""
+        shard = self.shards.shard_for(user_id)
+        members = self.shard_users.setdefault(shard, set())
+        members.add(user_id)
+        self._dirty_shards.add(shard)
+        while len(members) > self.shard_size:
+            sibling, kept, moved = self.shards.split(shard, list(members))
+            self.shard_users[shard], self.shard_users[sibling] = set(kept), set(moved)
+            self._dirty_shards.update((shard, sibling))
+            self._index_dirty = True
+            # Only the larger half can still be over size
+            shard = shard if len(kept) >= len(moved) else sibling
+            members = self.shard_users[shard]
+
+    def _iter_shard(self, shard: str):
+        for user_id in sorted(self.shard_users.get(shard, ())):
+            yield user_id, self.users_data[user_id]
+
+    @timed("users.save_data")
+    def _save_data(self, user_id: Optional[str] = None):
+        """Save the shard holding the user, deferring to the open unit of work if any"""
+        if user_id is not None:
+            self._dirty_shards.add(self.shards.shard_for(user_id))
+        # One user per line, so reporting scans can stream each shard
+        documents = {shard_document(shard): EntryDocument(partial(self._iter_shard, shard))
+                     for shard in sorted(self._dirty_shards)}
+        if self._index_dirty:
+            documents[SHARD_INDEX_DOCUMENT] = self.shards.to_dict()
+        if self._unit_of_work is not None:
+            for name, document in documents.items():
+                self._unit_of_work.stage(name, document)
+        else:
+            self.storage.save_many(documents)
+        self._dirty_shards = set()
+        self._index_dirty = False
 
+    def save_all(self):
+        """Rewrite every shard and the shard index"""
+        self._dirty_shards = set(self.shards.shards())
+        self._index_dirty = True
+        self._save_data()
+
+    @classmethod
+    def iter_stored_users(cls, storage: StorageBackend) -> Iterator[Tuple[str, Dict]]:
+        """Stream (user_id, profile) pairs from storage, one shard at a time"""
+        index = storage.load(SHARD_INDEX_DOCUMENT)
+        if not index:
+            yield from storage.iter_entries(cls.USERS_DOCUMENT)
+            return
+        for shard in ShardDirectory(index).shards():
+            yield from storage.iter_entries(shard_document(shard))
+
+    @timed("users.get_or_create_user")
     def get_or_create_user(self, user_id: str = "default") -> UserProfile:
         """Get user profile or create default one"""
         if user_id not in self.users_data:
@@ -68,15 +157,23 @@ class UserService:
             user_profile = UserProfile(
                 user_id=user_id,
                 daily_goals=default_goals,
+                goals_date=now.date(),
                 created_at=now,
                 updated_at=now
             )
             self.users_data[user_id] = user_profile.dict()
-            self._save_data()
+            self._place(user_id)
+            self._save_data(user_id)
         
         user_data = self.users_data[user_id]
         return UserProfile(**user_data)
 
+    def find_user(self, user_id: str) -> Optional[UserProfile]:
+        """Stored profile of a user, or None; unlike get_or_create_user it never writes"""
+        user_data = self.users_data.get(user_id)
+        return UserProfile(**user_data) if user_data is not None else None
+
+    @timed("users.update_notifications")
     def update_notifications(self, user_id: str, settings: UpdateNotificationSettings) -> NotificationSettings:
         """Update notification settings"""
         user = self.get_or_create_user(user_id)
@@ -88,10 +185,11 @@ class UserService:
         
         user.updated_at = datetime.now()
         self.users_data[user_id] = user.dict()
-        self._save_data()
+        self._save_data(user_id)
         
         return user.notifications
 
+    @timed("users.update_health_preferences")
     def update_health_preferences(self, user_id: str, preferences: UpdateHealthPreferences) -> HealthPreferences:
         """Update health preferences"""
         user = self.get_or_create_user(user_id)
@@ -108,10 +206,11 @@ class UserService:
         
         user.updated_at = datetime.now()
         self.users_data[user_id] = user.dict()
-        self._save_data()
+        self._save_data(user_id)
         
         return user.health_preferences
 
+    @timed("users.update_privacy_settings")
     def update_privacy_settings(self, user_id: str, settings: UpdatePrivacySettings) -> PrivacySettings:
         """Update privacy settings"""
         user = self.get_or_create_user(user_id)
@@ -123,13 +222,15 @@ class UserService:
         
         user.updated_at = datetime.now()
         self.users_data[user_id] = user.dict()
-        self._save_data()
+        self._save_data(user_id)
         
         return user.privacy_settings
 
+    @timed("users.create_daily_goal")
     def create_daily_goal(self, user_id: str, goal_data: CreateDailyGoal) -> DailyGoal:
         """Create a new daily goal"""
         user = self.get_or_create_user(user_id)
+        self._reset_daily_goals_if_new_day(user)
         
         new_goal = DailyGoal(
             id=str(uuid.uuid4()),
@@ -144,13 +245,15 @@ class UserService:
         user.daily_goals.append(new_goal)
         user.updated_at = datetime.now()
         self.users_data[user_id] = user.dict()
-        self._save_data()
+        self._save_data(user_id)
         
         return new_goal
 
+    @timed("users.update_daily_goal")
     def update_daily_goal(self, user_id: str, goal_id: str, goal_update: UpdateDailyGoal) -> DailyGoal:
         """Update an existing daily goal"""
         user = self.get_or_create_user(user_id)
+        self._reset_daily_goals_if_new_day(user)
         
         goal_index = next((i for i, g in enumerate(user.daily_goals) if g.id == goal_id), None)
         if goal_index is None:
@@ -163,25 +266,29 @@ class UserService:
             setattr(goal, key, value)
         
         # Check if goal is achieved
-        goal.is_achieved = goal.current >= goal.target
+        now = datetime.now()
+        self._mark_achieved(goal, now)
         
-        user.updated_at = datetime.now()
+        user.updated_at = now
         self.users_data[user_id] = user.dict()
-        self._save_data()
+        self._save_data(user_id)
         
         return goal
 
+    @timed("users.get_daily_goals")
     def get_daily_goals(self, user_id: str) -> List[DailyGoal]:
         """Get all daily goals for user"""
         user = self.get_or_create_user(user_id)
         return user.daily_goals
 
+    @timed("users.update_goals_from_drink")
     def update_goals_from_drink(self, user_id: str, nutrition_data: Dict):
         """Update daily goals based on consumed drink"""
         user = self.get_or_create_user(user_id)
         
         # Reset daily goals if it's a new day
         self._reset_daily_goals_if_new_day(user)
+        now = datetime.now()
         
         # Update each goal based on nutrition data
         for goal in user.daily_goals:
@@ -197,23 +304,79 @@ class UserService:
                 goal.current += nutrition_data.get('sodium_mg', 0)
             
             # Check if goal is achieved
-            goal.is_achieved = goal.current >= goal.target
+            self._mark_achieved(goal, now)
         
-        user.updated_at = datetime.now()
+        user.updated_at = now
         self.users_data[user_id] = user.dict()
-        self._save_data()
+        self._save_data(user_id)
         
         return user.daily_goals
 
     def _reset_daily_goals_if_new_day(self, user: UserProfile):
-        """Reset daily goal progress if it's a new day"""
+        """Reset daily goal progress if it's a new day, keeping the old day in goal history"""
         today = date.today()
-        last_update = user.updated_at.date() if isinstance(user.updated_at, datetime) else date.fromisoformat(user.updated_at)
+        last_day = user.goals_date or _as_date(user.updated_at)
         
-        if today > last_update:
+        if today > last_day:
+            goals = [goal.dict() for goal in user.daily_goals]
+            if any(goal["current"] or goal["is_achieved"] for goal in goals):
+                self.goal_history.append([(user.user_id, last_day, goal_snapshot(goals))])
             for goal in user.daily_goals:
                 goal.current = 0
                 goal.is_achieved = False
+                goal.achieved_at = None
+            user.goals_date = today
+
+    @staticmethod
+    def _mark_achieved(goal: DailyGoal, now: datetime):
+        achieved = goal.current >= goal.target
+        if achieved and not goal.is_achieved:
+            goal.achieved_at = now
+        elif not achieved:
+            goal.achieved_at = None
+        goal.is_achieved = achieved
+
+    def rollover_shards(self, today: date) -> List[str]:
+        """Shards holding users whose goal progress is from before today"""
+        shards = []
+        for shard in self.shards.shards():
+            for user_id in self.shard_users.get(shard, ()):
+                profile = self.users_data[user_id]
+                if goals_day(profile) < today and has_goal_progress(profile):
+                    shards.append(shard)
+                    break
+        return shards
+
+    def goal_snapshots(self, shards: List[str], today: date) -> List[Tuple[str, date, List[Dict]]]:
+        """Goal history records for the users of these shards due a rollover"""
+        records = []
+        for shard in shards:
+            for user_id in sorted(self.shard_users.get(shard, ())):
+                profile = self.users_data[user_id]
+                day = goals_day(profile)
+                if day < today and has_goal_progress(profile):
+                    records.append((user_id, day, goal_snapshot(profile["daily_goals"])))
+        return records
+
+    def reset_goals(self, user_ids: List[str], today: date) -> int:
+        """Zero the goal progress of users still on an earlier day; saved by ``commit_rollover``"""
+        reset = 0
+        for user_id in user_ids:
+            profile = self.users_data.get(user_id)
+            # Users who uploaded since their snapshot was taken rolled over on their own
+            if profile is None or goals_day(profile) >= today:
+                continue
+            profile["daily_goals"] = [
+                {**goal, "current": 0, "is_achieved": False, "achieved_at": None}
+                for goal in profile.get("daily_goals", ())
+            ]
+            profile["goals_date"] = today
+            self._dirty_shards.add(self.shards.shard_for(user_id))
+            reset += 1
+        return reset
+
+    def commit_rollover(self):
+        self._save_data()
 
     def _calculate_target_calories(self, health_prefs: HealthPreferences) -> int:
         """Calculate target daily calories using Mifflin-St Jeor equation"""
@@ -235,23 +398,91 @@ class UserService:
         multiplier = activity_multipliers.get(health_prefs.activity_level, 1.55)
         return int(bmr * multiplier)
 
-    def get_achievements(self, user_id: str) -> List[Dict]:
-        """Get user achievements based on goals"""
+    @timed("users.get_achievements")
+    def get_achievements(self, user_id: str, days: int = 1) -> List[Dict]:
+        """Get goals achieved over the last ``days`` days, newest first"""
         user = self.get_or_create_user(user_id)
+        current_day = user.goals_date or _as_date(user.updated_at)
         achievements = []
         
         for goal in user.daily_goals:
             if goal.is_achieved:
                 achievements.append({
+                    "goal_id": goal.id,
                     "goal_name": goal.name,
                     "target": goal.target,
                     "current": goal.current,
                     "unit": goal.unit,
-                    "achieved_at": datetime.now().isoformat()
+                    "date": current_day.isoformat(),
+                    # Goals achieved before achieved_at was recorded
+                    "achieved_at": (goal.achieved_at or user.updated_at).isoformat()
                 })
         
+        if days > 1:
+            history = self.goal_history.read(user_id, date.today() - timedelta(days=days - 1),
+                                              current_day - timedelta(days=1))
+            for day, goals in reversed(history.items()):
+                for goal in goals:
+                    if goal["achieved"]:
+                        achievements.append({
+                            "goal_id": goal["id"],
+                            "goal_name": goal["name"],
+                            "target": goal["target"],
+                            "current": goal["current"],
+                            "unit": goal["unit"],
+                            "date": day.isoformat(),
+                            "achieved_at": goal["achieved_at"]
+                        })
+        
         return achievements
 
+    @timed("users.get_goal_history")
+    def get_goal_history(self, user_id: str, start_date: date, end_date: date) -> List[Dict]:
+        """Final goal state of each past day with progress, oldest first"""
+        history = self.goal_history.read(user_id, start_date, end_date)
+        return [{"date": day.isoformat(), "goals": goals} for day, goals in history.items()]
+
+    @timed("users.get_goal_streaks")
+    def get_goal_streaks(self, user_id: str, days: int = 365) -> List[Dict]:
+        """Current and longest run of consecutive days each goal was achieved"""
+        user = self.get_or_create_user(user_id)
+        today = date.today()
+        history = self.goal_history.read(user_id, today - timedelta(days=days - 1), today - timedelta(days=1))
+        achieved: Dict[str, Set[date]] = {}
+        for day, goals in history.items():
+            for goal in goals:
+                if goal["achieved"]:
+                    achieved.setdefault(goal["id"], set()).add(day)
+        current_day = user.goals_date or _as_date(user.updated_at)
+        for goal in user.daily_goals:
+            if goal.is_achieved:
+                achieved.setdefault(goal.id, set()).add(current_day)
+
+        streaks = []
+        for goal in user.daily_goals:
+            goal_days = achieved.get(goal.id, set())
+            longest = run = 0
+            previous = None
+            for day in sorted(goal_days):
+                run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+                longest = max(longest, run)
+                previous = day
+            # Today still counts towards the streak until it is over
+            day = today if today in goal_days else today - timedelta(days=1)
+            current = 0
+            while day in goal_days:
+                current += 1
+                day -= timedelta(days=1)
+            streaks.append({
+                "goal_id": goal.id,
+                "goal_name": goal.name,
+                "current_streak": current,
+                "longest_streak": longest,
+                "achieved_days": len(goal_days),
+            })
+        return streaks
+
+    @timed("users.get_user_stats")
     def get_user_stats(self, user_id: str) -> Dict:
         """Get comprehensive user statistics"""
         user = self.get_or_create_user(user_id)
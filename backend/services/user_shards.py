@@ -0,0 +1,70 @@
+import hashlib
+import os
+from typing import Dict, List, Tuple
+
+# A shard splits in two once it holds more users than this, so the cost of
+# rewriting one shard stays the same however many users there are
+USER_SHARD_SIZE = int(os.getenv("USER_SHARD_SIZE", "256"))
+
+SHARDS_DIR = "users"
+SHARD_INDEX_DOCUMENT = f"{SHARDS_DIR}/index.json"
+
+
+def user_hash(user_id: str) -> int:
+    """Stable 64-bit hash of a user id (``hash()`` is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(user_id.encode(), digest_size=8).digest(), "little")
+
+
+def shard_document(shard: str) -> str:
+    return f"{SHARDS_DIR}/{shard}.json"
+
+
+class ShardDirectory:
+    """Extendible-hashing directory from user ids to shard files.
+
+    Each shard owns every user whose hash ends in the shard's bit prefix; its
+    depth says how many low bits that prefix has. Shards are named by their
+    prefix in hex, so when a shard splits the half that keeps the prefix keeps
+    the file name too. Only ``{prefix: depth}`` is persisted; the lookup
+    table, with one slot per value of the lowest ``global_depth`` bits, is
+    rebuilt on load.
+    """
+
+    def __init__(self, data: Dict = None):
+        shards = (data or {}).get("shards") or {"0": 0}
+        self.depths: Dict[str, int] = dict(shards)
+        self.global_depth = max(self.depths.values())
+        self.table: List[str] = [""] * (1 << self.global_depth)
+        for shard, depth in self.depths.items():
+            self._assign(int(shard, 16), depth, shard)
+
+    def to_dict(self) -> Dict:
+        return {"version": 1, "shards": dict(sorted(self.depths.items(), key=lambda item: int(item[0], 16)))}
+
+    def shard_for(self, user_id: str) -> str:
+        return self.table[user_hash(user_id) & ((1 << self.global_depth) - 1)]
+
+    def shards(self) -> List[str]:
+        """Shard names in a stable order"""
+        return sorted(self.depths, key=lambda shard: int(shard, 16))
+
+    def split(self, shard: str, user_ids: List[str]) -> Tuple[str, List[str], List[str]]:
+        """Split a shard on its next hash bit; returns the new shard and both halves' users"""
+        depth = self.depths[shard]
+        if depth == self.global_depth:
+            self.table = self.table + self.table
+            self.global_depth += 1
+        prefix = int(shard, 16)
+        sibling = format(prefix | (1 << depth), "x")
+        self.depths[shard] = self.depths[sibling] = depth + 1
+        self._assign(int(sibling, 16), depth + 1, sibling)
+
+        kept, moved = [], []
+        for user_id in user_ids:
+            (moved if user_hash(user_id) >> depth & 1 else kept).append(user_id)
+        return sibling, kept, moved
+
+    def _assign(self, prefix: int, depth: int, shard: str):
+        for slot in range(prefix, len(self.table), 1 << depth):
+            self.table[slot] = shard
+
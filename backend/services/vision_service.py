@@ -1,19 +1,45 @@
+import asyncio
+import hashlib
 import os
-from typing import Optional
+import random
+import threading
+import importlib.util
+from typing import Optional, Tuple
 import io
+from services.metrics import FALLBACK_USAGE, VISION_RESULTS, track_stage
+from services.drink_classifier import DrinkClassifier
+from services.upstream_transport import LiveTransport, UpstreamTransport, fallback_rng
 
-# Conditional import for Google Cloud Vision
+# Google Cloud Vision is imported on first use; the SDK takes seconds to load
 try:
-    from google.cloud import vision
-    VISION_AVAILABLE = True
+    VISION_AVAILABLE = importlib.util.find_spec("google.cloud.vision") is not None
 except ImportError:
     VISION_AVAILABLE = False
-    vision = None
+vision = None
+
+_VISION_FALLBACKS = FALLBACK_USAGE.labels("vision")
+
+# Local classifications at or above this confidence skip Cloud Vision
+VISION_LOCAL_THRESHOLD = float(os.getenv("VISION_LOCAL_THRESHOLD", "0.8"))
+
+def _load_vision_sdk():
+    global vision
+    if vision is None:
+        from google.cloud import vision as vision_sdk
+        vision = vision_sdk
+    return vision
 
 class VisionService:
-    def __init__(self):
-        self.client = None
-        self._setup_client()
+    def __init__(self, classifier: Optional[DrinkClassifier] = None,
+                 local_threshold: float = VISION_LOCAL_THRESHOLD,
+                 transport: Optional[UpstreamTransport] = None, rng: Optional[random.Random] = None):
+        self.classifier = classifier or DrinkClassifier()
+        self.local_threshold = local_threshold
+        self.transport = transport or LiveTransport()
+        self.rng = rng or fallback_rng("vision")
+        self._client = None
+        self._client_ready = False
+        self._client_lock = threading.Lock()
         
         # Fallback drink dictionary for when vision API fails
         self.fallback_drinks = [
@@ -21,54 +47,104 @@ class VisionService:
             "Coffee", "Tea", "Energy Drink", "Sports Drink", "Beer"
         ]
     
+    @property
+    def client(self):
+        """Google Cloud Vision client, created on first use"""
+        if not self._client_ready:
+            self._setup_client()
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+        self._client_ready = True
+
+    def _is_configured(self) -> bool:
+        return VISION_AVAILABLE and bool(os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or os.getenv('GOOGLE_CLOUD_PROJECT'))
+
     def _setup_client(self):
         """Initialize Google Cloud Vision client"""
-        try:
-            # Check if Vision API is available and credentials exist
-            if VISION_AVAILABLE and (os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or os.getenv('GOOGLE_CLOUD_PROJECT')):
-                self.client = vision.ImageAnnotatorClient()
-        except Exception as e:
-            print(f"Vision API setup failed: {e}")
-            self.client = None
+        with self._client_lock:
+            if self._client_ready:
+                return
+            try:
+                # Check if Vision API is available and credentials exist
+                if self._is_configured():
+                    self._client = _load_vision_sdk().ImageAnnotatorClient()
+            except Exception as e:
+                print(f"Vision API setup failed: {e}")
+                self._client = None
+            self._client_ready = True
     
     async def identify_drink(self, image_data: bytes) -> str:
         """
         Identify drink from image using Google Cloud Vision API
         Falls back to mock prediction if API is unavailable
         """
-        if self.client:
+        drink_name, _ = await self.classify_drink(image_data)
+        return drink_name
+
+    async def classify_drink(self, image_data: bytes) -> Tuple[str, float]:
+        """
+        Identify drink and return (name, confidence)
+        The local classifier answers first; Cloud Vision is only called
+        when the local confidence is below the threshold
+        """
+        local = None
+        try:
+            with track_stage("vision_local"):
+                local = await asyncio.to_thread(self.classifier.classify, image_data)
+        except Exception as e:
+            print(f"Local drink classifier failed: {e}")
+        if local and local[1] >= self.local_threshold:
+            VISION_RESULTS.labels("local").inc()
+            return local
+
+        if self.transport.replays or self.client:
             try:
-                return await self._identify_with_vision_api(image_data)
+                drink_name, confidence = await self._identify_with_vision_api(image_data)
+                if drink_name:
+                    VISION_RESULTS.labels("cloud").inc()
+                    return drink_name, confidence
             except Exception as e:
                 print(f"Vision API failed: {e}")
-                return self._fallback_prediction()
-        else:
-            return self._fallback_prediction()
+
+        # A low-confidence local answer still beats a guess
+        if local:
+            VISION_RESULTS.labels("local").inc()
+            return local
+        VISION_RESULTS.labels("fallback").inc()
+        return self._fallback_prediction(), 0.0
     
-    async def _identify_with_vision_api(self, image_data: bytes) -> str:
+    async def _identify_with_vision_api(self, image_data: bytes) -> Tuple[Optional[str], float]:
         """Use Google Cloud Vision API to identify drink"""
-        image = vision.Image(content=image_data)
-        
-        # Detect text in the image
-        text_response = self.client.text_detection(image=image)
-        texts = text_response.text_annotations
-        
-        # Detect labels in the image
-        label_response = self.client.label_detection(image=image)
-        labels = label_response.label_annotations
-        
-        # Process text detection results
-        detected_text = ""
-        if texts:
-            detected_text = texts[0].description.lower()
+        request = {"image_sha256": hashlib.sha256(image_data).hexdigest(),
+                   "features": ["TEXT_DETECTION", "LABEL_DETECTION"]}
+
+        def annotate():
+            image = vision.Image(content=image_data)
+            texts = self.client.text_detection(image=image).text_annotations
+            # Detect labels in the image
+            labels = self.client.label_detection(image=image).label_annotations
+            return {
+                "text": texts[0].description if texts else "",
+                "labels": [{"description": label.description, "score": float(label.score)} for label in labels],
+            }
+
+        # The SDK calls block, so they run off the event loop
+        result = await asyncio.to_thread(self.transport.call, "vision", request, annotate)
+        labels = result["labels"]
         
-        # Process label detection results
-        detected_labels = [label.description.lower() for label in labels]
+        # Process text and label detection results
+        detected_text = result["text"].lower()
+        detected_labels = [label["description"].lower() for label in labels]
         
         # Try to identify drink from text and labels
         drink_name = self._extract_drink_name(detected_text, detected_labels)
         
-        return drink_name if drink_name else self._fallback_prediction()
+        # Label scores are Vision's own confidence that a label applies
+        confidence = max((label["score"] for label in labels), default=0.0)
+        return drink_name, float(confidence)
     
     def _extract_drink_name(self, text: str, labels: list) -> Optional[str]:
         """Extract drink name from detected text and labels"""
@@ -117,9 +193,13 @@ class VisionService:
     
     def _fallback_prediction(self) -> str:
         """Return a mock prediction when Vision API is unavailable"""
-        import random
-        return random.choice(self.fallback_drinks)
+        _VISION_FALLBACKS.inc()
+        return self.rng.choice(self.fallback_drinks)
     
     def is_available(self) -> bool:
-        """Check if Vision API is available"""
-        return self.client is not None
\ No newline at end of file
+        """Check if Vision API is available, without creating the client"""
+        if self.classifier.is_available():
+            return True
+        if self._client_ready:
+            return self._client is not None
+        return self._is_configured()
\ No newline at end of file
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from services.live_updates import LiveStreamResponse, LiveUpdates, TooManyConnections
+
+
+def live_updates(max_per_user: int = 5) -> LiveUpdates:
+    return LiveUpdates(lambda user_id: {"totals": {}, "goals": [], "insights": []}, max_per_user=max_per_user)
+
+
+def scope(spec_version: str):
+    return {"type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}}
+
+
+async def disconnected():
+    return {"type": "http.disconnect"}
+
+
+async def drop_on_start(message):
+    # What a server's send does once the client has gone
+    raise OSError("client disconnected")
+
+
+async def never_sent(message):
+    raise AssertionError(f"nothing should be sent after the disconnect, got {message['type']}")
+
+
+@pytest.mark.parametrize("spec_version, send", [("2.4", drop_on_start), ("2.0", never_sent)])
+def test_disconnect_before_first_event_releases_slot(spec_version, send):
+    async def run():
+        updates = live_updates()
+        response = LiveStreamResponse(updates, updates.subscribe("user-1"))
+        assert updates.connections == 1
+        try:
+            await response(scope(spec_version), disconnected, send)
+        except Exception:
+            pass
+        return updates
+
+    updates = asyncio.run(run())
+    assert updates.connections == 0
+    assert "user-1" not in updates._subscribers
+
+
+def test_early_disconnects_do_not_exhaust_user_limit():
+    async def run():
+        updates = live_updates(max_per_user=2)
+        for _ in range(5):
+            response = LiveStreamResponse(updates, updates.subscribe("user-1"))
+            try:
+                await response(scope("2.4"), disconnected, drop_on_start)
+            except Exception:
+                pass
+        return updates
+
+    updates = asyncio.run(run())
+    assert updates.connections == 0
+
+
+def test_user_limit_still_applies_to_open_streams():
+    async def run():
+        updates = live_updates(max_per_user=1)
+        updates.subscribe("user-1")
+        with pytest.raises(TooManyConnections):
+            updates.subscribe("user-1")
+
+    asyncio.run(run())